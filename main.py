@@ -1,3 +1,6 @@
+import time
+_MODULE_LOAD_STARTED = time.perf_counter()
+
 import os
 import requests
 import uuid
@@ -6,7 +9,7 @@ from dotenv import load_dotenv
 # Import asyncio for managing the streaming task
 import asyncio
 from fastapi import FastAPI, Request, UploadFile, File, HTTPException, Form, WebSocket, WebSocketDisconnect, Response
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
@@ -15,33 +18,84 @@ from pathlib import Path
 import re
 from typing import Any
 
-# Import the AssemblyAI library
-import assemblyai as aai
-try:
-    from assemblyai.streaming.v3 import (
-    BeginEvent,
-    StreamingClient,
-    StreamingClientOptions,
-    StreamingError,
-    StreamingEvents,
-    StreamingParameters,
-    StreamingSessionParameters,
-    TerminationEvent,
-    TurnEvent
-)
-    WEBSOCKETS_ENABLED = True
-except (ImportError, ModuleNotFoundError):
-    print("⚠️  WARNING: `assemblyai.streaming.v3` module not found. Real-time transcription will be disabled.")
-    WEBSOCKETS_ENABLED = False
+import importlib
+import importlib.util
+import threading
+from contextlib import contextmanager
+
+# --- Startup Profile & Lazy Imports ---
+# Provider SDKs are expensive to import (google.generativeai alone is ~0.5s),
+# so they are bound to LazyModule proxies: the real import happens on first
+# attribute access, or earlier on the background warm-up thread started after
+# startup. Import costs and startup phases are recorded in STARTUP_PROFILE and
+# reported under "startup" in /metrics.
+STARTUP_PROFILE: dict[str, Any] = {
+    "module_load_ms": None,
+    "time_to_listen_ms": None,
+    "phases": {},
+    "imports": {},
+    "warmup_ms": None,
+}
+
+@contextmanager
+def startup_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_PROFILE["phases"][name] = round((time.perf_counter() - started) * 1000, 1)
+
+class LazyModule:
+    """Proxy that imports `name` on first attribute access and records the import cost."""
+
+    def __init__(self, name: str, on_load=None):
+        self.name = name
+        self._on_load = on_load
+        self._module = None
+        self._error: ImportError | None = None
+        self._lock = threading.RLock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self):
+        if self._module is not None:
+            return self._module
+        with self._lock:
+            if self._module is None:
+                if self._error is not None:
+                    raise self._error
+                started = time.perf_counter()
+                try:
+                    module = importlib.import_module(self.name)
+                except ImportError as e:
+                    self._error = e
+                    raise
+                STARTUP_PROFILE["imports"][self.name] = round((time.perf_counter() - started) * 1000, 1)
+                if self._on_load:
+                    self._on_load(module)
+                self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+# AssemblyAI (batch + streaming v3) and Google Generative AI; keys are applied on import
+aai = LazyModule("assemblyai", on_load=lambda module: _configure_assemblyai(module))
+aai_streaming = LazyModule("assemblyai.streaming.v3")
+genai = LazyModule("google.generativeai", on_load=lambda module: _configure_genai(module))
+
+def streaming_available() -> bool:
+    """True when `assemblyai.streaming.v3` can be imported (real-time transcription)."""
+    try:
+        aai_streaming.load()
+        return True
+    except ImportError:
+        return False
 
-# Import the Google Generative AI library
-import google.generativeai as genai
 # Optional encryption support for storing user-provided API keys
-try:
-    from cryptography.fernet import Fernet
-    ENCRYPTION_AVAILABLE = True
-except Exception:
-    ENCRYPTION_AVAILABLE = False
+ENCRYPTION_AVAILABLE = importlib.util.find_spec("cryptography") is not None
 import json
 
 # --- Pydantic Models for Request Validation ---
@@ -81,12 +135,27 @@ ENV_DEFAULTS = {
     "WEATHER_API_KEY": os.getenv("WEATHER_API_KEY"),
 }
 
+# Derived Fernet instances, keyed by their source (SECRET_KEY or the key file)
+_fernet_cache: dict[str, Any] = {}
+_fernet_lock = threading.Lock()
+
 def _get_fernet() -> "Fernet | None":
     if not ENCRYPTION_AVAILABLE:
         return None
+    # Prefer SECRET_KEY from environment if provided (Render-friendly)
+    secret = os.getenv("SECRET_KEY")
+    source = f"secret:{secret}" if secret else "file"
+    with _fernet_lock:
+        if source not in _fernet_cache:
+            fernet = _build_fernet(secret)
+            if fernet is None:
+                return None
+            _fernet_cache[source] = fernet
+        return _fernet_cache[source]
+
+def _build_fernet(secret: str | None) -> "Fernet | None":
     try:
-        # Prefer SECRET_KEY from environment if provided (Render-friendly)
-        secret = os.getenv("SECRET_KEY")
+        from cryptography.fernet import Fernet
         if secret:
             # Derive a 32-byte urlsafe base64 key from SECRET_KEY
             import hashlib, base64
@@ -150,37 +219,89 @@ def get_api_key(service: str) -> str | None:
         return USER_API_KEYS[env_key]
     return ENV_DEFAULTS.get(env_key)
 
-# Load any previously-saved user keys from disk (if present)
-_load_user_keys_from_disk()
-
-# Configure SDKs that need immediate setup using get_api_key
-MURF_API_KEY = get_api_key("MURF")
-if not MURF_API_KEY:
-    print("⚠️  WARNING: MURF_API_KEY not found (UI/.env/config). The /generate-audio endpoint may not work.")
-
-ASSEMBLYAI_API_KEY = get_api_key("ASSEMBLYAI")
-if not ASSEMBLYAI_API_KEY:
-    print("⚠️  WARNING: ASSEMBLYAI_API_KEY not found (UI/.env/config). The /transcribe endpoint may not work.")
-else:
-    aai.settings.api_key = ASSEMBLYAI_API_KEY
-
-GEMINI_API_KEY = get_api_key("GEMINI")
-if not GEMINI_API_KEY:
-    print("⚠️  WARNING: GEMINI_API_KEY not found (UI/.env/config). The /llm/query endpoint may not work.")
-else:
-    genai.configure(api_key=GEMINI_API_KEY)
-
-TAVILY_API_KEY = get_api_key("TAVILY")
-if not TAVILY_API_KEY:
-    print("⚠️  WARNING: TAVILY_API_KEY not found (UI/.env/config). Web search skill will be disabled.")
-
-SPOTIFY_CLIENT_ID = get_api_key("SPOTIFY_CLIENT_ID")
-SPOTIFY_CLIENT_SECRET = get_api_key("SPOTIFY_CLIENT_SECRET")
-if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET:
-    print("⚠️  WARNING: SPOTIFY_CLIENT_ID/SECRET not found (UI/.env/config). Spotify search may be disabled.")
+# --- Credentials ---
+# Provider keys live in module globals that call sites read directly. They are
+# resolved together by apply_credentials() at startup and on every
+# /config/api-keys save, and swapped in one step under a lock. Subsystems that
+# hold state derived from a key (SDK config, OAuth tokens, circuit breakers)
+# register in CREDENTIAL_LISTENERS and are reset only when their keys change.
+MURF_API_KEY = ASSEMBLYAI_API_KEY = GEMINI_API_KEY = TAVILY_API_KEY = WEATHER_API_KEY = None
+SPOTIFY_CLIENT_ID = SPOTIFY_CLIENT_SECRET = None
+
+# Global name -> get_api_key() service
+PROVIDER_KEYS = {
+    "MURF_API_KEY": "MURF",
+    "ASSEMBLYAI_API_KEY": "ASSEMBLYAI",
+    "GEMINI_API_KEY": "GEMINI",
+    "TAVILY_API_KEY": "TAVILY",
+    "WEATHER_API_KEY": "WEATHER",
+    "SPOTIFY_CLIENT_ID": "SPOTIFY_CLIENT_ID",
+    "SPOTIFY_CLIENT_SECRET": "SPOTIFY_CLIENT_SECRET",
+}
+MISSING_KEY_WARNINGS = {
+    "MURF_API_KEY": "The /generate-audio endpoint may not work.",
+    "ASSEMBLYAI_API_KEY": "The /transcribe endpoint may not work.",
+    "GEMINI_API_KEY": "The /llm/query endpoint may not work.",
+    "TAVILY_API_KEY": "Web search skill will be disabled.",
+    "WEATHER_API_KEY": "Weather skill will be disabled.",
+}
+# name -> callable(changed: set[str]), run after each swap that changed something
+CREDENTIAL_LISTENERS: dict[str, Any] = {}
+CREDENTIAL_STATS: dict[str, Any] = {"generation": 0, "last_swap_at": None, "last_changed": []}
+_credentials_lock = threading.Lock()
+
+def apply_credentials(warn: bool = False) -> set[str]:
+    """Resolve every provider key, swap the globals at once and notify listeners of what changed."""
+    with _credentials_lock:
+        resolved = {name: get_api_key(service) for name, service in PROVIDER_KEYS.items()}
+        changed = {name for name, value in resolved.items() if globals()[name] != value}
+        if changed:
+            globals().update(resolved)
+            CREDENTIAL_STATS["generation"] += 1
+            CREDENTIAL_STATS["last_swap_at"] = datetime.utcnow().isoformat() + "Z"
+            CREDENTIAL_STATS["last_changed"] = sorted(changed)
+    if warn:
+        for name, hint in MISSING_KEY_WARNINGS.items():
+            if not resolved[name]:
+                print(f"⚠️  WARNING: {name} not found (UI/.env/config). {hint}")
+        if not resolved["SPOTIFY_CLIENT_ID"] or not resolved["SPOTIFY_CLIENT_SECRET"]:
+            print("⚠️  WARNING: SPOTIFY_CLIENT_ID/SECRET not found (UI/.env/config). Spotify search may be disabled.")
+    if changed:
+        print(f"🔑 Credentials updated: {', '.join(sorted(changed))}")
+        for name, listener in CREDENTIAL_LISTENERS.items():
+            try:
+                listener(changed)
+            except Exception as e:
+                print(f"⚠️  Credential listener '{name}' failed: {e}")
+    return changed
+
+def load_config():
+    """Load saved user keys (decrypting uploads/config.json) and resolve provider keys."""
+    # Load any previously-saved user keys from disk (if present)
+    _load_user_keys_from_disk()
+    apply_credentials(warn=True)
+
+# Configure SDKs that need key setup; runs when each SDK is first imported
+def _configure_assemblyai(module):
+    key = get_api_key("ASSEMBLYAI")
+    if key:
+        module.settings.api_key = key
+
+def _configure_genai(module):
+    key = get_api_key("GEMINI")
+    if key:
+        module.configure(api_key=key)
+
+def configure_loaded_sdks(changed: set[str] | None = None):
+    """Push current keys into SDKs that are already imported; the others pick them up on import."""
+    for proxy, configure, key in ((aai, _configure_assemblyai, "ASSEMBLYAI_API_KEY"), (genai, _configure_genai, "GEMINI_API_KEY")):
+        if proxy.loaded and (changed is None or key in changed):
+            try:
+                configure(proxy.load())
+            except Exception as e:
+                print(f"⚠️  Could not configure {proxy.name}: {e}")
 
-# In-memory cache for Spotify token
-_spotify_token_cache = {"access_token": None, "expires_at": 0}
+CREDENTIAL_LISTENERS["sdks"] = configure_loaded_sdks
 
 # System instruction for AVA (assistant identity and style)
 AVA_SYSTEM_PROMPT = (
@@ -233,6 +354,11 @@ AVA_SYSTEM_PROMPT = (
 # Create FastAPI app
 app = FastAPI()
 
+@app.on_event("startup")
+async def _load_startup_config():
+    with startup_phase("config"):
+        load_config()
+
 # In-memory storage for chat sessions
 # Format: { "session_id": [ { "role": "user/model", "parts": ["..."] }, ... ] }
 chat_sessions = {}
@@ -253,26 +379,844 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Provider Executors ---
+# Blocking SDK/HTTP calls (AssemblyAI, Gemini, Murf, Tavily, Spotify) never run on
+# the event loop. Each provider gets its own bounded pool so one slow provider
+# cannot starve the others; size with AVA_<PROVIDER>_CONCURRENCY.
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+# Records which ProviderExecutor a worker thread belongs to
+_executor_thread = threading.local()
+
+class ProviderExecutor:
+    """Bounded thread pool for one provider's blocking calls, with queue-wait stats."""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"ava-{name}",
+                                        initializer=self._mark_worker)
+        self._lock = threading.Lock()
+        self._waits_ms: deque = deque(maxlen=256)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.max_wait_ms = 0.0
+
+    def _mark_worker(self):
+        _executor_thread.owner = self
+
+    def owns_current_thread(self) -> bool:
+        # By identity, not thread name: "ava-gemini_stream_0" must not count as a gemini worker
+        return getattr(_executor_thread, "owner", None) is self
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        enqueued = time.perf_counter()
+        with self._lock:
+            self.submitted += 1
+
+        def _run():
+            wait_ms = (time.perf_counter() - enqueued) * 1000
+            with self._lock:
+                self.running += 1
+                self._waits_ms.append(wait_ms)
+                self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                with self._lock:
+                    self.failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        return self._pool.submit(_run)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits_ms)
+            queued = self.submitted - self.completed - self.running
+            return {
+                "max_workers": self.max_workers,
+                "running": self.running,
+                "queued": max(queued, 0),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "queue_wait_ms": {
+                    "p50": round(_percentile(waits, 0.50), 2),
+                    "p95": round(_percentile(waits, 0.95), 2),
+                    "max": round(self.max_wait_ms, 2),
+                },
+            }
+
+def _executor_size(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(f"AVA_{name.upper()}_CONCURRENCY", default)))
+    except ValueError:
+        return default
+
+PROVIDER_EXECUTORS: dict[str, ProviderExecutor] = {
+    name: ProviderExecutor(name, _executor_size(name, default))
+    for name, default in (
+        ("assemblyai", 4),
+        ("gemini", 8),
+        ("murf", 4),
+        ("tavily", 4),
+        ("spotify", 4),
+        ("weather", 4),
+        # Streamed replies hold a worker for the whole turn, so they get their
+        # own pools and cannot starve short REST calls to the same provider
+        ("gemini_stream", 8),
+        ("murf_stream", 4),
+    )
+}
+
+async def run_blocking(provider: str, fn, *args, **kwargs):
+    """Await a blocking call on the provider's executor instead of the event loop."""
+    return await asyncio.wrap_future(PROVIDER_EXECUTORS[provider].submit(fn, *args, **kwargs))
+
+def call_in_executor(provider: str, fn, *args, **kwargs):
+    """Blocking variant for worker threads (SDK callbacks, LLM streaming threads)."""
+    executor = PROVIDER_EXECUTORS[provider]
+    if executor.owns_current_thread():
+        return fn(*args, **kwargs)
+    return executor.submit(fn, *args, **kwargs).result()
+
+# --- Event-loop stall guard (debug mode) ---
+# With AVA_DEBUG=1 a watchdog thread notices when the loop has not run for
+# AVA_LOOP_STALL_MS and records the loop thread's stack at that moment.
+AVA_DEBUG = os.getenv("AVA_DEBUG", "").strip().lower() in ("1", "true", "yes")
+LOOP_STALL_THRESHOLD_MS = float(os.getenv("AVA_LOOP_STALL_MS", "100"))
+LOOP_STALLS: deque = deque(maxlen=50)
+
+def _start_loop_stall_monitor(loop: asyncio.AbstractEventLoop):
+    import sys
+    import traceback
+    interval = 0.02
+    threshold = LOOP_STALL_THRESHOLD_MS / 1000
+    loop_thread_id = threading.get_ident()
+    state = {"beat": time.perf_counter()}
+
+    async def _heartbeat():
+        while True:
+            state["beat"] = time.perf_counter()
+            await asyncio.sleep(interval)
+
+    def _watch():
+        current = None  # (beat, record) for the stall in progress
+        while True:
+            time.sleep(interval)
+            beat = state["beat"]
+            blocked = time.perf_counter() - beat - interval
+            if blocked < threshold:
+                current = None
+                continue
+            if current and current[0] == beat:
+                current[1]["blocked_ms"] = round(blocked * 1000, 1)
+                continue
+            frame = sys._current_frames().get(loop_thread_id)
+            record = {
+                "at": datetime.now().isoformat(timespec="seconds"),
+                "blocked_ms": round(blocked * 1000, 1),
+                "stack": "".join(traceback.format_stack(frame)) if frame else "",
+            }
+            LOOP_STALLS.append(record)
+            current = (beat, record)
+            print(f"🐢 Event loop stalled >{LOOP_STALL_THRESHOLD_MS:.0f}ms; blocking stack:\n{record['stack']}", flush=True)
+
+    loop.create_task(_heartbeat())
+    threading.Thread(target=_watch, name="ava-loop-watchdog", daemon=True).start()
+    print(f"🩺 Loop stall monitor active (threshold {LOOP_STALL_THRESHOLD_MS:.0f}ms)")
+
+@app.on_event("startup")
+async def _start_debug_monitors():
+    if AVA_DEBUG:
+        _start_loop_stall_monitor(asyncio.get_running_loop())
+
+# --- Metrics ---
+# Each subsystem registers a callable returning a JSON-able dict; GET /metrics
+# returns them all keyed by name.
+METRICS_SECTIONS: dict[str, Any] = {
+    "executors": lambda: {name: ex.stats() for name, ex in PROVIDER_EXECUTORS.items()},
+}
+if AVA_DEBUG:
+    METRICS_SECTIONS["loop_stalls"] = lambda: {
+        "threshold_ms": LOOP_STALL_THRESHOLD_MS,
+        "recent": list(LOOP_STALLS),
+    }
+
+# --- Upload Limits ---
+# Recordings posted to /llm/query and /tts/echo are spooled by the multipart
+# parser: kept in memory up to AVA_UPLOAD_SPOOL_KB, then rolled over to a temp
+# file, so memory per request stays bounded. Bodies over AVA_MAX_UPLOAD_MB are
+# rejected from Content-Length before reading, or as soon as the streamed
+# body crosses the limit. Size and transfer time are recorded per request.
+from fastapi import APIRouter
+from fastapi.routing import APIRoute
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+MAX_UPLOAD_BYTES = int(float(os.getenv("AVA_MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+UPLOAD_SPOOL_BYTES = int(os.getenv("AVA_UPLOAD_SPOOL_KB", "1024")) * 1024
+UPLOAD_LIMITED_PATHS = ("/llm/query", "/tts/echo")
+
+class UploadSpoolParser(MultiPartParser):
+    max_file_size = UPLOAD_SPOOL_BYTES
+
+class UploadRequest(Request):
+    """Request whose multipart form is parsed with UploadSpoolParser; other bodies parse as usual."""
+
+    async def _get_form(self, *, max_files: int | float = 1000, max_fields: int | float = 1000):
+        if self._form is None and self.headers.get("content-type", "").startswith("multipart/form-data"):
+            parser = UploadSpoolParser(self.headers, self.stream(), max_files=max_files, max_fields=max_fields)
+            try:
+                self._form = await parser.parse()
+            except MultiPartException as exc:
+                raise HTTPException(status_code=400, detail=exc.message)
+        return await super()._get_form(max_files=max_files, max_fields=max_fields)
+
+class UploadRoute(APIRoute):
+    """Route class for the upload endpoints, so only they use the upload spool size."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def upload_handler(request: Request) -> Response:
+            return await handler(UploadRequest(request.scope, request.receive))
+
+        return upload_handler
+
+# Endpoints declared on this router are included into the app after their definitions
+upload_router = APIRouter(route_class=UploadRoute)
+UPLOAD_STATS = {"requests": 0, "rejected": 0, "bytes": 0, "recent": deque(maxlen=50)}
+
+class UploadLimitMiddleware:
+    """ASGI middleware enforcing MAX_UPLOAD_BYTES on upload endpoints while the body streams in."""
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def _reject(self, scope, receive, send, size: int | None):
+        UPLOAD_STATS["rejected"] += 1
+        print(f"🚫 Upload rejected: {size if size is not None else '>'+str(self.max_bytes)} bytes exceeds {self.max_bytes}")
+        await JSONResponse(
+            content={"error": f"Upload too large (max {self.max_bytes // (1024 * 1024)} MB).", "fallback": True},
+            status_code=413,
+        )(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].rstrip("/") not in UPLOAD_LIMITED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        UPLOAD_STATS["requests"] += 1
+        length = dict(scope["headers"]).get(b"content-length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            await self._reject(scope, receive, send, int(length))
+            return
+
+        info = {"path": scope["path"], "bytes": 0, "seconds": 0.0}
+        scope.setdefault("state", {})["upload"] = info
+        started = time.perf_counter()
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                info["bytes"] += len(message.get("body", b""))
+                if info["bytes"] > self.max_bytes:
+                    UPLOAD_STATS["rejected"] += 1
+                    # FastAPI re-raises HTTPException from body parsing, producing a 413 response
+                    raise HTTPException(status_code=413, detail=f"Upload too large (max {self.max_bytes // (1024 * 1024)} MB).")
+                if not message.get("more_body", False):
+                    info["seconds"] = round(time.perf_counter() - started, 3)
+                    UPLOAD_STATS["bytes"] += info["bytes"]
+                    UPLOAD_STATS["recent"].append(dict(info))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(UploadLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES)
+
+METRICS_SECTIONS["uploads"] = lambda: {
+    "max_bytes": MAX_UPLOAD_BYTES,
+    "spool_bytes": UPLOAD_SPOOL_BYTES,
+    "requests": UPLOAD_STATS["requests"],
+    "rejected": UPLOAD_STATS["rejected"],
+    "bytes": UPLOAD_STATS["bytes"],
+    "recent": list(UPLOAD_STATS["recent"]),
+}
+
+# --- Admission Control ---
+# Each stage (/ws sessions, LLM streams, Murf streams, Tavily calls) has a
+# global and a per-client concurrency limit. Work over the limit waits in a
+# short queue that admits clients round-robin, so one client's burst cannot
+# starve the others. A request whose estimated wait exceeds its deadline is
+# shed at once with a retry-after hint instead of timing out later: REST
+# answers 503 with Retry-After, /ws sends a "busy" control message.
+import math
+from contextlib import asynccontextmanager
+
+ADMISSION_ENABLED = os.getenv("AVA_ADMISSION", "1").strip().lower() not in ("0", "false", "no")
+# Longest retry-after hint handed to clients (seconds)
+ADMISSION_MAX_RETRY_S = 60
+
+class AdmissionBusy(Exception):
+    """Raised when a stage sheds work; retry_after is a hint in whole seconds."""
+
+    def __init__(self, stage: str, reason: str, retry_after: int):
+        super().__init__(f"{stage} busy ({reason}); retry after {retry_after}s")
+        self.stage = stage
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def payload(self) -> dict:
+        return {"type": "busy", "stage": self.stage, "reason": self.reason, "retry_after": self.retry_after}
+
+class AdmissionTicket:
+    __slots__ = ("client", "deadline", "enqueued", "granted_at", "state", "wake")
+
+    def __init__(self, client: str, deadline: float, wake=None):
+        self.client = client
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.granted_at = 0.0
+        self.state = "waiting"  # waiting | granted | expired | released
+        self.wake = wake
+
+class AdmissionStage:
+    """Concurrency limits and a fair, deadline-aware queue for one pipeline stage.
+
+    limit/per_client of 0 mean unlimited. Waits are estimated from the mean of
+    recent hold times (typical_s until enough samples exist)."""
+
+    def __init__(self, name: str, limit: int, per_client: int, queue_size: int, max_wait_s: float, typical_s: float):
+        self.name = name
+        self.limit = limit
+        self.per_client = per_client
+        self.queue_size = queue_size
+        self.max_wait_s = max_wait_s
+        self.typical_s = typical_s
+        self._lock = threading.Lock()
+        self._active: dict[str, int] = {}
+        self._queues: dict[str, deque] = {}  # client -> waiting tickets; key order is the rotation
+        self._holds: deque = deque(maxlen=64)
+        self._waits_ms: deque = deque(maxlen=256)
+        self.active = 0
+        self.queued = 0
+        self.max_queue_depth = 0
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "deadline": 0, "expired": 0}
+
+    def _fits(self, client: str) -> bool:
+        return (not self.limit or self.active < self.limit) and \
+            (not self.per_client or self._active.get(client, 0) < self.per_client)
+
+    def _hold_s(self) -> float:
+        return sum(self._holds) / len(self._holds) if len(self._holds) >= 5 else self.typical_s
+
+    def _estimate_wait(self, client: str) -> float:
+        hold = self._hold_s()
+        waits = [hold * (self.queued + 1) / self.limit] if self.limit else []
+        if self.per_client:
+            waits.append(hold * (len(self._queues.get(client, ())) + 1) / self.per_client)
+        return max(waits, default=0.0)
+
+    def _grant(self, ticket: AdmissionTicket):
+        ticket.state = "granted"
+        ticket.granted_at = time.monotonic()
+        self.active += 1
+        self._active[ticket.client] = self._active.get(ticket.client, 0) + 1
+        self.admitted += 1
+        self._waits_ms.append((ticket.granted_at - ticket.enqueued) * 1000)
+
+    def _dispatch(self):
+        """Hand free slots to queued clients in rotation; caller holds the lock."""
+        now = time.monotonic()
+        progressed = True
+        while self._queues and progressed and (not self.limit or self.active < self.limit):
+            progressed = False
+            for client in list(self._queues):
+                queue = self._queues[client]
+                while queue and queue[0].deadline <= now:
+                    expired = queue.popleft()
+                    expired.state = "expired"
+                    self.queued -= 1
+                    self.shed["expired"] += 1
+                    expired.wake()
+                if queue and self._fits(client):
+                    ticket = queue.popleft()
+                    self.queued -= 1
+                    self._grant(ticket)
+                    ticket.wake()
+                    progressed = True
+                # Served (or empty) clients move to the back of the rotation
+                del self._queues[client]
+                if queue:
+                    self._queues[client] = queue
+                if self.limit and self.active >= self.limit:
+                    break
+
+    def _shed(self, reason: str, wait_s: float) -> AdmissionBusy:
+        self.shed[reason] += 1
+        retry_after = min(ADMISSION_MAX_RETRY_S, max(1, math.ceil(wait_s)))
+        print(f"🚦 [{self.name}] shed ({reason}); retry after {retry_after}s")
+        return AdmissionBusy(self.name, reason, retry_after)
+
+    def _enqueue(self, client: str, deadline_s: float | None, wake) -> AdmissionTicket:
+        wait_budget = self.max_wait_s if deadline_s is None else deadline_s
+        ticket = AdmissionTicket(client, time.monotonic() + wait_budget, wake)
+        with self._lock:
+            if not self._queues and self._fits(client):
+                self._grant(ticket)
+                return ticket
+            estimate = self._estimate_wait(client)
+            if self.queued >= self.queue_size:
+                raise self._shed("queue_full", estimate)
+            if estimate > wait_budget:
+                raise self._shed("deadline", estimate)
+            self._queues.setdefault(client, deque()).append(ticket)
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+            # A slot may be free while only other clients' heads were blocked
+            self._dispatch()
+            return ticket
+
+    def _settle(self, ticket: AdmissionTicket, cancelled: bool = False) -> bool:
+        """After a wait ends: True if granted; otherwise leave the queue (counted as expired unless cancelled)."""
+        with self._lock:
+            if ticket.state == "waiting":
+                queue = self._queues.get(ticket.client)
+                if queue is not None:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._queues[ticket.client]
+                self.queued -= 1
+                ticket.state = "expired"
+                if not cancelled:
+                    self.shed["expired"] += 1
+            return ticket.state == "granted"
+
+    def _expired(self) -> AdmissionBusy:
+        retry_after = min(ADMISSION_MAX_RETRY_S, max(1, math.ceil(self._hold_s())))
+        print(f"🚦 [{self.name}] shed (expired); retry after {retry_after}s")
+        return AdmissionBusy(self.name, "expired", retry_after)
+
+    def acquire_blocking(self, client: str, deadline_s: float | None = None) -> AdmissionTicket:
+        """Wait for a slot from a worker thread; raises AdmissionBusy when shed."""
+        event = threading.Event()
+        ticket = self._enqueue(client, deadline_s, event.set)
+        if ticket.state != "granted":
+            event.wait(max(0.0, ticket.deadline - time.monotonic()))
+            if not self._settle(ticket):
+                raise self._expired()
+        return ticket
+
+    async def acquire(self, client: str, deadline_s: float | None = None) -> AdmissionTicket:
+        """Wait for a slot on the event loop; raises AdmissionBusy when shed."""
+        loop = asyncio.get_running_loop()
+        granted = asyncio.Event()
+        ticket = self._enqueue(client, deadline_s, lambda: loop.call_soon_threadsafe(granted.set))
+        if ticket.state == "granted":
+            return ticket
+        try:
+            await asyncio.wait_for(granted.wait(), max(0.0, ticket.deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if self._settle(ticket, cancelled=True):
+                self.release(ticket)
+            raise
+        if not self._settle(ticket):
+            raise self._expired()
+        return ticket
+
+    def release(self, ticket: AdmissionTicket | None):
+        if ticket is None or ticket.state != "granted":
+            return
+        with self._lock:
+            ticket.state = "released"
+            self._holds.append(time.monotonic() - ticket.granted_at)
+            self.active -= 1
+            remaining = self._active.get(ticket.client, 1) - 1
+            if remaining:
+                self._active[ticket.client] = remaining
+            else:
+                self._active.pop(ticket.client, None)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, client: str, deadline_s: float | None = None):
+        ticket = self.acquire_blocking(client, deadline_s)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def slot_async(self, client: str, deadline_s: float | None = None):
+        ticket = await self.acquire(client, deadline_s)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits_ms)
+            return {
+                "limit": self.limit,
+                "per_client": self.per_client,
+                "queue_size": self.queue_size,
+                "max_wait_ms": round(self.max_wait_s * 1000),
+                "active": self.active,
+                "clients": len(self._active),
+                "queue_depth": self.queued,
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "shed": dict(self.shed, total=sum(self.shed.values())),
+                "hold_s": round(self._hold_s(), 2),
+                "queue_wait_ms": {
+                    "p50": round(_percentile(waits, 0.50), 2),
+                    "p95": round(_percentile(waits, 0.95), 2),
+                    "max": round(waits[-1], 2) if waits else 0.0,
+                },
+            }
+
+def _admission_stage(name: str, limit: int, per_client: int, max_wait_ms: int, typical_s: float) -> AdmissionStage:
+    def _env(kind: str, default):
+        try:
+            return type(default)(os.getenv(f"AVA_ADMIT_{name.upper()}_{kind}", default))
+        except ValueError:
+            return default
+    limit = max(0, _env("MAX", limit)) if ADMISSION_ENABLED else 0
+    per_client = max(0, _env("PER_CLIENT", per_client)) if ADMISSION_ENABLED else 0
+    return AdmissionStage(
+        name, limit, per_client,
+        queue_size=max(0, _env("QUEUE", limit)),
+        max_wait_s=max(0, _env("WAIT_MS", max_wait_ms)) / 1000,
+        typical_s=typical_s,
+    )
+
+# The provider stages default to their executor size, so overload queues here
+# (fairly, with a deadline) rather than in the executor
+ADMISSION: dict[str, AdmissionStage] = {
+    name: _admission_stage(name, limit, per_client, max_wait_ms, typical_s)
+    for name, limit, per_client, max_wait_ms, typical_s in (
+        ("ws", 32, 4, 2000, 120.0),
+        ("llm", PROVIDER_EXECUTORS["gemini"].max_workers, 2, 3000, 6.0),
+        ("llm_stream", PROVIDER_EXECUTORS["gemini_stream"].max_workers, 2, 3000, 8.0),
+        ("murf", PROVIDER_EXECUTORS["murf"].max_workers, 2, 2000, 8.0),
+        ("murf_stream", PROVIDER_EXECUTORS["murf_stream"].max_workers, 2, 2000, 10.0),
+        ("tavily", PROVIDER_EXECUTORS["tavily"].max_workers, 2, 4000, 3.0),
+    )
+}
+
+def client_key(conn) -> str:
+    """Client identity for per-client limits: first X-Forwarded-For hop behind a proxy, else the peer address."""
+    forwarded = conn.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return conn.client.host if conn.client else "unknown"
+
+def busy_response(exc: AdmissionBusy, **content) -> JSONResponse:
+    """503 with Retry-After; content lets endpoints keep their usual response fields."""
+    return JSONResponse(
+        content={"error": f"AVA is busy right now; please retry in {exc.retry_after}s.", "fallback": True,
+                 **content, "busy": exc.payload()},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+METRICS_SECTIONS["admission"] = lambda: {name: stage.stats() for name, stage in ADMISSION.items()}
+
+# --- Static Asset Pipeline ---
+# Files under static/ are fingerprinted by content hash (script.js ->
+# script.<hash>.js). Hashed URLs are served with a one-year immutable
+# Cache-Control and the hash as a strong ETag, so repeat visits never
+# revalidate; the template and sw.js reference them via asset_url(). Text
+# assets get gzip (and brotli, when the module is installed) variants built
+# once in memory and picked per request from Accept-Encoding. Original URLs
+# keep working but are served with no-cache so they revalidate.
+import gzip
+import hashlib
+import mimetypes
+from starlette.datastructures import Headers
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+STATIC_DIR = BASE_DIR / "static"
+ASSET_HASH_LENGTH = 10
+ASSET_COMPRESS_MIN_BYTES = 512
+ASSET_COMPRESSIBLE_TYPES = (".js", ".css", ".json", ".svg", ".html", ".txt", ".map", ".webmanifest")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# App shell the service worker precaches under hashed URLs
+SW_PRECACHE_ASSETS = ("script.js", "audio-worklet-processor.js", "tts-playback-processor.js", "manifest.json")
+
+ASSET_MANIFEST: dict[str, Any] = {"version": None, "by_path": {}, "by_hashed": {}}
+ASSET_STATS = {"hashed": 0, "plain": 0, "not_modified": 0, "br": 0, "gzip": 0, "identity": 0}
+
+def _hashed_name(rel: str, digest: str) -> str:
+    stem, dot, ext = rel.rpartition(".")
+    if not dot or "/" in ext:
+        return f"{rel}.{digest}"
+    return f"{stem}.{digest}.{ext}"
+
+def precompress(data: bytes) -> dict[str, bytes]:
+    """Max-level gzip (and brotli) encodings of data, keeping only those that save bytes."""
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if BROTLI_AVAILABLE:
+        variants["br"] = brotli.compress(data, quality=11)
+    return {enc: body for enc, body in variants.items() if len(body) < len(data) * 0.9}
+
+def _accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        if token and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(token.strip().lower())
+    return accepted
+
+def pick_encoding(variants: dict[str, bytes], accept_encoding: str) -> str | None:
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding in ("br", "gzip"):
+        if encoding in variants and encoding in accepted:
+            return encoding
+    return None
+
+def encoded_etag(etag: str, encoding: str | None) -> str:
+    """Each encoding is a distinct representation, so it gets its own strong ETag."""
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+def build_asset_manifest() -> dict:
+    """Hash every file under static/ and precompress the text ones; replaces ASSET_MANIFEST."""
+    started = time.perf_counter()
+    by_path, by_hashed = {}, {}
+    raw_total = gzip_total = br_total = 0
+    for full in sorted(STATIC_DIR.rglob("*")):
+        if not full.is_file():
+            continue
+        rel = full.relative_to(STATIC_DIR).as_posix()
+        try:
+            data = full.read_bytes()
+        except OSError as e:
+            print(f"⚠️ Asset skipped ({rel}): {e}")
+            continue
+        digest = hashlib.sha256(data).hexdigest()[:ASSET_HASH_LENGTH]
+        hashed = _hashed_name(rel, digest)
+        entry = {
+            "path": rel,
+            "hashed": hashed,
+            "url": f"/static/{hashed}",
+            "file": str(full),
+            "etag": f'"{digest}"',
+            "size": len(data),
+            "media_type": mimetypes.guess_type(rel)[0] or "application/octet-stream",
+            "variants": {},
+        }
+        if full.suffix.lower() in ASSET_COMPRESSIBLE_TYPES and len(data) >= ASSET_COMPRESS_MIN_BYTES:
+            entry["variants"] = precompress(data)
+            raw_total += len(data)
+            gzip_total += len(entry["variants"].get("gzip", data))
+            br_total += len(entry["variants"].get("br", entry["variants"].get("gzip", data)))
+        by_path[rel] = entry
+        by_hashed[hashed] = entry
+    version = hashlib.sha256("".join(e["etag"] for e in by_path.values()).encode()).hexdigest()[:ASSET_HASH_LENGTH]
+    ASSET_MANIFEST.update(version=version, by_path=by_path, by_hashed=by_hashed)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"📦 Static assets fingerprinted: {len(by_path)} files, version {version}, "
+          f"text {raw_total}B -> gzip {gzip_total}B / best {br_total}B ({elapsed:.0f}ms)")
+    return ASSET_MANIFEST
+
+def asset_manifest() -> dict:
+    if ASSET_MANIFEST["version"] is None:
+        build_asset_manifest()
+    return ASSET_MANIFEST
+
+def asset_url(url: str) -> str:
+    """Map '/static/<path>' to its fingerprinted URL; unknown paths are returned unchanged."""
+    if not url.startswith("/static/"):
+        return url
+    entry = asset_manifest()["by_path"].get(url[len("/static/"):])
+    return entry["url"] if entry else url
+
+def asset_urls() -> dict[str, str]:
+    """Original -> fingerprinted URL map, exposed to client-side code as window.AVA_ASSETS."""
+    return {f"/static/{rel}": e["url"] for rel, e in asset_manifest()["by_path"].items()}
+
+class FingerprintedStaticFiles(StaticFiles):
+    """StaticFiles that serves manifest entries with content-hash ETags and precompressed bodies."""
+
+    async def get_response(self, path: str, scope) -> Response:
+        manifest = asset_manifest()
+        rel = path.replace(os.sep, "/")
+        entry = manifest["by_hashed"].get(rel)
+        immutable = entry is not None
+        if entry is None:
+            entry = manifest["by_path"].get(rel)
+        if entry is None or scope["method"] not in ("GET", "HEAD"):
+            response = await super().get_response(path, scope)
+            response.headers.setdefault("Cache-Control", "no-cache")
+            return response
+
+        ASSET_STATS["hashed" if immutable else "plain"] += 1
+        request_headers = Headers(scope=scope)
+        encoding = pick_encoding(entry["variants"], request_headers.get("accept-encoding", ""))
+        headers = {
+            "ETag": encoded_etag(entry["etag"], encoding),
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else "no-cache",
+        }
+        if entry["variants"]:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(headers["ETag"], request_headers.get("if-none-match", "")):
+            ASSET_STATS["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            ASSET_STATS[encoding] += 1
+            headers["Content-Encoding"] = encoding
+            return Response(content=entry["variants"][encoding], media_type=entry["media_type"], headers=headers)
+        ASSET_STATS["identity"] += 1
+        return FileResponse(entry["file"], media_type=entry["media_type"], headers=headers)
+
+@app.on_event("startup")
+async def _build_static_assets():
+    with startup_phase("assets"):
+        await asyncio.to_thread(build_asset_manifest)
+
+METRICS_SECTIONS["assets"] = lambda: {
+    "version": ASSET_MANIFEST["version"],
+    "files": len(ASSET_MANIFEST["by_path"]),
+    "brotli": BROTLI_AVAILABLE,
+    "precompressed": {
+        rel: {"size": e["size"], **{enc: len(body) for enc, body in e["variants"].items()}}
+        for rel, e in ASSET_MANIFEST["by_path"].items() if e["variants"]
+    },
+    "served": dict(ASSET_STATS),
+}
+
 # --- Setup ---
 # Mount static files and templates using absolute paths for Render
-app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
+app.mount("/static", FingerprintedStaticFiles(directory=str(STATIC_DIR)), name="static")
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+templates.env.globals.update(asset_url=asset_url, asset_urls=asset_urls)
+
+# --- Root Page Cache ---
+# index.html does not depend on the request, so it is rendered once per
+# (template mtime, asset manifest version) together with its precompressed
+# bodies. GET / then only compares validators and picks a body; editing the
+# template or rebuilding the asset manifest re-renders on the next request.
+from email.utils import formatdate, parsedate_to_datetime
+
+ROOT_TEMPLATE = "index.html"
+ROOT_PAGE: dict[str, Any] = {"entry": None}
+ROOT_PAGE_STATS = {"renders": 0, "hits": 0, "not_modified": 0, "br": 0, "gzip": 0, "identity": 0, "render_ms": 0.0}
+_root_page_lock = threading.Lock()
+
+def _root_page_key() -> tuple:
+    return (BASE_DIR / "templates" / ROOT_TEMPLATE).stat().st_mtime_ns, asset_manifest()["version"]
+
+def _render_root_page(key: tuple) -> dict:
+    """Render and compress the root page for key; concurrent misses share one render."""
+    with _root_page_lock:
+        entry = ROOT_PAGE["entry"]
+        if entry is not None and entry["key"] == key:
+            return entry
+        started = time.perf_counter()
+        body = templates.get_template(ROOT_TEMPLATE).render().encode("utf-8")
+        mtime = key[0] / 1e9
+        entry = {
+            "key": key,
+            "body": body,
+            "variants": precompress(body),
+            "etag": f'"{hashlib.sha256(body).hexdigest()[:16]}"',
+            "mtime": int(mtime),
+            "last_modified": formatdate(mtime, usegmt=True),
+        }
+        ROOT_PAGE["entry"] = entry
+        ROOT_PAGE_STATS["renders"] += 1
+        ROOT_PAGE_STATS["render_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        print(f"🧾 Root page rendered: {len(body)}B, "
+              f"{', '.join(f'{enc} {len(v)}B' for enc, v in entry['variants'].items()) or 'uncompressed'} "
+              f"({ROOT_PAGE_STATS['render_ms']:.0f}ms)")
+        return entry
+
+def _not_modified_since(header: str | None, mtime: int) -> bool:
+    if not header:
+        return False
+    try:
+        return parsedate_to_datetime(header).timestamp() >= mtime
+    except (TypeError, ValueError):
+        return False
+
+METRICS_SECTIONS["root_page"] = lambda: {
+    "cached": ROOT_PAGE["entry"] is not None,
+    "size": len(ROOT_PAGE["entry"]["body"]) if ROOT_PAGE["entry"] else None,
+    **ROOT_PAGE_STATS,
+}
 
 # --- Persistence (SQLite via SQLAlchemy, minimal) ---
-try:
+# SQLAlchemy (~0.3s to import) and the schema are set up by init_db(), which
+# the warm-up thread runs right after startup. DB helpers take a Session as
+# their first argument; async code runs them through db_run(), which uses the
+# aiosqlite async engine when available (AsyncSession.run_sync) and otherwise
+# the bounded "db" executor, so SQLite I/O never runs on the event loop. Sync
+# callers use run_db(). Both engines share DB_POOL_SIZE connections in WAL mode.
+SQLALCHEMY_AVAILABLE = importlib.util.find_spec("sqlalchemy") is not None
+DB_ASYNC_ENABLED = os.getenv("AVA_DB_ASYNC", "1").strip().lower() not in ("0", "false", "no")
+
+DB_PATH = UPLOAD_DIR / "ava_data.db"
+DB_POOL_SIZE = _executor_size("db", 4)
+DB_POOL_OVERFLOW = 2
+DB_BUSY_TIMEOUT_MS = 5000
+DB_READY = threading.Event()
+_db_init_lock = threading.Lock()
+engine = SessionLocal = Base = SessionModel = MessageModel = SessionArchiveModel = UsageModel = func = None
+async_engine = AsyncSessionLocal = None
+PROVIDER_EXECUTORS["db"] = ProviderExecutor("db", DB_POOL_SIZE)
+DB_STATS = {"calls": 0, "errors": 0, "latency_ms": deque(maxlen=200)}
+
+def _sqlite_pragmas(dbapi_connection, _record):
+    # WAL lets readers proceed while a write commits; busy_timeout waits out short lock contention
+    cursor = dbapi_connection.cursor()
+    # Only takes effect on a new file; existing DBs are converted by one full VACUUM (see maintenance)
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+def init_db():
+    """Import SQLAlchemy, declare the models, create missing tables and the async engine."""
+    global engine, SessionLocal, Base, SessionModel, MessageModel, SessionArchiveModel, UsageModel, func, async_engine, AsyncSessionLocal
     from sqlalchemy import (
-        create_engine, Column, String, Boolean, Text, DateTime, ForeignKey, func
+        create_engine, event, Column, String, Boolean, Text, DateTime, ForeignKey, Integer, Float, LargeBinary, func
     )
-    from sqlalchemy.orm import declarative_base, relationship, sessionmaker, Session
-    SQLALCHEMY_AVAILABLE = True
-except Exception:
-    SQLALCHEMY_AVAILABLE = False
+    from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 
-DB_PATH = UPLOAD_DIR / "ava_data.db"
-if SQLALCHEMY_AVAILABLE:
     engine = create_engine(
-        f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False}
+        f"sqlite:///{DB_PATH}",
+        connect_args={"check_same_thread": False},
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_POOL_OVERFLOW,
     )
+    event.listen(engine, "connect", _sqlite_pragmas)
     SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
     Base = declarative_base()
 
@@ -295,6 +1239,29 @@ if SQLALCHEMY_AVAILABLE:
         created_at = Column(DateTime, server_default=func.now())
         session = relationship("SessionModel", back_populates="messages")
 
+    class SessionArchiveModel(Base):
+        """Compacted messages of an archived/idle session: one zlib-compressed JSON list per session."""
+        __tablename__ = "session_archives"
+        session_id = Column(String, ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+        message_count = Column(Integer, default=0)
+        raw_bytes = Column(Integer, default=0)
+        last_message = Column(Text, nullable=True)
+        blob = Column(LargeBinary)
+        archived_at = Column(DateTime, server_default=func.now())
+
+    class UsageModel(Base):
+        """Usage counters of one turn; kept when its session is deleted or purged."""
+        __tablename__ = "usage_turns"
+        session_id = Column(String, primary_key=True)
+        turn_id = Column(String, primary_key=True)
+        llm_input_tokens = Column(Integer, default=0)
+        llm_output_tokens = Column(Integer, default=0)
+        tts_chars = Column(Integer, default=0)
+        stt_seconds = Column(Float, default=0.0)
+        tool_calls = Column(Integer, default=0)
+        started_at = Column(DateTime, server_default=func.now(), index=True)
+        updated_at = Column(DateTime, server_default=func.now())
+
     # Create tables if not present
     try:
         Base.metadata.create_all(engine)
@@ -302,176 +1269,367 @@ if SQLALCHEMY_AVAILABLE:
     except Exception as e:
         print("⚠️  Could not initialize SQLite DB:", e)
 
-    # Helper functions
-    def _db() -> Session:
-        return SessionLocal()
-
-    def ensure_session(session_id: str, *, title: str | None = None):
-        db = _db()
-        try:
-            s = db.get(SessionModel, session_id)
-            if not s:
-                s = SessionModel(id=session_id, title=title or None)
-                db.add(s)
-                db.commit()
-            return s
-        finally:
-            db.close()
-
-    def add_message(session_id: str, role: str, content: str):
-        db = _db()
+    if DB_ASYNC_ENABLED and importlib.util.find_spec("aiosqlite") is not None:
         try:
-            s = db.get(SessionModel, session_id)
-            if not s:
-                s = SessionModel(id=session_id)
-                db.add(s)
-            m = MessageModel(id=str(uuid.uuid4()), session_id=session_id, role=role, content=content)
-            db.add(m)
-            # Update updated_at
-            s.updated_at = func.now()
-            # Auto-title on first assistant message if missing
-            if not s.title:
-                # Use first user message truncated as title
-                first_user = db.query(MessageModel).filter_by(session_id=session_id, role="user").order_by(MessageModel.created_at.asc()).first()
-                if first_user and first_user.content:
-                    s.title = (first_user.content.strip()[:40]).strip()
-            db.commit()
-        finally:
-            db.close()
-
-    def get_history_for_gemini(session_id: str):
-        """Return messages mapped to Gemini chat history format."""
-        db = _db()
-        try:
-            msgs = (
-                db.query(MessageModel)
-                .filter(MessageModel.session_id == session_id)
-                .order_by(MessageModel.created_at.asc())
-                .all()
+            from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+            from sqlalchemy.pool import AsyncAdaptedQueuePool
+            # aiosqlite defaults to NullPool (a new connection per session); keep a sized pool instead
+            async_engine = create_async_engine(
+                f"sqlite+aiosqlite:///{DB_PATH}",
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_POOL_OVERFLOW,
             )
-            history = []
-            for m in msgs:
-                role = "user" if m.role == "user" else "model"
-                history.append({"role": role, "parts": [m.content or ""]})
-            return history
-        finally:
-            db.close()
+            event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+            AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+            print(f"🗄️  Async SQLite driver: aiosqlite (pool {DB_POOL_SIZE}+{DB_POOL_OVERFLOW})")
+        except Exception as e:
+            async_engine = AsyncSessionLocal = None
+            print(f"⚠️  aiosqlite unavailable, DB calls use the executor: {e}")
+    else:
+        print(f"🗄️  DB calls run on the db executor ({DB_POOL_SIZE} threads)")
+
+def ensure_db() -> bool:
+    """Run init_db() once (thread-safe); returns whether the DB layer is usable."""
+    if not DB_READY.is_set():
+        with _db_init_lock:
+            if not DB_READY.is_set():
+                with startup_phase("db_init"):
+                    try:
+                        init_db()
+                    except Exception as e:
+                        print("⚠️  Could not initialize SQLite DB:", e)
+                DB_READY.set()
+    return SessionLocal is not None
+
+def _db() -> "Session":
+    if not ensure_db():
+        raise RuntimeError("SQLite database is unavailable")
+    return SessionLocal()
+
+def run_db(fn, *args, **kwargs):
+    """Call fn(db, *args, **kwargs) with a fresh Session on the current thread."""
+    with _db() as db:
+        return fn(db, *args, **kwargs)
+
+async def db_run(fn, *args, **kwargs):
+    """Await fn(db, *args, **kwargs) without blocking the event loop."""
+    if not DB_READY.is_set():
+        await run_blocking("db", ensure_db)
+    started = time.perf_counter()
+    DB_STATS["calls"] += 1
+    try:
+        if AsyncSessionLocal is not None:
+            async with AsyncSessionLocal() as session:
+                return await session.run_sync(fn, *args, **kwargs)
+        return await run_blocking("db", run_db, fn, *args, **kwargs)
+    except Exception:
+        DB_STATS["errors"] += 1
+        raise
+    finally:
+        DB_STATS["latency_ms"].append((time.perf_counter() - started) * 1000)
+
+def _db_metrics() -> dict:
+    latencies = sorted(DB_STATS["latency_ms"])
+    return {
+        "driver": "aiosqlite" if AsyncSessionLocal is not None else "executor",
+        "ready": DB_READY.is_set(),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_POOL_OVERFLOW,
+        "calls": DB_STATS["calls"],
+        "errors": DB_STATS["errors"],
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 0.5), 2),
+            "p95": round(_percentile(latencies, 0.95), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+        },
+    }
 
-    def list_sessions(pinned: int | None = None, q: str | None = None):
-        db = _db()
+METRICS_SECTIONS["db"] = _db_metrics
+
+# --- Chat History Cache ---
+# Gemini-format history per session, loaded from SQLite once and then kept
+# current by add_message (append after commit), so a turn costs O(new
+# messages). Entries are evicted LRU once the estimated size exceeds
+# AVA_HISTORY_CACHE_MB. A load that races with a write to the same session is
+# returned to its caller but not cached.
+from collections import OrderedDict
+
+HISTORY_CACHE_MAX_BYTES = int(float(os.getenv("AVA_HISTORY_CACHE_MB", "32")) * 1024 * 1024)
+HISTORY_ENTRY_OVERHEAD = 120  # rough per-message cost of the dict/list wrappers
+
+class HistoryCache:
+    """LRU of session_id -> Gemini history list, bounded by estimated bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[list, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Write tracking while loads are in flight, so a stale load is not cached
+        self._seq = 0
+        self._active_loads = 0
+        self._written: dict[str, int] = {}
+        self.stats = {"hits": 0, "misses": 0, "appends": 0, "invalidations": 0, "evictions": 0}
+
+    @staticmethod
+    def _size(history: list) -> int:
+        return sum(len(p) for m in history for p in m["parts"]) + HISTORY_ENTRY_OVERHEAD * len(history)
+
+    def _store(self, session_id: str, history: list):
+        old = self._entries.pop(session_id, None)
+        if old:
+            self._bytes -= old[1]
+        size = self._size(history)
+        if size > self.max_bytes:
+            return
+        self._entries[session_id] = (history, size)
+        self._bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.stats["evictions"] += 1
+
+    def _mark_written(self, session_id: str):
+        self._seq += 1
+        if self._active_loads:
+            self._written[session_id] = self._seq
+
+    def get(self, session_id: str) -> list | None:
+        """Cached history (a copy) or None; only hits are counted."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(session_id)
+            self.stats["hits"] += 1
+            return list(entry[0])
+
+    def get_or_load(self, session_id: str, loader) -> list:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+                self.stats["hits"] += 1
+                return list(entry[0])
+            self.stats["misses"] += 1
+            token = self._seq
+            self._active_loads += 1
+        history = None
         try:
-            query = db.query(SessionModel)
-            if pinned is not None:
-                query = query.filter(SessionModel.pinned == bool(pinned))
-            if q:
-                like = f"%{q}%"
-                query = query.filter((SessionModel.title.ilike(like)))
-            rows = query.order_by(SessionModel.pinned.desc(), SessionModel.updated_at.desc().nullslast(), SessionModel.created_at.desc()).all()
-            # Get last message snippet per session (optional)
-            result = []
-            for s in rows:
-                last_msg = (
-                    db.query(MessageModel)
-                    .filter(MessageModel.session_id == s.id)
-                    .order_by(MessageModel.created_at.desc())
-                    .first()
-                )
-                result.append({
-                    "id": s.id,
-                    "title": s.title,
-                    "pinned": bool(s.pinned),
-                    "archived": bool(s.archived),
-                    "created_at": str(s.created_at) if s.created_at else None,
-                    "updated_at": str(s.updated_at) if s.updated_at else None,
-                    "last_message": (last_msg.content[:80] if last_msg and last_msg.content else None)
-                })
-            return result
+            history = loader()
+            return list(history)
         finally:
-            db.close()
+            with self._lock:
+                self._active_loads -= 1
+                if history is not None and self._written.get(session_id, 0) <= token:
+                    self._store(session_id, history)
+                if not self._active_loads:
+                    self._written.clear()
+
+    def append(self, session_id: str, message: dict):
+        with self._lock:
+            self._mark_written(session_id)
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            history, size = entry
+            history.append(message)
+            grown = self._size([message])
+            self._entries[session_id] = (history, size + grown)
+            self._entries.move_to_end(session_id)
+            self._bytes += grown
+            self.stats["appends"] += 1
+            self._evict()
+
+    def invalidate(self, *session_ids: str):
+        with self._lock:
+            for session_id in session_ids:
+                self._mark_written(session_id)
+                entry = self._entries.pop(session_id, None)
+                if entry is not None:
+                    self._bytes -= entry[1]
+                    self.stats["invalidations"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+                "sessions": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+HISTORY_CACHE = HistoryCache(HISTORY_CACHE_MAX_BYTES)
+METRICS_SECTIONS["history_cache"] = HISTORY_CACHE.snapshot
 
-    def get_messages(session_id: str):
-        db = _db()
-        try:
+if SQLALCHEMY_AVAILABLE:
+    # Helper functions (run via db_run / run_db)
+    def ensure_session(db, session_id: str, *, title: str | None = None):
+        s = db.get(SessionModel, session_id)
+        if not s:
+            s = SessionModel(id=session_id, title=title or None)
+            db.add(s)
+            db.commit()
+        return s
+
+    def session_exists(db, session_id: str) -> bool:
+        return db.get(SessionModel, session_id) is not None
+
+    def add_message(db, session_id: str, role: str, content: str):
+        restore_session_messages(db, session_id)
+        s = db.get(SessionModel, session_id)
+        if not s:
+            s = SessionModel(id=session_id)
+            db.add(s)
+        m = MessageModel(id=str(uuid.uuid4()), session_id=session_id, role=role, content=content)
+        db.add(m)
+        # Update updated_at
+        s.updated_at = func.now()
+        # Auto-title on first assistant message if missing
+        if not s.title:
+            # Use first user message truncated as title
+            first_user = db.query(MessageModel).filter_by(session_id=session_id, role="user").order_by(MessageModel.created_at.asc()).first()
+            if first_user and first_user.content:
+                s.title = (first_user.content.strip()[:40]).strip()
+        db.commit()
+        HISTORY_CACHE.append(session_id, _history_message(role, content))
+
+    def _history_message(role: str, content: str | None) -> dict:
+        return {"role": "user" if role == "user" else "model", "parts": [content or ""]}
+
+    def get_history_for_gemini(db, session_id: str):
+        """Return messages mapped to Gemini chat history format (served from HISTORY_CACHE when warm)."""
+        def load():
+            restore_session_messages(db, session_id)
             msgs = (
-                db.query(MessageModel)
+                db.query(MessageModel.role, MessageModel.content)
                 .filter(MessageModel.session_id == session_id)
                 .order_by(MessageModel.created_at.asc())
                 .all()
             )
-            return [{
-                "id": m.id,
-                "role": m.role,
-                "content": m.content,
-                "created_at": str(m.created_at) if m.created_at else None,
-            } for m in msgs]
-        finally:
-            db.close()
-
-    def update_session_meta(session_id: str, *, title=None, pinned=None, archived=None):
-        db = _db()
-        try:
-            s = db.get(SessionModel, session_id)
-            if not s:
-                return False
-            if title is not None:
-                s.title = title
-            if pinned is not None:
-                s.pinned = bool(pinned)
-            if archived is not None:
-                s.archived = bool(archived)
-            s.updated_at = func.now()
-            db.commit()
-            return True
-        finally:
-            db.close()
-
-    def delete_session(session_id: str):
-        db = _db()
-        try:
-            s = db.get(SessionModel, session_id)
-            if not s:
-                return False
-            db.delete(s)
-            db.commit()
-            return True
-        finally:
-            db.close()
+            return [_history_message(role, content) for role, content in msgs]
+        return HISTORY_CACHE.get_or_load(session_id, load)
+
+    def list_sessions(db, pinned: int | None = None, q: str | None = None):
+        # Last message per session comes from a correlated subquery: one round trip, not one per row
+        last_message = (
+            db.query(MessageModel.content)
+            .filter(MessageModel.session_id == SessionModel.id)
+            .order_by(MessageModel.created_at.desc())
+            .limit(1)
+            .correlate(SessionModel)
+            .scalar_subquery()
+        )
+        archived_last = (
+            db.query(SessionArchiveModel.last_message)
+            .filter(SessionArchiveModel.session_id == SessionModel.id)
+            .correlate(SessionModel)
+            .scalar_subquery()
+        )
+        query = db.query(SessionModel, func.coalesce(last_message, archived_last))
+        if pinned is not None:
+            query = query.filter(SessionModel.pinned == bool(pinned))
+        if q:
+            like = f"%{q}%"
+            query = query.filter((SessionModel.title.ilike(like)))
+        rows = query.order_by(SessionModel.pinned.desc(), SessionModel.updated_at.desc().nullslast(), SessionModel.created_at.desc()).all()
+        result = []
+        for s, last_content in rows:
+            result.append({
+                "id": s.id,
+                "title": s.title,
+                "pinned": bool(s.pinned),
+                "archived": bool(s.archived),
+                "created_at": str(s.created_at) if s.created_at else None,
+                "updated_at": str(s.updated_at) if s.updated_at else None,
+                "last_message": (last_content[:80] if last_content else None)
+            })
+        return result
+
+    def get_messages(db, session_id: str):
+        restore_session_messages(db, session_id)
+        msgs = (
+            db.query(MessageModel)
+            .filter(MessageModel.session_id == session_id)
+            .order_by(MessageModel.created_at.asc())
+            .all()
+        )
+        return [{
+            "id": m.id,
+            "role": m.role,
+            "content": m.content,
+            "created_at": str(m.created_at) if m.created_at else None,
+        } for m in msgs]
+
+    def update_session_meta(db, session_id: str, *, title=None, pinned=None, archived=None):
+        s = db.get(SessionModel, session_id)
+        if not s:
+            return False
+        if title is not None:
+            s.title = title
+        if pinned is not None:
+            s.pinned = bool(pinned)
+        if archived is not None:
+            s.archived = bool(archived)
+        s.updated_at = func.now()
+        db.commit()
+        HISTORY_CACHE.invalidate(session_id)
+        return True
+
+    def delete_session(db, session_id: str):
+        s = db.get(SessionModel, session_id)
+        if not s:
+            return False
+        db.query(SessionArchiveModel).filter(SessionArchiveModel.session_id == session_id).delete(synchronize_session=False)
+        db.delete(s)
+        db.commit()
+        HISTORY_CACHE.invalidate(session_id)
+        return True
+
+    def clear_messages(db, session_id: str) -> int:
+        """Delete a session's messages, hot and archived, but keep the session row."""
+        db.query(SessionArchiveModel).filter(SessionArchiveModel.session_id == session_id).delete(synchronize_session=False)
+        count = db.query(MessageModel).filter(MessageModel.session_id == session_id).delete(synchronize_session=False)
+        db.commit()
+        HISTORY_CACHE.invalidate(session_id)
+        return count
 
 # --- Sessions API ---
 if SQLALCHEMY_AVAILABLE:
     from fastapi import Query, Path
 
     @app.post("/sessions")
-    def create_session():
+    async def create_session():
         sid = str(uuid.uuid4())
-        ensure_session(sid)
+        await db_run(ensure_session, sid)
         return {"id": sid, "title": None, "pinned": False, "archived": False}
 
     @app.get("/sessions")
-    def list_sessions_route(q: str | None = Query(default=None), pinned: int | None = Query(default=None)):
+    async def list_sessions_route(q: str | None = Query(default=None), pinned: int | None = Query(default=None)):
         try:
-            rows = list_sessions(pinned=pinned, q=q)
+            rows = await db_run(list_sessions, pinned=pinned, q=q)
             return {"sessions": rows}
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
     @app.get("/sessions/{session_id}/messages")
-    def get_session_messages(session_id: str = Path(...)):
+    async def get_session_messages(session_id: str = Path(...)):
+        # Existence check and fetch share one session; don't create if missing
+        def _load(db):
+            return get_messages(db, session_id) if session_exists(db, session_id) else None
         try:
-            # Ensure exists but don't create if missing
-            db = _db()
-            try:
-                s = db.get(SessionModel, session_id)
-                if not s:
-                    raise HTTPException(status_code=404, detail="Session not found")
-            finally:
-                db.close()
-            msgs = get_messages(session_id)
-            return {"messages": msgs}
-        except HTTPException:
-            raise
+            msgs = await db_run(_load)
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+        if msgs is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return {"messages": msgs}
 
     class SessionPatch(BaseModel):
         title: str | None = None
@@ -479,19 +1637,689 @@ if SQLALCHEMY_AVAILABLE:
         archived: bool | None = None
 
     @app.patch("/sessions/{session_id}")
-    def patch_session_route(payload: SessionPatch, session_id: str = Path(...)):
-        ok = update_session_meta(session_id, title=payload.title, pinned=payload.pinned, archived=payload.archived)
+    async def patch_session_route(payload: SessionPatch, session_id: str = Path(...)):
+        ok = await db_run(update_session_meta, session_id, title=payload.title, pinned=payload.pinned, archived=payload.archived)
         if not ok:
             raise HTTPException(status_code=404, detail="Session not found")
         return {"ok": True}
 
     @app.delete("/sessions/{session_id}")
-    def delete_session_route(session_id: str = Path(...)):
-        ok = delete_session(session_id)
+    async def delete_session_route(session_id: str = Path(...)):
+        ok = await db_run(delete_session, session_id)
         if not ok:
             raise HTTPException(status_code=404, detail="Session not found")
         return Response(status_code=204)
 
+# --- Sessions Export / Import (NDJSON) ---
+# Export streams one {"type": "session"} line per session followed by its
+# {"type": "message"} lines. Rows come from a yield_per cursor over a single
+# sessions/messages join and are flushed in ~64 KB chunks, so memory stays
+# flat regardless of dataset size. Import parses the request body as it
+# arrives and inserts every EXPORT_BATCH_ROWS records in one transaction.
+# Both accept gzip.
+import zlib
+from fastapi.responses import StreamingResponse
+
+EXPORT_BATCH_ROWS = 500
+EXPORT_CHUNK_BYTES = 64 * 1024
+IMPORT_MAX_LINE_BYTES = 4 * 1024 * 1024
+
+def _iso(value) -> str | None:
+    return value.isoformat(sep=" ") if isinstance(value, datetime) else (str(value) if value else None)
+
+def _parse_datetime(value, field: str) -> datetime | None:
+    if value in (None, ""):
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f"invalid {field}: {value!r}")
+
+if SQLALCHEMY_AVAILABLE:
+    def _export_lines(db, *, archived=None, pinned=None, since=None, until=None):
+        """Yield NDJSON lines for matching sessions and their messages, streaming from the cursor."""
+        query = (
+            db.query(
+                SessionModel.id, SessionModel.title, SessionModel.pinned, SessionModel.archived,
+                SessionModel.created_at, SessionModel.updated_at,
+                MessageModel.id, MessageModel.role, MessageModel.content, MessageModel.created_at,
+                SessionArchiveModel.blob,
+            )
+            .outerjoin(MessageModel, MessageModel.session_id == SessionModel.id)
+            .outerjoin(SessionArchiveModel, SessionArchiveModel.session_id == SessionModel.id)
+        )
+        if archived is not None:
+            query = query.filter(SessionModel.archived == bool(archived))
+        if pinned is not None:
+            query = query.filter(SessionModel.pinned == bool(pinned))
+        if since is not None:
+            query = query.filter(SessionModel.updated_at >= since)
+        if until is not None:
+            query = query.filter(SessionModel.updated_at < until)
+        query = query.order_by(SessionModel.created_at, SessionModel.id, MessageModel.created_at, MessageModel.id)
+
+        current = None
+        for sid, title, is_pinned, is_archived, created, updated, mid, role, content, msg_created, blob in query.yield_per(EXPORT_BATCH_ROWS):
+            if sid != current:
+                current = sid
+                yield json.dumps({
+                    "type": "session", "id": sid, "title": title, "pinned": bool(is_pinned),
+                    "archived": bool(is_archived), "created_at": _iso(created), "updated_at": _iso(updated),
+                }, ensure_ascii=False) + "\n"
+                # Compacted sessions keep their messages in the archive blob
+                for m in (json.loads(zlib.decompress(blob)) if blob else []):
+                    yield json.dumps({"type": "message", "session_id": sid, **m}, ensure_ascii=False) + "\n"
+            if mid is not None:
+                yield json.dumps({
+                    "type": "message", "id": mid, "session_id": sid, "role": role,
+                    "content": content, "created_at": _iso(msg_created),
+                }, ensure_ascii=False) + "\n"
+
+    def _next_export_chunk(lines, compressor) -> bytes | None:
+        """Pull lines until about EXPORT_CHUNK_BYTES are buffered; None once the cursor is exhausted."""
+        parts, size = [], 0
+        for line in lines:
+            data = line.encode("utf-8")
+            parts.append(data)
+            size += len(data)
+            if size >= EXPORT_CHUNK_BYTES:
+                break
+        if not parts:
+            return None
+        chunk = b"".join(parts)
+        return compressor.compress(chunk) if compressor else chunk
+
+    async def _export_stream(filters: dict, compress: bool):
+        db = await run_blocking("db", _db)
+        lines = _export_lines(db, **filters)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        try:
+            while (chunk := await run_blocking("db", _next_export_chunk, lines, compressor)) is not None:
+                if chunk:
+                    yield chunk
+            if compressor:
+                yield compressor.flush()
+        finally:
+            def _close():
+                lines.close()
+                db.close()
+            await run_blocking("db", _close)
+
+    def _import_batch(db, sessions: list[dict], messages: list[dict], replace: bool) -> dict:
+        """Insert one batch in a single transaction; existing ids are skipped (or replaced)."""
+        verb = "OR REPLACE" if replace else "OR IGNORE"
+        stats = {"sessions": 0, "messages": 0}
+        now = datetime.utcnow()
+        # Messages may reference sessions that are neither in the file nor the DB yet
+        implied = {m["session_id"] for m in messages} - {s["id"] for s in sessions}
+        if implied:
+            db.execute(SessionModel.__table__.insert().prefix_with("OR IGNORE"), [
+                {"id": sid, "title": None, "pinned": False, "archived": False, "created_at": now, "updated_at": now}
+                for sid in implied
+            ])
+        if sessions:
+            stats["sessions"] = db.execute(SessionModel.__table__.insert().prefix_with(verb), sessions).rowcount
+        if messages:
+            stats["messages"] = db.execute(MessageModel.__table__.insert().prefix_with(verb), messages).rowcount
+        db.commit()
+        HISTORY_CACHE.invalidate(*{m["session_id"] for m in messages})
+        return stats
+
+    def _import_record(record: dict, now: datetime) -> tuple[str, dict]:
+        kind = record.get("type")
+        if kind == "session":
+            if not record.get("id"):
+                raise ValueError("session without id")
+            return kind, {
+                "id": str(record["id"]),
+                "title": record.get("title"),
+                "pinned": bool(record.get("pinned")),
+                "archived": bool(record.get("archived")),
+                "created_at": _parse_datetime(record.get("created_at"), "created_at") or now,
+                "updated_at": _parse_datetime(record.get("updated_at"), "updated_at") or now,
+            }
+        if kind == "message":
+            if not record.get("session_id"):
+                raise ValueError("message without session_id")
+            return kind, {
+                "id": str(record.get("id") or uuid.uuid4()),
+                "session_id": str(record["session_id"]),
+                "role": record.get("role") or "user",
+                "content": record.get("content") or "",
+                "created_at": _parse_datetime(record.get("created_at"), "created_at") or now,
+            }
+        raise ValueError(f"unknown record type: {kind!r}")
+
+    @app.get("/sessions/export")
+    async def export_sessions(
+        archived: int | None = Query(default=None),
+        pinned: int | None = Query(default=None),
+        since: str | None = Query(default=None),
+        until: str | None = Query(default=None),
+        compress: bool = Query(default=False, alias="gzip"),
+    ):
+        try:
+            filters = {
+                "archived": archived,
+                "pinned": pinned,
+                "since": _parse_datetime(since, "since"),
+                "until": _parse_datetime(until, "until"),
+            }
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not await run_blocking("db", ensure_db):
+            raise HTTPException(status_code=503, detail="Database unavailable")
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        filename = f"ava-sessions-{stamp}.ndjson" + (".gz" if compress else "")
+        return StreamingResponse(
+            _export_stream(filters, compress),
+            media_type="application/gzip" if compress else "application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+    @app.post("/sessions/import")
+    async def import_sessions(request: Request, replace: bool = Query(default=False)):
+        """Import NDJSON (optionally gzip) as produced by /sessions/export."""
+        started = time.perf_counter()
+        summary = {"sessions": 0, "messages": 0, "lines": 0, "batches": 0, "errors": 0, "first_errors": []}
+        gzipped = "gzip" in request.headers.get("content-encoding", "").lower()
+        decompressor = None
+        pending = b""
+        sessions: list[dict] = []
+        messages: list[dict] = []
+        now = datetime.utcnow()
+
+        async def flush():
+            nonlocal sessions, messages
+            if not sessions and not messages:
+                return
+            stats = await db_run(_import_batch, sessions, messages, replace)
+            summary["sessions"] += stats["sessions"]
+            summary["messages"] += stats["messages"]
+            summary["batches"] += 1
+            sessions, messages = [], []
+
+        def take(line: bytes):
+            line = line.strip()
+            if not line:
+                return
+            summary["lines"] += 1
+            try:
+                kind, row = _import_record(json.loads(line), now)
+                (sessions if kind == "session" else messages).append(row)
+            except (ValueError, AttributeError, TypeError) as e:
+                summary["errors"] += 1
+                if len(summary["first_errors"]) < 10:
+                    summary["first_errors"].append(f"line {summary['lines']}: {e}")
+
+        async for chunk in request.stream():
+            if not chunk:
+                continue
+            if decompressor is None and (gzipped or chunk[:2] == b"\x1f\x8b"):
+                decompressor = zlib.decompressobj(47)
+            data = decompressor.decompress(chunk) if decompressor else chunk
+            pending += data
+            *complete, pending = pending.split(b"\n")
+            if len(pending) > IMPORT_MAX_LINE_BYTES:
+                raise HTTPException(status_code=413, detail=f"NDJSON line {summary['lines'] + 1} exceeds {IMPORT_MAX_LINE_BYTES} bytes")
+            for line in complete:
+                take(line)
+                if len(sessions) + len(messages) >= EXPORT_BATCH_ROWS:
+                    await flush()
+        if decompressor:
+            pending += decompressor.flush()
+        take(pending)
+        await flush()
+        summary["seconds"] = round(time.perf_counter() - started, 3)
+        print(f"📥 Imported {summary['sessions']} sessions, {summary['messages']} messages "
+              f"in {summary['batches']} batches ({summary['errors']} bad lines, {summary['seconds']}s)")
+        return summary
+
+# --- Retention & Maintenance ---
+# A background task runs every AVA_MAINTENANCE_INTERVAL_MIN minutes on the db
+# executor. It compacts the messages of archived sessions (idle for
+# AVA_ARCHIVE_FLAGGED_AFTER_HOURS) and of any session idle for
+# AVA_ARCHIVE_AFTER_DAYS into one zlib-compressed JSON blob per session in
+# session_archives, and purges unpinned sessions idle past AVA_PURGE_AFTER_DAYS
+# (0 = keep forever). Inside the off-peak AVA_MAINTENANCE_WINDOW (local hours,
+# e.g. "2-5") it also frees pages with incremental VACUUM and refreshes planner
+# statistics with ANALYZE. Reading or appending to a compacted session
+# restores its rows first, so callers never see the difference.
+from datetime import timedelta
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("AVA_ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_FLAGGED_AFTER_HOURS = float(os.getenv("AVA_ARCHIVE_FLAGGED_AFTER_HOURS", "24"))
+PURGE_AFTER_DAYS = float(os.getenv("AVA_PURGE_AFTER_DAYS", "0"))
+MAINTENANCE_INTERVAL_S = float(os.getenv("AVA_MAINTENANCE_INTERVAL_MIN", "60")) * 60
+MAINTENANCE_WINDOW = os.getenv("AVA_MAINTENANCE_WINDOW", "2-5")
+MAINTENANCE_BATCH_SESSIONS = 50
+PURGE_BATCH_SESSIONS = 500
+INCREMENTAL_VACUUM_PAGES = 4096
+MAINTENANCE_STATS: dict[str, Any] = {
+    "runs": 0,
+    "compacted_sessions": 0,
+    "compacted_messages": 0,
+    "compacted_bytes_in": 0,
+    "compacted_bytes_out": 0,
+    "restored_sessions": 0,
+    "purged_sessions": 0,
+    "vacuumed_pages": 0,
+    "last_run": None,
+    "last_vacuum": None,
+    "last_error": None,
+}
+_maintenance_lock = threading.Lock()
+# Sessions restored by a read stay hot for a while instead of being re-compacted on the next pass
+_recently_restored: dict[str, float] = {}
+
+def restore_session_messages(db, session_id: str) -> int:
+    """Move a compacted session's messages back into the hot table; returns rows restored."""
+    archive = db.get(SessionArchiveModel, session_id)
+    if archive is None:
+        return 0
+    rows = json.loads(zlib.decompress(archive.blob)) if archive.blob else []
+    if rows:
+        now = datetime.utcnow()
+        db.execute(MessageModel.__table__.insert().prefix_with("OR IGNORE"), [{
+            "id": r.get("id") or str(uuid.uuid4()),
+            "session_id": session_id,
+            "role": r.get("role"),
+            "content": r.get("content"),
+            "created_at": _parse_datetime(r.get("created_at"), "created_at") or now,
+        } for r in rows])
+    db.delete(archive)
+    db.commit()
+    _recently_restored[session_id] = time.time()
+    MAINTENANCE_STATS["restored_sessions"] += 1
+    print(f"📂 Restored {len(rows)} archived messages for session {session_id}")
+    return len(rows)
+
+def _compact_session(db, session_id: str) -> tuple[int, int, int]:
+    msgs = (
+        db.query(MessageModel.id, MessageModel.role, MessageModel.content, MessageModel.created_at)
+        .filter(MessageModel.session_id == session_id)
+        .order_by(MessageModel.created_at, MessageModel.id)
+        .all()
+    )
+    if not msgs:
+        return 0, 0, 0
+    archive = db.get(SessionArchiveModel, session_id)
+    # Merge with an existing archive by message id (hot rows win)
+    merged = {r.get("id") or str(uuid.uuid4()): r for r in (json.loads(zlib.decompress(archive.blob)) if archive is not None and archive.blob else [])}
+    for mid, role, content, created in msgs:
+        merged[mid] = {"id": mid, "role": role, "content": content, "created_at": _iso(created)}
+    rows = list(merged.values())
+    raw = json.dumps(rows, ensure_ascii=False).encode("utf-8")
+    blob = zlib.compress(raw, 9)
+    if archive is None:
+        archive = SessionArchiveModel(session_id=session_id)
+        db.add(archive)
+    last = next((r["content"] for r in reversed(rows) if r.get("content")), None)
+    archive.message_count = len(rows)
+    archive.raw_bytes = len(raw)
+    archive.last_message = last[:80] if last else None
+    archive.blob = blob
+    archive.archived_at = datetime.utcnow()
+    db.query(MessageModel).filter(MessageModel.session_id == session_id).delete(synchronize_session=False)
+    return len(msgs), len(raw), len(blob)
+
+def compact_sessions(db, now: datetime) -> dict:
+    """Compact up to MAINTENANCE_BATCH_SESSIONS eligible sessions in one transaction."""
+    eligible = (SessionModel.archived == True) & (SessionModel.updated_at < now - timedelta(hours=ARCHIVE_FLAGGED_AFTER_HOURS))
+    if ARCHIVE_AFTER_DAYS > 0:
+        eligible = eligible | (SessionModel.updated_at < now - timedelta(days=ARCHIVE_AFTER_DAYS))
+    has_hot_messages = db.query(MessageModel.id).filter(MessageModel.session_id == SessionModel.id).exists()
+    cooldown = time.time() - ARCHIVE_FLAGGED_AFTER_HOURS * 3600
+    for sid, restored_at in list(_recently_restored.items()):
+        if restored_at < cooldown:
+            _recently_restored.pop(sid, None)
+    query = db.query(SessionModel.id).filter(eligible, has_hot_messages)
+    if _recently_restored:
+        query = query.filter(SessionModel.id.notin_(list(_recently_restored)))
+    ids = [sid for (sid,) in query.limit(MAINTENANCE_BATCH_SESSIONS)]
+    result = {"sessions": 0, "messages": 0, "bytes_in": 0, "bytes_out": 0}
+    for sid in ids:
+        count, raw, packed = _compact_session(db, sid)
+        if count:
+            result["sessions"] += 1
+            result["messages"] += count
+            result["bytes_in"] += raw
+            result["bytes_out"] += packed
+    db.commit()
+    return result
+
+def purge_sessions(db, now: datetime) -> int:
+    """Delete unpinned sessions (messages and archives included) idle past the purge cutoff."""
+    if PURGE_AFTER_DAYS <= 0:
+        return 0
+    cutoff = now - timedelta(days=PURGE_AFTER_DAYS)
+    purged = 0
+    while True:
+        ids = [sid for (sid,) in db.query(SessionModel.id).filter(SessionModel.updated_at < cutoff, SessionModel.pinned == False).limit(PURGE_BATCH_SESSIONS)]
+        if not ids:
+            return purged
+        db.query(MessageModel).filter(MessageModel.session_id.in_(ids)).delete(synchronize_session=False)
+        db.query(SessionArchiveModel).filter(SessionArchiveModel.session_id.in_(ids)).delete(synchronize_session=False)
+        db.query(SessionModel).filter(SessionModel.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        HISTORY_CACHE.invalidate(*ids)
+        purged += len(ids)
+
+def vacuum_and_analyze() -> dict:
+    """Return free pages to the OS and refresh statistics; converts the DB to incremental auto_vacuum once."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        freelist_before = conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            # Existing files only switch to incremental mode after one full VACUUM
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+            mode = "full"
+        else:
+            # The pragma frees pages as it is stepped, so drain it on the raw DB-API cursor
+            cursor = conn.connection.cursor()
+            cursor.execute(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES})").fetchall()
+            cursor.close()
+            mode = "incremental"
+        freed = freelist_before - (conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0)
+        conn.exec_driver_sql("ANALYZE")
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    return {"mode": mode, "freed_pages": max(freed, 0)}
+
+def in_maintenance_window(hour: int) -> bool:
+    try:
+        start, end = (int(h) for h in MAINTENANCE_WINDOW.split("-", 1))
+    except ValueError:
+        return False
+    return start <= hour < end if start <= end else (hour >= start or hour < end)
+
+def run_maintenance(*, vacuum: bool | None = None) -> dict:
+    """One maintenance pass (blocking; run on the db executor). vacuum=None means only inside the window."""
+    if not ensure_db():
+        return {"error": "database unavailable"}
+    with _maintenance_lock:
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        with _db() as db:
+            compacted = compact_sessions(db, now)
+            purged = purge_sessions(db, now)
+        result: dict[str, Any] = {"compacted": compacted, "purged_sessions": purged}
+        if vacuum is None:
+            last = MAINTENANCE_STATS["last_vacuum"]
+            vacuum = in_maintenance_window(datetime.now().hour) and (last is None or time.time() - last > 20 * 3600)
+        if vacuum:
+            result["vacuum"] = vacuum_and_analyze()
+            MAINTENANCE_STATS["last_vacuum"] = time.time()
+            MAINTENANCE_STATS["vacuumed_pages"] += result["vacuum"]["freed_pages"]
+        result["seconds"] = round(time.perf_counter() - started, 3)
+
+        MAINTENANCE_STATS["runs"] += 1
+        MAINTENANCE_STATS["last_run"] = time.time()
+        MAINTENANCE_STATS["compacted_sessions"] += compacted["sessions"]
+        MAINTENANCE_STATS["compacted_messages"] += compacted["messages"]
+        MAINTENANCE_STATS["compacted_bytes_in"] += compacted["bytes_in"]
+        MAINTENANCE_STATS["compacted_bytes_out"] += compacted["bytes_out"]
+        MAINTENANCE_STATS["purged_sessions"] += purged
+        if compacted["sessions"] or purged or vacuum:
+            print(f"🧹 DB maintenance: compacted {compacted['sessions']} sessions "
+                  f"({compacted['messages']} msgs, {compacted['bytes_in']}B -> {compacted['bytes_out']}B), "
+                  f"purged {purged}, vacuum {result.get('vacuum', 'skipped')} ({result['seconds']}s)")
+        return result
+
+async def _maintenance_loop():
+    # First pass shortly after boot, then every interval
+    await asyncio.sleep(min(300.0, MAINTENANCE_INTERVAL_S))
+    while True:
+        try:
+            await run_blocking("db", run_maintenance)
+        except Exception as e:
+            MAINTENANCE_STATS["last_error"] = str(e)
+            print(f"⚠️ DB maintenance failed: {e}")
+        await asyncio.sleep(MAINTENANCE_INTERVAL_S)
+
+if SQLALCHEMY_AVAILABLE:
+    @app.on_event("startup")
+    async def _start_maintenance():
+        if MAINTENANCE_INTERVAL_S > 0:
+            asyncio.get_running_loop().create_task(_maintenance_loop())
+
+    @app.post("/sessions/maintenance")
+    async def run_maintenance_route(vacuum: bool = Query(default=False)):
+        """Run one maintenance pass now; VACUUM/ANALYZE only when ?vacuum=1."""
+        return await run_blocking("db", run_maintenance, vacuum=vacuum)
+
+    METRICS_SECTIONS["maintenance"] = lambda: {
+        "archive_after_days": ARCHIVE_AFTER_DAYS,
+        "archive_flagged_after_hours": ARCHIVE_FLAGGED_AFTER_HOURS,
+        "purge_after_days": PURGE_AFTER_DAYS,
+        "interval_s": MAINTENANCE_INTERVAL_S,
+        "window": MAINTENANCE_WINDOW,
+        **MAINTENANCE_STATS,
+    }
+
+# --- Usage Metering ---
+# What each conversation costs, per session and per turn: Gemini input/output
+# tokens (usage_metadata), Murf characters (the text actually sent for
+# synthesis), STT audio seconds and tool calls. Counters accumulate
+# in memory and are upserted into usage_turns every AVA_USAGE_FLUSH_S seconds
+# (default 30) and at shutdown; GET /usage returns rollups. Optional
+# per-session quotas (AVA_QUOTA_LLM_TOKENS, AVA_QUOTA_TTS_CHARS; 0 = unlimited)
+# degrade a session to intent-only answers or text-only replies once spent.
+USAGE_COUNTERS = ("llm_input_tokens", "llm_output_tokens", "tts_chars", "stt_seconds", "tool_calls")
+USAGE_FLUSH_INTERVAL_S = max(5.0, float(os.getenv("AVA_USAGE_FLUSH_S", "30")))
+USAGE_QUOTAS = {
+    "llm_tokens": int(os.getenv("AVA_QUOTA_LLM_TOKENS", "0")),
+    "tts_chars": int(os.getenv("AVA_QUOTA_TTS_CHARS", "0")),
+}
+USAGE_QUOTA_MESSAGE = "This conversation has reached its usage limit. Please start a new session to keep chatting."
+ANONYMOUS_SESSION = "-"
+
+def record_murf_usage(session_id: str | None, turn_id: str | None, spoken: str, murf_data: dict):
+    """Meter the characters sent to Murf (what it bills) and keep its account balance."""
+    USAGE.record(session_id, turn_id, tts_chars=len(spoken or ""))
+    if murf_data.get("remainingCharacterCount") is not None:
+        USAGE.provider_remaining["murf_chars"] = murf_data["remainingCharacterCount"]
+
+def llm_usage(response) -> dict:
+    """Token counters from a Gemini response or streamed chunk (zeros when absent)."""
+    meta = getattr(response, "usage_metadata", None)
+    return {
+        "llm_input_tokens": int(getattr(meta, "prompt_token_count", 0) or 0),
+        "llm_output_tokens": int(getattr(meta, "candidates_token_count", 0) or 0),
+    }
+
+class UsageMeter:
+    """In-memory usage counters keyed by (session, turn), drained to SQLite by flush()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[str, str], dict] = {}
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.flush_errors = 0
+        self.last_flush_at: str | None = None
+        # Account-level balances reported by providers (Murf remainingCharacterCount)
+        self.provider_remaining: dict[str, Any] = {}
+
+    @staticmethod
+    def new_turn() -> str:
+        return uuid.uuid4().hex[:16]
+
+    def record(self, session_id: str | None, turn_id: str | None = None, **counters):
+        """Add counters to a turn; without a turn id the call gets a row of its own."""
+        key = (session_id or ANONYMOUS_SESSION, turn_id or self.new_turn())
+        now = datetime.utcnow()
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                row = self._pending[key] = {**dict.fromkeys(USAGE_COUNTERS, 0), "started_at": now}
+            for name, value in counters.items():
+                if value:
+                    row[name] += value
+            row["updated_at"] = now
+
+    def pending_rows(self, session_id: str | None = None) -> list[dict]:
+        with self._lock:
+            return [
+                {"session_id": sid, "turn_id": tid, **row}
+                for (sid, tid), row in self._pending.items()
+                if session_id is None or sid == session_id
+            ]
+
+    def flush(self, db) -> int:
+        """Upsert pending counters (adding to rows already stored); on failure they are kept for the next pass."""
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        table = UsageModel.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["session_id", "turn_id"],
+            set_={**{c: table.c[c] + stmt.excluded[c] for c in USAGE_COUNTERS}, "updated_at": stmt.excluded.updated_at},
+        )
+        try:
+            db.execute(stmt, [{"session_id": sid, "turn_id": tid, **row} for (sid, tid), row in pending.items()])
+            db.commit()
+        except Exception:
+            db.rollback()
+            self.flush_errors += 1
+            with self._lock:
+                for key, row in pending.items():
+                    merged = self._pending.setdefault(key, row)
+                    if merged is not row:
+                        for c in USAGE_COUNTERS:
+                            merged[c] += row[c]
+                        merged["started_at"] = min(merged["started_at"], row["started_at"])
+            raise
+        self.flushes += 1
+        self.rows_flushed += len(pending)
+        self.last_flush_at = datetime.utcnow().isoformat() + "Z"
+        return len(pending)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending_rows": pending,
+            "flush_interval_s": USAGE_FLUSH_INTERVAL_S,
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+            "flush_errors": self.flush_errors,
+            "last_flush_at": self.last_flush_at,
+            "quotas": USAGE_QUOTAS,
+            "provider_remaining": self.provider_remaining,
+        }
+
+USAGE = UsageMeter()
+METRICS_SECTIONS["usage"] = USAGE.stats
+
+def _usage_sums(rows) -> dict:
+    sums = dict.fromkeys(USAGE_COUNTERS, 0)
+    for row in rows:
+        for c in USAGE_COUNTERS:
+            sums[c] += row[c] or 0
+    sums["stt_seconds"] = round(sums["stt_seconds"], 2)
+    return sums
+
+def session_usage(session_id: str) -> dict:
+    """Stored plus pending totals for one session. Blocking; call from a worker thread."""
+    rows = USAGE.pending_rows(session_id)
+    if SQLALCHEMY_AVAILABLE and ensure_db():
+        def _stored(db):
+            cols = [func.sum(getattr(UsageModel, c)).label(c) for c in USAGE_COUNTERS]
+            return db.query(*cols).filter(UsageModel.session_id == session_id).one()._asdict()
+        rows.append(run_db(_stored))
+    return _usage_sums(rows)
+
+def quota_exceeded(session_id: str | None, kind: str) -> bool:
+    """Whether a session has spent its llm_tokens or tts_chars quota (always False when unlimited)."""
+    limit = USAGE_QUOTAS.get(kind) or 0
+    if not limit or not session_id:
+        return False
+    try:
+        totals = session_usage(session_id)
+    except Exception as e:
+        print(f"⚠️ Usage lookup failed, not enforcing quota: {e}")
+        return False
+    used = totals["llm_input_tokens"] + totals["llm_output_tokens"] if kind == "llm_tokens" else totals["tts_chars"]
+    if used >= limit:
+        print(f"🧾 Session {session_id[:8]} over its {kind} quota ({used}/{limit})")
+        return True
+    return False
+
+def usage_report(db, session_id: str | None, days: int, top: int, sort: str) -> dict:
+    """Rollups over usage_turns: totals, busiest sessions, per-day series and (for one session) its turns."""
+    since = datetime.utcnow() - timedelta(days=days)
+    cols = [func.sum(getattr(UsageModel, c)).label(c) for c in USAGE_COUNTERS]
+    base = db.query(*cols).filter(UsageModel.started_at >= since)
+    if session_id:
+        base = base.filter(UsageModel.session_id == session_id)
+    report = {"days": days, "totals": _usage_sums([base.one()._asdict()])}
+
+    order = (UsageModel.llm_input_tokens + UsageModel.llm_output_tokens) if sort == "llm_tokens" else getattr(UsageModel, sort)
+    by_session = (
+        db.query(UsageModel.session_id, func.count(UsageModel.turn_id).label("turns"), *cols)
+        .filter(UsageModel.started_at >= since)
+        .group_by(UsageModel.session_id)
+        .order_by(func.sum(order).desc())
+        .limit(top)
+    )
+    report["by_session"] = [{**r._asdict(), **_usage_sums([r._asdict()])} for r in by_session]
+
+    day = func.date(UsageModel.started_at).label("day")
+    by_day = base.add_columns(day, func.count(UsageModel.turn_id).label("turns")).group_by(day).order_by(day)
+    report["by_day"] = [{"day": r.day, "turns": r.turns, **_usage_sums([r._asdict()])} for r in by_day]
+
+    if session_id:
+        turns = (
+            db.query(UsageModel)
+            .filter(UsageModel.session_id == session_id, UsageModel.started_at >= since)
+            .order_by(UsageModel.started_at)
+            .all()
+        )
+        report["turns"] = [
+            {"turn_id": t.turn_id, "started_at": _iso(t.started_at), **{c: getattr(t, c) for c in USAGE_COUNTERS}}
+            for t in turns
+        ]
+    return report
+
+USAGE_SORTS = ("llm_tokens",) + USAGE_COUNTERS
+
+@app.get("/usage")
+async def api_usage(session_id: str | None = None, days: int = 7, top: int = 20, sort: str = "llm_tokens"):
+    """Usage rollups for the last `days` days; pending counters are flushed first."""
+    if sort not in USAGE_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(USAGE_SORTS)}")
+    days, top = max(1, min(days, 365)), max(1, min(top, 200))
+    if not SQLALCHEMY_AVAILABLE:
+        # No database: everything is still pending in memory
+        rows = USAGE.pending_rows(session_id)
+        return {"days": None, "persisted": False, "totals": _usage_sums(rows), "quotas": USAGE_QUOTAS}
+    await db_run(USAGE.flush)
+    report = await db_run(usage_report, session_id, days, top, sort)
+    return {**report, "persisted": True, "quotas": USAGE_QUOTAS}
+
+async def _usage_flush_loop():
+    while True:
+        await asyncio.sleep(USAGE_FLUSH_INTERVAL_S)
+        try:
+            await db_run(USAGE.flush)
+        except Exception as e:
+            print(f"⚠️ Usage flush failed (will retry): {e}")
+
+if SQLALCHEMY_AVAILABLE:
+    @app.on_event("startup")
+    async def _start_usage_flush():
+        asyncio.get_running_loop().create_task(_usage_flush_loop())
+
+    @app.on_event("shutdown")
+    async def _flush_usage_on_shutdown():
+        try:
+            await db_run(USAGE.flush)
+        except Exception as e:
+            print(f"⚠️ Final usage flush failed: {e}")
+
 # --- Helper Function ---
 def serve_debug_html(file_name: str):
     """Safely reads and serves an HTML file, handling FileNotFoundError."""
@@ -504,6 +2332,160 @@ def serve_debug_html(file_name: str):
             status_code=404
         )
 
+# --- Tool Registry (circuit breakers, adaptive timeouts, retries) ---
+# Every outbound tool HTTP call goes through a ProviderTool. While a provider
+# keeps failing its breaker opens and calls fail immediately instead of
+# waiting out the full timeout; after AVA_BREAKER_RESET_S one probe call is
+# let through (half-open) to decide whether to close it again.
+import random
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.last_error: str | None = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error: str):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = error
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"🚧 Circuit opened after {self.consecutive_failures} failure(s): {error}")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+def _is_transient(exc: Exception) -> bool:
+    if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    resp = getattr(exc, "response", None)
+    return resp is not None and (resp.status_code == 429 or resp.status_code >= 500)
+
+class ProviderTool:
+    """Registry entry wrapping one provider's HTTP calls with a breaker, adaptive timeout and retries."""
+
+    def __init__(self, name: str, *, max_timeout: float, min_timeout: float = 2.0,
+                 idempotent: bool = False, retries: int = 2):
+        self.name = name
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.idempotent = idempotent
+        self.retries = retries if idempotent else 0
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("AVA_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("AVA_BREAKER_RESET_S", "30")),
+        )
+        self._latencies: deque = deque(maxlen=50)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def timeout(self) -> float:
+        """Three times the recent p95 latency, clamped to [min_timeout, max_timeout]."""
+        with self._lock:
+            if len(self._latencies) < 5:
+                return self.max_timeout
+            lat = sorted(self._latencies)
+        p95 = _percentile(lat, 0.95)
+        return max(self.min_timeout, min(self.max_timeout, p95 * 3))
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable (circuit open)")
+        attempt = 0
+        while True:
+            with self._lock:
+                self.calls += 1
+            started = time.perf_counter()
+            try:
+                resp = requests.request(method, url, timeout=self.timeout(), **kwargs)
+                resp.raise_for_status()
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                if attempt < self.retries and _is_transient(e):
+                    # Full jitter: sleep a random slice of an exponentially growing window
+                    time.sleep(random.uniform(0.05, min(2.0, 0.2 * 2 ** attempt)))
+                    attempt += 1
+                    continue
+                self.breaker.record_failure(str(e))
+                raise
+            with self._lock:
+                self._latencies.append(time.perf_counter() - started)
+            self.breaker.record_success()
+            return resp
+
+    def health(self) -> dict:
+        timeout = self.timeout()
+        with self._lock:
+            lat = sorted(self._latencies)
+            counts = {"calls": self.calls, "failures": self.failures, "rejected": self.rejected}
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "last_error": self.breaker.last_error,
+            "timeout_s": round(timeout, 2),
+            "p95_ms": round(_percentile(lat, 0.95) * 1000, 1),
+            **counts,
+        }
+
+TOOL_REGISTRY: dict[str, ProviderTool] = {
+    # Tavily bills per search, so failed calls are not retried
+    "tavily": ProviderTool("tavily", max_timeout=15.0, min_timeout=4.0),
+    "spotify_auth": ProviderTool("spotify_auth", max_timeout=10.0, idempotent=True),
+    "spotify": ProviderTool("spotify", max_timeout=10.0, idempotent=True),
+    "itunes": ProviderTool("itunes", max_timeout=10.0, idempotent=True),
+    "weather": ProviderTool("weather", max_timeout=8.0, idempotent=True),
+}
+
+# Keys each tool authenticates with; new credentials deserve a fresh chance,
+# so a change closes any breaker opened by auth failures
+TOOL_CREDENTIALS = {
+    "tavily": {"TAVILY_API_KEY"},
+    "spotify_auth": {"SPOTIFY_CLIENT_ID", "SPOTIFY_CLIENT_SECRET"},
+    "spotify": {"SPOTIFY_CLIENT_ID", "SPOTIFY_CLIENT_SECRET"},
+    "weather": {"WEATHER_API_KEY"},
+}
+
+def _reset_tool_breakers(changed: set[str]):
+    for name, keys in TOOL_CREDENTIALS.items():
+        if keys & changed:
+            TOOL_REGISTRY[name].breaker.record_success()
+
+CREDENTIAL_LISTENERS["tool_breakers"] = _reset_tool_breakers
+
 # --- Web Search Skill (Tavily) ---
 # Uses Tavily API to get a concise answer and a few sources
 # Requires TAVILY_API_KEY in uploads/.env
@@ -521,8 +2503,7 @@ def tavily_search(query: str) -> str:
             "include_answer": True,
             "max_results": 5
         }
-        resp = requests.post(url, json=payload, timeout=15)
-        resp.raise_for_status()
+        resp = TOOL_REGISTRY["tavily"].request("POST", url, json=payload)
         data = resp.json()
         answer = data.get("answer")
         results = data.get("results") or []
@@ -540,10 +2521,221 @@ def tavily_search(query: str) -> str:
                 url = item.get("url")
                 lines.append(f"- {title}: {url}")
         return "\n".join(lines).strip()
+    except CircuitOpenError as e:
+        print(f"🚧 [Tavily] {e}")
+        return "Web search is temporarily unavailable. Please try again in a little while."
     except Exception as e:
         print(f"❌ [Tavily] API error: {e}")
         return f"I couldn't complete the web search right now. Error: {e}"
 
+# --- Weather Skill (WeatherAPI) ---
+# Current conditions plus today's high/low from weatherapi.com (WEATHER_API_KEY).
+# Results are cached per coarse location bucket: coordinates snapped to an
+# AVA_WEATHER_GRID_DEG grid (default 0.1°, about 11 km), with place names mapped
+# onto the cell of the location they resolved to, so "Paris" and "paris, france"
+# share one entry. Entries live AVA_WEATHER_TTL_MIN (default 10). Concurrent
+# lookups for one bucket share a single request, and a background loop refetches
+# the AVA_WEATHER_REFRESH_TOP most-asked-for buckets before they expire.
+WEATHER_TTL_S = max(60.0, float(os.getenv("AVA_WEATHER_TTL_MIN", "10")) * 60)
+WEATHER_GRID_DEG = max(0.01, float(os.getenv("AVA_WEATHER_GRID_DEG", "0.1")))
+WEATHER_REFRESH_TOP = int(os.getenv("AVA_WEATHER_REFRESH_TOP", "5"))
+WEATHER_REFRESH_INTERVAL_S = WEATHER_TTL_S / 4
+# Used when a question names no place ("what's the weather like?")
+WEATHER_DEFAULT_LOCATION = os.getenv("AVA_WEATHER_LOCATION", "").strip()
+WEATHER_CACHE_MAX_ENTRIES = 256
+_WEATHER_COORDS = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+_WEATHER_NAME_STRIP = re.compile(r"[^\w\s,]+")
+
+_weather_cache: OrderedDict = OrderedDict()   # bucket -> entry, LRU order
+_weather_aliases: dict[str, str] = {}          # "name:<place>" -> grid bucket
+_weather_inflight: dict[str, Future] = {}
+_weather_lock = threading.Lock()                # also guards WEATHER_STATS
+WEATHER_STATS: dict[str, Any] = {
+    "hits": 0, "misses": 0, "coalesced": 0, "refreshes": 0, "stale_served": 0, "errors": 0,
+    "fetch_ms": deque(maxlen=128),
+}
+
+def _weather_grid(lat: float, lon: float) -> str:
+    return f"{round(lat / WEATHER_GRID_DEG) * WEATHER_GRID_DEG:.2f},{round(lon / WEATHER_GRID_DEG) * WEATHER_GRID_DEG:.2f}"
+
+def _weather_bucket(location: str) -> str:
+    """Cache key for a location: its grid cell when known, else the normalized place name."""
+    m = _WEATHER_COORDS.match(location)
+    if m:
+        return _weather_grid(float(m.group(1)), float(m.group(2)))
+    key = "name:" + " ".join(_WEATHER_NAME_STRIP.sub(" ", location.lower()).split())
+    with _weather_lock:
+        return _weather_aliases.get(key, key)
+
+def _fetch_weather(query: str) -> dict:
+    started = time.perf_counter()
+    resp = TOOL_REGISTRY["weather"].request(
+        "GET", "https://api.weatherapi.com/v1/forecast.json",
+        params={"key": WEATHER_API_KEY, "q": query, "days": 1, "aqi": "no", "alerts": "no"},
+    )
+    data = resp.json()
+    with _weather_lock:
+        WEATHER_STATS["fetch_ms"].append((time.perf_counter() - started) * 1000)
+    loc = data.get("location") or {}
+    cur = data.get("current") or {}
+    days = (data.get("forecast") or {}).get("forecastday") or [{}]
+    day = days[0].get("day") or {}
+    place = ", ".join(p for p in (loc.get("name"), loc.get("country")) if p) or query
+    text = (
+        f"Weather in {place}: {(cur.get('condition') or {}).get('text', 'unknown').strip().lower()}, "
+        f"{cur.get('temp_c', 0):.0f}°C ({cur.get('temp_f', 0):.0f}°F), feels like {cur.get('feelslike_c', 0):.0f}°C, "
+        f"humidity {cur.get('humidity', 0)}%, wind {cur.get('wind_kph', 0):.0f} km/h."
+    )
+    if day:
+        text += f" Today: high {day.get('maxtemp_c', 0):.0f}°C, low {day.get('mintemp_c', 0):.0f}°C"
+        if day.get("daily_chance_of_rain"):
+            text += f", {day['daily_chance_of_rain']}% chance of rain"
+        text += "."
+    if cur.get("last_updated"):
+        text += f" (Updated {cur['last_updated'][-5:]} local time.)"
+    lat, lon = loc.get("lat"), loc.get("lon")
+    now = time.time()
+    return {
+        "bucket": _weather_grid(lat, lon) if lat is not None and lon is not None else None,
+        "query": f"{lat},{lon}" if lat is not None and lon is not None else query,
+        "place": place,
+        "text": text,
+        "fetched_at": now,
+        "expires_at": now + WEATHER_TTL_S,
+        "hits": 0,
+    }
+
+def _store_weather(requested: str, entry: dict):
+    """Cache under the resolved grid cell and alias the requested name onto it."""
+    bucket = entry["bucket"] or requested
+    with _weather_lock:
+        previous = _weather_cache.pop(bucket, None)
+        if previous:
+            entry["hits"] = max(entry["hits"], previous["hits"])
+        _weather_cache[bucket] = entry
+        if requested != bucket:
+            _weather_cache.pop(requested, None)
+            _weather_aliases[requested] = bucket
+        while len(_weather_cache) > WEATHER_CACHE_MAX_ENTRIES:
+            evicted, _ = _weather_cache.popitem(last=False)
+            for name in [n for n, b in _weather_aliases.items() if b == evicted]:
+                del _weather_aliases[name]
+
+def weather_lookup(location: str) -> dict:
+    """Cached, single-flight weather entry for a location; raises if no data can be had."""
+    bucket = _weather_bucket(location)
+    with _weather_lock:
+        entry = _weather_cache.get(bucket)
+        if entry and entry["expires_at"] > time.time():
+            entry["hits"] += 1
+            _weather_cache.move_to_end(bucket)
+            WEATHER_STATS["hits"] += 1
+            return entry
+        pending = _weather_inflight.get(bucket)
+        if pending is None:
+            pending = _weather_inflight[bucket] = Future()
+            leader = True
+            WEATHER_STATS["misses"] += 1
+        else:
+            leader = False
+            WEATHER_STATS["coalesced"] += 1
+    if not leader:
+        return pending.result(timeout=TOOL_REGISTRY["weather"].max_timeout + 2)
+    try:
+        fresh = _fetch_weather(location)
+        fresh["hits"] = 1
+        _store_weather(bucket, fresh)
+        pending.set_result(fresh)
+        return fresh
+    except Exception as e:
+        with _weather_lock:
+            WEATHER_STATS["errors"] += 1
+            if entry:
+                WEATHER_STATS["stale_served"] += 1
+        if entry:
+            # An expired answer beats none while the provider is failing
+            pending.set_result(entry)
+            return entry
+        pending.set_exception(e)
+        raise
+    finally:
+        with _weather_lock:
+            _weather_inflight.pop(bucket, None)
+
+def weather(location: str) -> str:
+    """Get current weather conditions and today's high/low temperature for a place.
+
+    Args:
+        location: City name (optionally with country), postcode, or "lat,lon".
+    """
+    if not WEATHER_API_KEY:
+        return ""
+    try:
+        entry = weather_lookup(location)
+        print(f"🌦️ [Weather] {entry['place']} (age {time.time() - entry['fetched_at']:.0f}s)")
+        return entry["text"]
+    except CircuitOpenError as e:
+        print(f"🚧 [Weather] {e}")
+        return "The weather service is temporarily unavailable. Please try again in a little while."
+    except Exception as e:
+        print(f"❌ [Weather] API error: {e}")
+        return f"I couldn't get the weather for {location} right now."
+
+def refresh_popular_weather() -> int:
+    """Refetch the most-requested buckets that would expire before the next pass."""
+    horizon = time.time() + WEATHER_REFRESH_INTERVAL_S
+    with _weather_lock:
+        due = sorted(
+            (e for e in _weather_cache.values() if e["hits"] and e["expires_at"] <= horizon),
+            key=lambda e: e["hits"], reverse=True,
+        )[:WEATHER_REFRESH_TOP]
+    refreshed = 0
+    for entry in due:
+        try:
+            fresh = _fetch_weather(entry["query"])
+            # Halve the count so popularity tracks recent demand
+            fresh["hits"] = entry["hits"] // 2
+            with _weather_lock:
+                _weather_cache.pop(entry["bucket"] or "", None)
+            _store_weather(fresh["bucket"] or entry["query"], fresh)
+            refreshed += 1
+        except Exception as e:
+            with _weather_lock:
+                WEATHER_STATS["errors"] += 1
+            print(f"⚠️ [Weather] background refresh failed for {entry['place']}: {e}")
+    with _weather_lock:
+        WEATHER_STATS["refreshes"] += refreshed
+    return refreshed
+
+async def _weather_refresh_loop():
+    while True:
+        await asyncio.sleep(WEATHER_REFRESH_INTERVAL_S)
+        if WEATHER_API_KEY and _weather_cache:
+            try:
+                await run_blocking("weather", refresh_popular_weather)
+            except Exception as e:
+                print(f"⚠️ [Weather] refresh loop error: {e}")
+
+@app.on_event("startup")
+async def _start_weather_refresh():
+    if WEATHER_REFRESH_TOP > 0:
+        asyncio.get_running_loop().create_task(_weather_refresh_loop())
+
+def _weather_metrics() -> dict:
+    with _weather_lock:
+        fetch_ms = sorted(WEATHER_STATS["fetch_ms"])
+        return {
+            "enabled": bool(WEATHER_API_KEY),
+            "ttl_s": WEATHER_TTL_S,
+            "grid_deg": WEATHER_GRID_DEG,
+            "entries": len(_weather_cache),
+            "aliases": len(_weather_aliases),
+            **{k: v for k, v in WEATHER_STATS.items() if k != "fetch_ms"},
+            "fetch_ms": {"p50": round(_percentile(fetch_ms, 0.5), 1), "p95": round(_percentile(fetch_ms, 0.95), 1)},
+        }
+
+METRICS_SECTIONS["weather"] = _weather_metrics
+
 # --- Spotify Helpers ---
 import time, base64
 
@@ -552,8 +2744,7 @@ def itunes_search(query: str, limit: int = 3):
     try:
         url = "https://itunes.apple.com/search"
         params = {"term": query, "media": "music", "entity": "song", "limit": limit}
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
+        resp = TOOL_REGISTRY["itunes"].request("GET", url, params=params)
         data = resp.json().get("results", [])
         results = []
         for it in data:
@@ -572,31 +2763,160 @@ def itunes_search(query: str, limit: int = 3):
         print(f"❌ iTunes search error: {e}")
         return []
 
+class ClientCredentialsToken:
+    """OAuth client-credentials token that is refreshed in the background before it expires.
+
+    get() returns the cached token without blocking while it is valid; inside the
+    refresh margin it also starts a background refresh. Fetches are single-flight
+    and run on their own thread, so a request never waits on a refresh. A timer
+    refreshes the token ahead of expiry even when nobody is asking. Only a cold
+    cache (first use before the startup prefetch lands) waits for the fetch.
+    """
+
+    def __init__(self, name: str, fetch, enabled, refresh_margin: float = 300.0, retry_after: float = 30.0):
+        self.name = name
+        self._fetch = fetch          # () -> (token, expires_in_s)
+        self._enabled = enabled      # () -> bool, whether credentials are configured
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._token: str | None = None
+        self._expires_at = 0.0
+        self._generation = 0
+        self._superseded = False
+        self._inflight: Future | None = None
+        self._timer: threading.Timer | None = None
+        self.fetches = 0
+        self.failures = 0
+        self.cold_waits = 0
+        self.background_refreshes = 0
+        self.last_error: str | None = None
+
+    def get(self, timeout: float = 10.0) -> str | None:
+        if not self._enabled():
+            return None
+        now = time.time()
+        with self._lock:
+            if self._token and self._expires_at > now:
+                if self._expires_at - now < self.refresh_margin:
+                    self._refresh_locked()
+                return self._token
+            pending = self._refresh_locked()
+            self.cold_waits += 1
+        try:
+            return pending.result(timeout=timeout)
+        except Exception:
+            return None
+
+    def prefetch(self):
+        """Start a background fetch now (startup, credential change, refresh timer)."""
+        if self._enabled():
+            with self._lock:
+                self._refresh_locked()
+
+    def reset(self):
+        """Credentials changed: fetch with the new ones; the old token serves until the swap."""
+        with self._lock:
+            self._generation += 1
+            self._inflight = None
+            self._superseded = True
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if not self._enabled():
+                self._token, self._expires_at = None, 0.0
+        self.prefetch()
+
+    def _refresh_locked(self) -> Future:
+        if self._inflight is None:
+            self._inflight = Future()
+            threading.Thread(
+                target=self._run, args=(self._generation, self._inflight, self._token is not None),
+                name=f"ava-token-{self.name}", daemon=True,
+            ).start()
+        return self._inflight
+
+    def _run(self, generation: int, pending: Future, background: bool):
+        token, expires_in, error = None, 0, None
+        try:
+            token, expires_in = self._fetch()
+        except Exception as e:
+            error = str(e)
+        with self._lock:
+            if generation != self._generation:
+                # Credentials changed mid-fetch; the newer fetch owns the token
+                pending.set_result(None)
+                return
+            self._inflight = None
+            self.fetches += 1
+            if token:
+                self._token, self._expires_at = token, time.time() + expires_in
+                self._superseded = False
+                self.background_refreshes += background
+                self._schedule_locked(max(1.0, expires_in - self.refresh_margin))
+            else:
+                self.failures += 1
+                self.last_error = error or "no token in response"
+                if self._superseded:
+                    self._token, self._expires_at = None, 0.0
+                self._schedule_locked(self.retry_after)
+        if token:
+            print(f"🎫 {self.name} token fetched OK ({'background' if background else 'cold'})")
+        else:
+            print(f"❌ {self.name} token error: {self.last_error}")
+        pending.set_result(token)
+
+    def _schedule_locked(self, delay: float):
+        if self._timer:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self.prefetch)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self._enabled(),
+                "valid": bool(self._token) and self._expires_at > time.time(),
+                "expires_in_s": round(max(0.0, self._expires_at - time.time()), 1),
+                "refresh_margin_s": self.refresh_margin,
+                "fetches": self.fetches,
+                "background_refreshes": self.background_refreshes,
+                "cold_waits": self.cold_waits,
+                "failures": self.failures,
+                "last_error": self.last_error,
+            }
+
+def _fetch_spotify_token() -> tuple[str | None, int]:
+    """Client Credentials Flow: one token request with the current app credentials."""
+    token_url = "https://accounts.spotify.com/api/token"
+    creds = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()
+    b64 = base64.b64encode(creds).decode()
+    headers = {"Authorization": f"Basic {b64}", "Content-Type": "application/x-www-form-urlencoded"}
+    data = {"grant_type": "client_credentials"}
+    resp = TOOL_REGISTRY["spotify_auth"].request("POST", token_url, headers=headers, data=data)
+    tok = resp.json()
+    return tok.get("access_token"), int(tok.get("expires_in", 3600))
+
+SPOTIFY_TOKEN = ClientCredentialsToken(
+    "Spotify", _fetch_spotify_token,
+    enabled=lambda: bool(SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET),
+)
+
 def _get_spotify_token() -> str | None:
-    """Client Credentials Flow: fetch and cache app token."""
-    if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET:
-        return None
-    now = int(time.time())
-    if _spotify_token_cache["access_token"] and _spotify_token_cache["expires_at"] - 30 > now:
-        return _spotify_token_cache["access_token"]
-    try:
-        token_url = "https://accounts.spotify.com/api/token"
-        creds = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()
-        b64 = base64.b64encode(creds).decode()
-        headers = {"Authorization": f"Basic {b64}", "Content-Type": "application/x-www-form-urlencoded"}
-        data = {"grant_type": "client_credentials"}
-        resp = requests.post(token_url, headers=headers, data=data, timeout=10)
-        resp.raise_for_status()
-        tok = resp.json()
-        access = tok.get("access_token")
-        expires_in = int(tok.get("expires_in", 3600))
-        _spotify_token_cache["access_token"] = access
-        _spotify_token_cache["expires_at"] = now + expires_in
-        print("🎫 Spotify token fetched OK")
-        return access
-    except Exception as e:
-        print(f"❌ Spotify token error: {e}")
-        return None
+    return SPOTIFY_TOKEN.get()
+
+def _on_spotify_credentials(changed: set[str]):
+    if changed & {"SPOTIFY_CLIENT_ID", "SPOTIFY_CLIENT_SECRET"}:
+        SPOTIFY_TOKEN.reset()
+
+CREDENTIAL_LISTENERS["spotify_token"] = _on_spotify_credentials
+
+METRICS_SECTIONS["credentials"] = lambda: {
+    **CREDENTIAL_STATS,
+    "configured": {name: bool(globals()[name]) for name in PROVIDER_KEYS},
+    "spotify_token": SPOTIFY_TOKEN.stats(),
+}
 
 def spotify_search(query: str, limit: int = 3, session_id: str | None = None, *, market: str = "US"):
     """Search tracks and return simplified list.
@@ -614,8 +2934,7 @@ def spotify_search(query: str, limit: int = 3, session_id: str | None = None, *,
             "include_external": "audio",      # include results with external audio previews
         }
         headers = {"Authorization": f"Bearer {token}"}
-        resp = requests.get("https://api.spotify.com/v1/search", params=params, headers=headers, timeout=10)
-        resp.raise_for_status()
+        resp = TOOL_REGISTRY["spotify"].request("GET", "https://api.spotify.com/v1/search", params=params, headers=headers)
         data = resp.json()
         items = (data.get("tracks") or {}).get("items") or []
         results = []
@@ -643,6 +2962,1412 @@ def spotify_search(query: str, limit: int = 3, session_id: str | None = None, *,
         print(f"❌ Spotify search error: {e}")
         return []
 
+# --- Tool Execution ---
+# Gemini may ask for several tools in one response (e.g. a web search plus a
+# music lookup). Every function_call part runs concurrently on its provider's
+# executor with a per-tool timeout, and all FunctionResponses go back to
+# Gemini in a single follow-up turn, so a multi-tool answer costs the slowest
+# tool rather than the sum.
+
+# Executor that runs each Gemini tool
+TOOL_PROVIDERS = {"tavily_search": "tavily", "spotify_search": "spotify", "weather": "weather"}
+# Seconds to wait for each tool before answering Gemini with a timeout error
+TOOL_TIMEOUTS = {"tavily_search": 15.0, "spotify_search": 12.0, "weather": 10.0}
+# Upper bound on Gemini -> tools -> Gemini round trips for one answer
+MAX_TOOL_ROUNDS = int(os.getenv("AVA_MAX_TOOL_ROUNDS", "3"))
+
+def get_function_calls(response) -> list:
+    """Return every function_call part of a Gemini response (or streamed chunk)."""
+    try:
+        parts = response.candidates[0].content.parts
+    except (AttributeError, IndexError):
+        return []
+    return [p.function_call for p in parts if getattr(p, 'function_call', None)]
+
+def response_text(response) -> str:
+    """Join the text parts of a Gemini response without raising on function-call parts."""
+    try:
+        parts = response.candidates[0].content.parts
+    except (AttributeError, IndexError):
+        return ""
+    return "".join(p.text for p in parts if getattr(p, 'text', None))
+
+def run_tool(name: str, args: dict, session_id: str | None):
+    """Execute one Gemini tool and return its raw result.
+    Call from a worker thread; each provider call goes through its own executor."""
+    if name == 'tavily_search' and 'query' in args:
+        # Tool calls carry no request, so the session is the client for per-client limits
+        try:
+            with ADMISSION["tavily"].slot(session_id or "anonymous"):
+                return call_in_executor("tavily", tavily_search, query=args['query'])
+        except AdmissionBusy as e:
+            return {"error": f"Web search is busy; retry in {e.retry_after}s.", "retry_after": e.retry_after}
+    if name == 'spotify_search' and 'query' in args:
+        # Prefer Spotify; if no preview, try iTunes fallback
+        sp = call_in_executor("spotify", spotify_search, args['query'], limit=3, session_id=session_id, market="US")
+        if not any((r or {}).get('preview_url') for r in (sp or [])):
+            it = call_in_executor("spotify", itunes_search, args['query'], limit=3)
+            return it or sp
+        return sp
+    if name == 'weather':
+        location = args.get('location') or WEATHER_DEFAULT_LOCATION
+        if not location:
+            return {"error": "No location given; ask the user which place they mean."}
+        return call_in_executor("weather", weather, location)
+    return {"error": f"Unknown tool or missing arguments: {name}"}
+
+def _submit_tool_calls(calls: list, session_id: str | None) -> list[dict]:
+    submitted = []
+    for fc in calls:
+        args = dict(fc.args or {})
+        provider = TOOL_PROVIDERS.get(fc.name, "gemini")
+        print(f"🛠️ Calling tool: {fc.name} {args}")
+        submitted.append({
+            "name": fc.name,
+            "args": args,
+            "timeout": TOOL_TIMEOUTS.get(fc.name, 15.0),
+            "started": time.perf_counter(),
+            "future": PROVIDER_EXECUTORS[provider].submit(run_tool, fc.name, args, session_id),
+        })
+    return submitted
+
+def _tool_outcome(item: dict, result=None, error: str | None = None) -> dict:
+    elapsed_ms = round((time.perf_counter() - item["started"]) * 1000, 1)
+    if error:
+        print(f"❌ Tool {item['name']} failed after {elapsed_ms}ms: {error}")
+        return {"name": item["name"], "args": item["args"], "ok": False, "result": {"error": error}, "elapsed_ms": elapsed_ms}
+    print(f"✅ Tool {item['name']} finished in {elapsed_ms}ms")
+    return {"name": item["name"], "args": item["args"], "ok": bool(result), "result": result, "elapsed_ms": elapsed_ms}
+
+def execute_tool_calls(calls: list, session_id: str | None) -> list[dict]:
+    """Run all function calls concurrently from a worker thread; results keep call order."""
+    from concurrent.futures import TimeoutError as FutureTimeout
+    outcomes = []
+    for item in _submit_tool_calls(calls, session_id):
+        remaining = item["timeout"] - (time.perf_counter() - item["started"])
+        try:
+            outcomes.append(_tool_outcome(item, item["future"].result(timeout=max(remaining, 0))))
+        except FutureTimeout:
+            item["future"].cancel()
+            outcomes.append(_tool_outcome(item, error=f"{item['name']} timed out after {item['timeout']:g}s"))
+        except Exception as e:
+            outcomes.append(_tool_outcome(item, error=str(e)))
+    return outcomes
+
+async def execute_tool_calls_async(calls: list, session_id: str | None) -> list[dict]:
+    """Async variant of execute_tool_calls for request handlers."""
+    async def _await(item):
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(item["future"]), timeout=item["timeout"])
+            return _tool_outcome(item, result)
+        except asyncio.TimeoutError:
+            return _tool_outcome(item, error=f"{item['name']} timed out after {item['timeout']:g}s")
+        except Exception as e:
+            return _tool_outcome(item, error=str(e))
+    return list(await asyncio.gather(*[_await(item) for item in _submit_tool_calls(calls, session_id)]))
+
+def function_response_parts(outcomes: list[dict]) -> list:
+    """Build one FunctionResponse part per executed call for the follow-up turn."""
+    parts = []
+    for o in outcomes:
+        result = o["result"]
+        response = result if isinstance(result, dict) else {"result": result}
+        parts.append(genai.protos.Part(function_response=genai.protos.FunctionResponse(name=o["name"], response=response)))
+    return parts
+
+# --- Intent Router ---
+# Every final transcript and text query passes through route_intent() before
+# Gemini. One table of precompiled patterns (plus a keyword classifier for
+# news-style questions) picks out deterministic requests: time, date, stop,
+# clear chat, "play the second one", weather and explicit web searches. Local intents are
+# answered in-process; tool intents call their tool directly on its executor.
+# Anything unmatched, or an intent whose handler declines (no recent Spotify
+# results, no Tavily or weather key), falls through to the LLM. Disable with AVA_INTENT_ROUTER=0.
+INTENT_ROUTER_ENABLED = os.getenv("AVA_INTENT_ROUTER", "1").strip().lower() not in ("0", "false", "no")
+
+_INTENT_STRIP = re.compile(r"[^\w\s']+")
+_INTENT_SPACE = re.compile(r"\s+")
+_INTENT_POLITE = r"(?:(?:hey |ok |okay )?(?:ava )?(?:please )?)"
+_INTENT_TAIL = r"(?: please| now| right now| for me)*"
+# Forecast questions ("weather in paris tomorrow") need the LLM, not today's conditions
+_INTENT_NOT_LATER = (
+    r"(?!.*\b(?:tomorrow|tonight|later|weekend|next \w+|this (?:week|evening|afternoon|morning)"
+    r"|monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b)"
+)
+
+_ORDINALS = {
+    "first": 1, "one": 1, "1": 1,
+    "second": 2, "two": 2, "2": 2,
+    "third": 3, "three": 3, "3": 3,
+    "fourth": 4, "four": 4, "4": 4,
+    "fifth": 5, "five": 5, "5": 5,
+}
+
+# (intent, kind, provider, pattern); first match wins. "tool" intents count as a
+# tool call. Intents with a provider run on its executor, the rest run inline.
+INTENT_PATTERNS: tuple = (
+    ("stop", "local", None, re.compile(
+        rf"^{_INTENT_POLITE}(?:stop(?: talking| it| that)?|be quiet|quiet|shut up|cancel(?: that)?|never ?mind|that's enough|enough){_INTENT_TAIL}$")),
+    ("clear_chat", "local", "db", re.compile(
+        rf"^{_INTENT_POLITE}(?:(?:clear|reset|wipe|erase) (?:the |our |my |this )?(?:chat|conversation)(?: history)?|clear (?:the |my )?history|start over|start (?:a )?new (?:chat|conversation)|new (?:chat|conversation)){_INTENT_TAIL}$")),
+    ("time", "local", None, re.compile(
+        rf"^{_INTENT_POLITE}(?:what(?:'s| is) the (?:current )?time|what time is it|(?:tell me|do you know) (?:the time|what time it is)|(?:the )?time){_INTENT_TAIL}$")),
+    ("date", "local", None, re.compile(
+        rf"^{_INTENT_POLITE}(?:what(?:'s| is) (?:the date|today's date|the date today)|what day is (?:it|today)|(?:tell me )?today's date|what's today){_INTENT_TAIL}$")),
+    ("play_selection", "tool", "spotify", re.compile(
+        rf"^{_INTENT_POLITE}(?:play|choose|select|pick) (?:the )?(?:number |track |song )?(first|second|third|fourth|fifth|one|two|three|four|five|[1-5])(?: one| track| song| result)?{_INTENT_TAIL}$")),
+    ("weather", "tool", "weather", re.compile(
+        rf"^{_INTENT_NOT_LATER}{_INTENT_POLITE}(?:what(?:'s| is) the |how(?:'s| is) the |tell me the |check the )?(?:weather|temperature)(?: like)?(?: (?:today|now|right now|outside))?(?: (?:in|at|for) (.+?))?(?: today| now| right now)?{_INTENT_TAIL}$")),
+    ("web_search", "tool", "tavily", re.compile(
+        rf"^{_INTENT_POLITE}(?:search (?:the web )?for|look up|google|web search(?: for)?|find info on)\s+(.+?){_INTENT_TAIL}$")),
+)
+
+# Lightweight classifier: news-style questions go straight to web search with the full text
+_NEWS_HINTS = re.compile(r"\b(?:latest|news (?:about|on)|update on|headlines|happening today)\b")
+
+INTENT_STATS: dict[str, Any] = {"routed": 0, "llm": 0, "declined": 0, "route_ms": deque(maxlen=512), "intents": {}}
+_intent_stats_lock = threading.Lock()
+
+def normalize_utterance(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so patterns stay simple."""
+    return _INTENT_SPACE.sub(" ", _INTENT_STRIP.sub(" ", (text or "").lower())).strip()
+
+def route_intent(text: str) -> dict | None:
+    """Classify an utterance; returns {"intent", "kind", "provider", "args"} or None for the LLM."""
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    started = time.perf_counter()
+    norm = normalize_utterance(text)
+    match = None
+    for intent, kind, provider, pattern in INTENT_PATTERNS:
+        m = pattern.search(norm)
+        if not m:
+            continue
+        if intent == "play_selection":
+            args = {"index": _ORDINALS[m.group(1)]}
+        elif intent == "weather":
+            args = {"location": m.group(1) or ""}
+        elif intent == "web_search":
+            # Keep the query's punctuation ("python 3.13") by matching the raw text again
+            args = {"query": (pattern.search(text.strip().lower()) or m).group(1)}
+        else:
+            args = {}
+        match = {"intent": intent, "kind": kind, "provider": provider, "args": args}
+        break
+    if match is None and _NEWS_HINTS.search(norm):
+        match = {"intent": "web_search", "kind": "tool", "provider": "tavily", "args": {"query": text.strip()}}
+    with _intent_stats_lock:
+        INTENT_STATS["routed"] += 1
+        INTENT_STATS["route_ms"].append((time.perf_counter() - started) * 1000)
+    return match
+
+def _intent_time(session_id):
+    return {"text": f"It's {datetime.now():%I:%M %p}.".replace(" 0", " ", 1)}
+
+def _intent_date(session_id):
+    return {"text": f"Today is {datetime.now():%A, %B %d, %Y}.".replace(" 0", " ", 1)}
+
+def _intent_stop(session_id):
+    return {"text": "Okay, stopping.", "action": "stop"}
+
+def _intent_clear_chat(session_id):
+    # In-memory context, plus the stored history /llm/query rebuilds context from
+    chat_sessions.pop(session_id, None)
+    spotify_last_results.pop(session_id, None)
+    if SQLALCHEMY_AVAILABLE and session_id:
+        try:
+            run_db(clear_messages, session_id)
+        except Exception as e:
+            print(f"⚠️ Could not clear stored history for session {session_id}: {e}")
+            return {"text": "I've reset this conversation, but its saved history could not be deleted.", "action": "clear_chat"}
+    print(f"🧹 Cleared chat history for session (voice/text intent): {session_id}")
+    return {"text": "Done, I've cleared our conversation.", "action": "clear_chat"}
+
+def _intent_play_selection(session_id, index: int):
+    results = spotify_last_results.get(session_id) or []
+    if not 0 < index <= len(results):
+        return None
+    chosen = results[index - 1]
+    query = f"{chosen.get('name')} {chosen.get('artists')}"
+    # If selected has no preview, try any playable preview in recent results,
+    # then a second query with a stronger market hint, then the iTunes fallback
+    playable = chosen if chosen.get('preview_url') else next((r for r in results if r.get('preview_url')), chosen)
+    for search in (
+        lambda: call_in_executor("spotify", spotify_search, query, limit=3, session_id=session_id, market="US"),
+        lambda: call_in_executor("spotify", itunes_search, query, limit=3),
+    ):
+        if playable.get('preview_url'):
+            break
+        try:
+            playable = next((r for r in search() if r.get('preview_url')), playable)
+        except Exception:
+            pass
+    if chosen.get('preview_url'):
+        text = f"Playing: {chosen.get('name')} — {chosen.get('artists')}"
+    elif playable.get('preview_url'):
+        text = f"No preview for selection. Playing available preview: {playable.get('name')} — {playable.get('artists')}"
+    else:
+        text = f"No preview available. You can open it in Spotify: {chosen.get('name')} — {chosen.get('artists')}"
+    # If we found a playable one, send just that; otherwise send chosen only
+    return {"text": text, "results": [playable if playable.get('preview_url') else chosen]}
+
+def _intent_web_search(session_id, query: str):
+    if not TAVILY_API_KEY:
+        return None
+    try:
+        with ADMISSION["tavily"].slot(session_id or "anonymous"):
+            result = call_in_executor("tavily", tavily_search, query)
+    except AdmissionBusy as e:
+        return {"text": f"Web search is busy right now; please try again in {e.retry_after} seconds.", "busy": e.payload()}
+    return {"text": result} if result else None
+
+def _intent_weather(session_id, location: str):
+    location = location or WEATHER_DEFAULT_LOCATION
+    if not (WEATHER_API_KEY and location):
+        return None
+    result = call_in_executor("weather", weather, location)
+    return {"text": result} if result else None
+
+INTENT_HANDLERS = {
+    "stop": _intent_stop,
+    "clear_chat": _intent_clear_chat,
+    "time": _intent_time,
+    "date": _intent_date,
+    "play_selection": _intent_play_selection,
+    "weather": _intent_weather,
+    "web_search": _intent_web_search,
+}
+
+def run_intent(match: dict, session_id: str | None, turn_id: str | None = None) -> dict | None:
+    """Run the handler for a routed intent; None means it declined and the LLM should answer."""
+    started = time.perf_counter()
+    if match["kind"] == "tool":
+        USAGE.record(session_id, turn_id, tool_calls=1)
+    try:
+        reply = INTENT_HANDLERS[match["intent"]](session_id, **match["args"])
+    except Exception as e:
+        print(f"⚠️ Intent handler '{match['intent']}' failed: {e}")
+        reply = None
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _intent_stats_lock:
+        if reply is None:
+            INTENT_STATS["declined"] += 1
+        else:
+            stats = INTENT_STATS["intents"].setdefault(match["intent"], {"hits": 0, "latency_ms": deque(maxlen=256)})
+            stats["hits"] += 1
+            stats["latency_ms"].append(elapsed_ms)
+    if reply is not None:
+        reply["intent"] = match["intent"]
+        print(f"🧭 Intent '{match['intent']}' answered in {elapsed_ms:.1f} ms")
+    return reply
+
+def _count_llm_fallthrough():
+    with _intent_stats_lock:
+        INTENT_STATS["llm"] += 1
+
+def answer_intent(text: str, session_id: str | None, turn_id: str | None = None) -> dict | None:
+    """Blocking variant for worker threads (SDK callbacks, streaming producers)."""
+    match = route_intent(text)
+    reply = run_intent(match, session_id, turn_id) if match else None
+    if reply is None:
+        _count_llm_fallthrough()
+    return reply
+
+async def answer_intent_async(text: str, session_id: str | None, turn_id: str | None = None) -> dict | None:
+    """Local intents answer inline; tool intents run on their provider's executor."""
+    match = route_intent(text)
+    reply = None
+    if match and match["provider"] is None:
+        reply = run_intent(match, session_id, turn_id)
+    elif match:
+        reply = await run_blocking(match["provider"], run_intent, match, session_id, turn_id)
+    if reply is None:
+        _count_llm_fallthrough()
+    return reply
+
+def _intent_metrics() -> dict:
+    with _intent_stats_lock:
+        route_ms = sorted(INTENT_STATS["route_ms"])
+        intents = {}
+        for name, stats in INTENT_STATS["intents"].items():
+            lat = sorted(stats["latency_ms"])
+            intents[name] = {
+                "hits": stats["hits"],
+                "latency_ms": {"p50": round(_percentile(lat, 0.5), 2), "p95": round(_percentile(lat, 0.95), 2)},
+            }
+        return {
+            "enabled": INTENT_ROUTER_ENABLED,
+            "routed": INTENT_STATS["routed"],
+            "llm": INTENT_STATS["llm"],
+            "declined": INTENT_STATS["declined"],
+            "route_ms": {"p50": round(_percentile(route_ms, 0.5), 3), "p95": round(_percentile(route_ms, 0.95), 3)},
+            "intents": intents,
+        }
+
+METRICS_SECTIONS["intents"] = _intent_metrics
+
+# --- Speech Text Normalization (pre-TTS) ---
+# Display text (chat bubbles, JSON responses) is left untouched; only the copy
+# sent to Murf is rewritten for speech: Tavily "Sources:" blocks, URLs,
+# markdown, code blocks and emoji are dropped, dashes and line breaks become
+# pauses, and symbols and abbreviations are spelled out ("14°C" -> "14 degrees
+# Celsius", "e.g." -> "for example"). Plain digits are left to the voice, which
+# reads them natively. SpeechNormalizer applies the same rules to a token
+# stream, holding text back only until a safe boundary. Disable with
+# AVA_TTS_NORMALIZE=0.
+TTS_NORMALIZE_ENABLED = os.getenv("AVA_TTS_NORMALIZE", "1").strip().lower() not in ("0", "false", "no")
+
+_SPEECH_SOURCES = re.compile(r"(?:^|\n)\s*(?:\*\*)?Sources:?(?:\*\*)?\s*(?:\n|$)", re.IGNORECASE)
+_SPEECH_MARKUP = (
+    (re.compile(r"!\[[^\]]*\]\([^)]*\)"), ""),  # images
+    (re.compile(r"\[([^\]]+)\]\([^)]*\)"), r"\1"),  # links -> label
+    (re.compile(r"\(?<?\b(?:https?://|www\.)[^\s<>()]+>?\)?"), ""),  # bare URLs
+    (re.compile(r"^\s{0,3}#{1,6}\s*", re.MULTILINE), ""),  # headings
+    (re.compile(r"^\s*(?:[-*+•]|\d{1,2}[.)])\s+", re.MULTILINE), ""),  # list markers
+    (re.compile(r"^\s*>\s?", re.MULTILINE), ""),  # block quotes
+    (re.compile(r"[*`~]+|(?<!\w)_+|_+(?!\w)"), ""),  # emphasis, inline code
+    (re.compile(r"\s*\|\s*"), ", "),  # table cells
+    (re.compile("[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\uFE0F\u200D]+"), ""),  # emoji
+)
+_SPEECH_WORDS = (
+    (re.compile(r"(\d)\s*°\s*C\b"), r"\1 degrees Celsius"),
+    (re.compile(r"(\d)\s*°\s*F\b"), r"\1 degrees Fahrenheit"),
+    (re.compile(r"(\d)\s*°"), r"\1 degrees"),
+    (re.compile(r"(\d)\s*%"), r"\1 percent"),
+    (re.compile(r"(\d)\s*km/h\b"), r"\1 kilometers per hour"),
+    (re.compile(r"(\d)\s*mph\b"), r"\1 miles per hour"),
+    (re.compile(r"\$\s?(\d[\d,]*(?:\.\d+)?)"), r"\1 dollars"),
+    (re.compile(r"₹\s?(\d[\d,]*(?:\.\d+)?)"), r"\1 rupees"),
+    (re.compile(r"€\s?(\d[\d,]*(?:\.\d+)?)"), r"\1 euros"),
+    (re.compile(r"£\s?(\d[\d,]*(?:\.\d+)?)"), r"\1 pounds"),
+    (re.compile(r"(?<![\d-])(\d{1,3})\s*[-–]\s*(\d{1,3})\b(?![-\d])"), r"\1 to \2"),
+    (re.compile(r"\s&\s"), " and "),
+    (re.compile(r"\be\.g\.,?", re.IGNORECASE), "for example"),
+    (re.compile(r"\bi\.e\.,?", re.IGNORECASE), "that is"),
+    (re.compile(r"\betc\.", re.IGNORECASE), "et cetera."),
+    (re.compile(r"\bvs\.?(?=\s)", re.IGNORECASE), "versus"),
+    (re.compile(r"\bapprox\.", re.IGNORECASE), "approximately"),
+    (re.compile(r"\bDr\.(?=\s+[A-Z])"), "Doctor"),
+    (re.compile(r"\bMr\.(?=\s+[A-Z])"), "Mister"),
+    (re.compile(r"\bMrs\.(?=\s+[A-Z])"), "Missus"),
+)
+# After _SPEECH_WORDS, so numeric ranges ("10–20") are read as "10 to 20" first
+_SPEECH_PAUSES = (
+    (re.compile(r"\s*[—–]\s*|\s+-\s+"), ", "),  # dashes -> pause
+)
+_SPEECH_LINE_END = re.compile(r"([^\s.!?,:;])[ \t]*\n+")
+_SPEECH_TIDY = (
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"\s+([,.!?;:])"), r"\1"),
+    (re.compile(r"([,;:])(?:\s*[,;:])+"), r"\1"),
+    (re.compile(r"^[\s,;:.]+"), ""),
+)
+# Where a stream may be cut: after a line break or sentence end, else any space
+_SPEECH_BOUNDARY = re.compile(r"(?:\n|(?<!\d)[.!?;:](?=\s))")
+SPEECH_STREAM_MAX_HOLD = 160
+# An unclosed "(" or "[" stops holding text back past this many chars
+SPEECH_STREAM_MAX_OPEN_HOLD = 400
+
+SPEECH_TEXT_STATS: dict[str, dict] = {}
+_speech_stats_lock = threading.Lock()
+
+def _record_speech(source: str, chars_in: int, chars_out: int):
+    with _speech_stats_lock:
+        stats = SPEECH_TEXT_STATS.setdefault(source, {"strings": 0, "chars_in": 0, "chars_out": 0})
+        stats["strings"] += 1
+        stats["chars_in"] += chars_in
+        stats["chars_out"] += chars_out
+
+def _normalize_for_speech(text: str) -> str:
+    for pattern, repl in _SPEECH_MARKUP + _SPEECH_WORDS + _SPEECH_PAUSES:
+        text = pattern.sub(repl, text)
+    text = _SPEECH_LINE_END.sub(r"\1. ", text)
+    for pattern, repl in _SPEECH_TIDY:
+        text = pattern.sub(repl, text)
+    return text.strip()
+
+def _drop_code_and_sources(text: str) -> str:
+    text = re.sub(r"```.*?(?:```|$)", " ", text, flags=re.DOTALL)
+    m = _SPEECH_SOURCES.search(text)
+    return text[:m.start()] if m else text
+
+def speech_text(text: str, source: str = "rest") -> str:
+    """Spoken form of a complete TTS-bound string (never empty for non-empty input)."""
+    if not TTS_NORMALIZE_ENABLED or not text:
+        return text
+    spoken = _normalize_for_speech(_drop_code_and_sources(text)) or ("Here's the link." if "://" in text else text)
+    _record_speech(source, len(text), len(spoken))
+    return spoken
+
+class SpeechNormalizer:
+    """Streaming variant of speech_text for token-by-token TTS input.
+
+    feed() returns the speakable text up to the last safe boundary (line break
+    or sentence end, or any space once SPEECH_STREAM_MAX_HOLD chars are held),
+    so URLs, markdown links and code fences are never split mid-token. An
+    unclosed bracket holds text for at most SPEECH_STREAM_MAX_OPEN_HOLD chars. Once a
+    "Sources:" block starts, the rest of the stream is dropped.
+    """
+
+    def __init__(self, source: str = "stream"):
+        self.source = source
+        self._buffer = ""
+        self._in_code = False
+        self._dropping = False
+        self.chars_in = 0
+        self.chars_out = 0
+
+    def feed(self, chunk: str) -> str:
+        if not TTS_NORMALIZE_ENABLED:
+            return chunk
+        self.chars_in += len(chunk)
+        if self._dropping:
+            return ""
+        self._buffer += chunk
+        cut = self._safe_cut()
+        if cut <= 0:
+            return ""
+        segment, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return self._emit(segment)
+
+    def flush(self) -> str:
+        """Speak whatever is still held and report the stream's chars in/out."""
+        if not TTS_NORMALIZE_ENABLED:
+            return ""
+        segment, self._buffer = self._buffer, ""
+        out = self._emit(segment) if segment and not self._dropping else ""
+        _record_speech(self.source, self.chars_in, self.chars_out)
+        return out.strip()
+
+    def _safe_cut(self) -> int:
+        buf = self._buffer
+        # Hold while a markdown link or URL could still be open, unless the
+        # bracket looks like it will never close (a stray "(" in prose)
+        if (buf.count("[") > buf.count("]") or buf.count("(") > buf.count(")")) and len(buf) < SPEECH_STREAM_MAX_OPEN_HOLD:
+            return 0
+        cut = 0
+        for m in _SPEECH_BOUNDARY.finditer(buf):
+            cut = m.end()
+        if not cut and len(buf) >= SPEECH_STREAM_MAX_HOLD:
+            cut = buf.rfind(" ") + 1
+        return cut
+
+    def _emit(self, segment: str) -> str:
+        parts = segment.split("```")
+        speakable = []
+        for i, part in enumerate(parts):
+            if i:
+                self._in_code = not self._in_code
+            if not self._in_code:
+                speakable.append(part)
+        text = " ".join(speakable)
+        m = _SPEECH_SOURCES.search(text)
+        if m:
+            text, self._dropping = text[:m.start()], True
+        spoken = _normalize_for_speech(text)
+        if not spoken:
+            return ""
+        spoken += " "
+        self.chars_out += len(spoken)
+        return spoken
+
+def _speech_metrics() -> dict:
+    with _speech_stats_lock:
+        sources = {}
+        for name, stats in SPEECH_TEXT_STATS.items():
+            saved = stats["chars_in"] - stats["chars_out"]
+            sources[name] = {**stats, "saved_pct": round(100 * saved / stats["chars_in"], 1) if stats["chars_in"] else 0.0}
+        return {"enabled": TTS_NORMALIZE_ENABLED, "sources": sources}
+
+METRICS_SECTIONS["speech_text"] = _speech_metrics
+
+# --- Filler Audio (latency masking) ---
+# Short acknowledgments ("Got it.") and lookup notices ("Let me look that up.")
+# are synthesized once in the voice and sample rate of the streaming TTS,
+# cached under uploads/fillers, and streamed to the browser the moment a turn
+# ends or a tool call starts. The browser fades them out as soon as real TTS
+# audio arrives, so no extra Murf call is made per turn.
+
+# Voice and format of the /ws Murf stream (fillers must match it)
+MURF_STREAM_VOICE = "en-IN-priya"
+MURF_STREAM_SAMPLE_RATE = 44100
+FILLER_AUDIO_ENABLED = os.getenv("AVA_FILLER_AUDIO", "1").strip().lower() not in ("0", "false", "no")
+FILLER_DIR = UPLOAD_DIR / "fillers"
+FILLER_PHRASES = {
+    "ack": ["Got it.", "Okay.", "Hmm, let me think.", "Sure."],
+    "lookup": ["Let me look that up.", "One moment while I check.", "Let me find that for you."],
+}
+# kind -> list of {"id", "text", "audio_b64"}
+FILLER_LIBRARY: dict[str, list] = {}
+
+def _filler_path(text: str):
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+    return FILLER_DIR / f"{MURF_STREAM_VOICE}-{MURF_STREAM_SAMPLE_RATE}-{digest}.wav"
+
+def _synthesize_filler(text: str) -> bytes | None:
+    if not MURF_API_KEY:
+        return None
+    payload = {
+        "text": text,
+        "voiceId": MURF_STREAM_VOICE,
+        "format": "WAV",
+        "sampleRate": MURF_STREAM_SAMPLE_RATE,
+        "channelType": "MONO",
+        "encodeAsBase64": True,
+    }
+    resp = requests.post(
+        "https://api.murf.ai/v1/speech/generate",
+        json=payload,
+        headers={"api-key": MURF_API_KEY, "Content-Type": "application/json"},
+        timeout=20,
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    if data.get("encodedAudio"):
+        return base64.b64decode(data["encodedAudio"])
+    if data.get("audioFile"):
+        audio = requests.get(data["audioFile"], timeout=20)
+        audio.raise_for_status()
+        return audio.content
+    return None
+
+def prepare_filler_library():
+    """Load filler clips from disk, synthesizing (once) any that are missing."""
+    FILLER_DIR.mkdir(parents=True, exist_ok=True)
+    loaded = synthesized = 0
+    for kind, phrases in FILLER_PHRASES.items():
+        clips = []
+        for text in phrases:
+            path = _filler_path(text)
+            try:
+                if path.exists():
+                    audio = path.read_bytes()
+                    loaded += 1
+                else:
+                    audio = _synthesize_filler(text)
+                    if not audio:
+                        continue
+                    path.write_bytes(audio)
+                    synthesized += 1
+                clips.append({"id": path.stem, "text": text, "audio_b64": base64.b64encode(audio).decode()})
+            except Exception as e:
+                print(f"⚠️  Filler clip '{text}' unavailable: {e}")
+        FILLER_LIBRARY[kind] = clips
+    print(f"🗣️  Filler audio ready: {loaded} loaded, {synthesized} synthesized")
+
+def pick_filler(kind: str) -> dict | None:
+    clips = FILLER_LIBRARY.get(kind) or []
+    return random.choice(clips) if clips else None
+
+@app.on_event("startup")
+async def _warm_filler_library():
+    if FILLER_AUDIO_ENABLED:
+        PROVIDER_EXECUTORS["murf"].submit(prepare_filler_library)
+
+# --- Playback Telemetry ---
+# The browser plays /ws TTS through an AudioWorklet jitter buffer and reports
+# each turn back as {"type": "playback_stats", ...}: underruns, the jitter
+# target it settled on and time-to-first-sound. Aggregates are listed under
+# "playback" in /metrics.
+PLAYBACK_SAMPLES = 500
+PLAYBACK_STATS = {"turns": 0, "flushed_turns": 0, "underruns": 0, "turns_with_underruns": 0, "overflow_samples": 0}
+_playback_first_sound: deque = deque(maxlen=PLAYBACK_SAMPLES)
+_playback_targets: deque = deque(maxlen=PLAYBACK_SAMPLES)
+_playback_lock = threading.Lock()
+
+def record_playback_report(report: dict):
+    """Fold one client playback report into the aggregates (malformed fields are ignored)."""
+    def _num(name):
+        value = report.get(name)
+        return value if isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0 else None
+
+    underruns = int(_num("underruns") or 0)
+    with _playback_lock:
+        PLAYBACK_STATS["turns"] += 1
+        PLAYBACK_STATS["flushed_turns"] += bool(report.get("flushed"))
+        PLAYBACK_STATS["underruns"] += underruns
+        PLAYBACK_STATS["turns_with_underruns"] += underruns > 0
+        PLAYBACK_STATS["overflow_samples"] += int(_num("overflow_samples") or 0)
+        if _num("first_sound_ms") is not None:
+            _playback_first_sound.append(_num("first_sound_ms"))
+        if _num("target_ms") is not None:
+            _playback_targets.append(_num("target_ms"))
+
+def _playback_metrics() -> dict:
+    with _playback_lock:
+        stats = dict(PLAYBACK_STATS)
+        first_sound = sorted(_playback_first_sound)
+        targets = sorted(_playback_targets)
+    turns = stats["turns"]
+    return {
+        **stats,
+        "glitch_rate": round(stats["turns_with_underruns"] / turns, 4) if turns else 0.0,
+        "first_sound_ms": {"p50": _percentile(first_sound, 0.5), "p95": _percentile(first_sound, 0.95)},
+        "jitter_target_ms": {"p50": _percentile(targets, 0.5), "p95": _percentile(targets, 0.95)},
+    }
+
+METRICS_SECTIONS["playback"] = _playback_metrics
+
+# --- Session Flight Recorder ---
+# Opt-in: AVA_FLIGHT_RECORDER is the fraction of /ws sessions to record (0 =
+# off, the default; 1 = every session). A recording holds the inbound PCM and
+# every pipeline event (AssemblyAI turns, Gemini chunks and tool calls, Murf
+# chunks, messages sent to the browser) with its time offset, gzip-compressed
+# under uploads/recordings. A file stops growing at AVA_FLIGHT_MAX_MB (default
+# 20) and only the newest AVA_FLIGHT_KEEP recordings (default 50) are kept.
+# replay_session.py plays a recording back through /ws.
+#
+# File format (gzip): b"AVAREC1\n", then records of struct "<dBI" (seconds
+# since start, kind, payload length) followed by the payload. Kind 0 is
+# session metadata (JSON), 1 is inbound PCM16 @ 16 kHz, 2 is an event (JSON
+# with its name under "event" and "audio_s", the seconds of audio received
+# so far).
+import struct
+
+FLIGHT_SAMPLE_RATE = min(1.0, max(0.0, float(os.getenv("AVA_FLIGHT_RECORDER", "0"))))
+FLIGHT_DIR = UPLOAD_DIR / "recordings"
+FLIGHT_MAX_BYTES = int(float(os.getenv("AVA_FLIGHT_MAX_MB", "20")) * 1024 * 1024)
+FLIGHT_KEEP = max(1, int(os.getenv("AVA_FLIGHT_KEEP", "50")))
+FLIGHT_MAGIC = b"AVAREC1\n"
+FLIGHT_RECORD = struct.Struct("<dBI")
+FLIGHT_META, FLIGHT_AUDIO, FLIGHT_EVENT = 0, 1, 2
+FLIGHT_FLUSH_BYTES = 256 * 1024
+FLIGHT_STATS = {"sessions": 0, "recorded": 0, "active": 0, "bytes": 0, "truncated": 0, "rotated": 0, "write_errors": 0}
+_flight_stats_lock = threading.Lock()
+# A single writer thread keeps every recording's records in order
+PROVIDER_EXECUTORS["recorder"] = ProviderExecutor("recorder", 1)
+
+class NullFlightRecorder:
+    """Recorder for sessions that were not sampled: every call is a no-op."""
+    active = False
+
+    def audio(self, data: bytes):
+        pass
+
+    def event(self, name: str, **fields):
+        pass
+
+    def close(self):
+        pass
+
+NULL_FLIGHT_RECORDER = NullFlightRecorder()
+
+class FlightRecorder(NullFlightRecorder):
+    """Buffers one session's records in memory and appends them to its file on the recorder thread."""
+    active = True
+
+    def __init__(self, session_id: str):
+        self.started = time.perf_counter()
+        self.path = FLIGHT_DIR / f"{datetime.utcnow():%Y%m%dT%H%M%S}-{session_id[:12]}-{uuid.uuid4().hex[:6]}.avarec.gz"
+        self._lock = threading.Lock()
+        self._pending: list[bytes] = []
+        self._pending_bytes = 0
+        self._file = None
+        self.bytes = 0
+        self.audio_bytes = 0
+        self.truncated = False
+        self.closed = False
+        meta = {"session_id": session_id, "started_at": datetime.utcnow().isoformat() + "Z",
+                "sample_rate": STT_STREAM_SAMPLE_RATE, "version": 1}
+        self._append(FLIGHT_META, json.dumps(meta).encode())
+
+    def _append(self, kind: int, payload: bytes):
+        batch = None
+        with self._lock:
+            if self.truncated or self.closed:
+                return
+            record = FLIGHT_RECORD.pack(time.perf_counter() - self.started, kind, len(payload)) + payload
+            if self.bytes + len(record) > FLIGHT_MAX_BYTES:
+                self.truncated = True
+                with _flight_stats_lock:
+                    FLIGHT_STATS["truncated"] += 1
+                marker = json.dumps({"event": "recorder.truncated", "audio_s": self.audio_seconds()}).encode()
+                record = FLIGHT_RECORD.pack(time.perf_counter() - self.started, FLIGHT_EVENT, len(marker)) + marker
+            self.bytes += len(record)
+            self._pending.append(record)
+            self._pending_bytes += len(record)
+            if self._pending_bytes >= FLIGHT_FLUSH_BYTES:
+                batch, self._pending, self._pending_bytes = self._pending, [], 0
+        if batch:
+            PROVIDER_EXECUTORS["recorder"].submit(self._flush, batch)
+
+    def audio_seconds(self) -> float:
+        return round(self.audio_bytes / (2 * STT_STREAM_SAMPLE_RATE), 3)
+
+    def audio(self, data: bytes):
+        self.audio_bytes += len(data)
+        self._append(FLIGHT_AUDIO, bytes(data))
+
+    def event(self, name: str, **fields):
+        record = {"event": name, "audio_s": self.audio_seconds(), **fields}
+        self._append(FLIGHT_EVENT, json.dumps(record, default=str).encode())
+
+    def _flush(self, batch: list[bytes], close: bool = False):
+        try:
+            if self._file is None:
+                FLIGHT_DIR.mkdir(parents=True, exist_ok=True)
+                _rotate_flight_recordings()
+                self._file = gzip.open(self.path, "wb", compresslevel=4)
+                self._file.write(FLIGHT_MAGIC)
+            self._file.write(b"".join(batch))
+            with _flight_stats_lock:
+                FLIGHT_STATS["bytes"] += sum(len(r) for r in batch)
+            if close:
+                self._file.close()
+        except Exception as e:
+            with _flight_stats_lock:
+                FLIGHT_STATS["write_errors"] += 1
+            print(f"⚠️ [Recorder] write to {self.path.name} failed: {e}")
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            batch, self._pending = self._pending, []
+        with _flight_stats_lock:
+            FLIGHT_STATS["active"] -= 1
+        PROVIDER_EXECUTORS["recorder"].submit(self._flush, batch, True)
+        print(f"🛩️  Flight recording saved: {self.path.name} ({self.bytes / 1024:.0f} KB)")
+
+def _rotate_flight_recordings():
+    """Keep room for one more recording within AVA_FLIGHT_KEEP (oldest first out)."""
+    files = sorted(FLIGHT_DIR.glob("*.avarec.gz"), key=lambda p: p.stat().st_mtime)
+    for old in files[:max(0, len(files) - FLIGHT_KEEP + 1)]:
+        try:
+            old.unlink()
+            with _flight_stats_lock:
+                FLIGHT_STATS["rotated"] += 1
+        except OSError:
+            pass
+
+def start_flight_recorder(session_id: str) -> NullFlightRecorder:
+    """Sample this /ws session for recording (AVA_FLIGHT_RECORDER)."""
+    sampled = bool(FLIGHT_SAMPLE_RATE) and random.random() < FLIGHT_SAMPLE_RATE
+    with _flight_stats_lock:
+        FLIGHT_STATS["sessions"] += 1
+        if sampled:
+            FLIGHT_STATS["recorded"] += 1
+            FLIGHT_STATS["active"] += 1
+    if not sampled:
+        return NULL_FLIGHT_RECORDER
+    return FlightRecorder(session_id)
+
+def flight_summary(payload: dict) -> dict:
+    """An outbound /ws message without its audio: base64 fields become byte counts."""
+    summary = {}
+    for key, value in payload.items():
+        if key.endswith("_b64") and isinstance(value, str):
+            summary[key[:-4] + "_bytes"] = len(value) * 3 // 4
+        else:
+            summary[key] = value
+    return summary
+
+def _flight_metrics() -> dict:
+    with _flight_stats_lock:
+        return {"sample_rate": FLIGHT_SAMPLE_RATE, "max_bytes": FLIGHT_MAX_BYTES, **FLIGHT_STATS}
+
+METRICS_SECTIONS["flight_recorder"] = _flight_metrics
+
+# --- Audio Normalization (pre-STT) ---
+# Browsers upload whatever MediaRecorder produces (often 48 kHz stereo
+# WebM/Opus or WAV). Before transcription the clip is decoded, downmixed to
+# mono, resampled to 16 kHz, trimmed of leading/trailing silence and re-encoded
+# as 16-bit WAV, so fewer bytes are uploaded and fewer audio seconds billed.
+# WAV is decoded with the stdlib; other containers need PyAV or an ffmpeg
+# binary, otherwise the upload is sent unchanged.
+# NumPy is imported lazily (first clip or warm-up) to keep it off the cold-start path
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+np = LazyModule("numpy")
+
+import io
+import shutil
+import subprocess
+import wave
+
+AUDIO_NORMALIZE_ENABLED = NUMPY_AVAILABLE and os.getenv("AVA_AUDIO_NORMALIZE", "1").strip().lower() not in ("0", "false", "no")
+STT_SAMPLE_RATE = 16000
+TRIM_THRESHOLD_DB = float(os.getenv("AVA_TRIM_DB", "-45"))
+TRIM_PADDING_S = 0.2
+FFMPEG_PATH = shutil.which("ffmpeg")
+
+PROVIDER_EXECUTORS["audio"] = ProviderExecutor("audio", _executor_size("audio", 2))
+AUDIO_NORM_STATS = {"clips": 0, "normalized": 0, "passthrough": 0, "silent": 0,
+                    "bytes_in": 0, "bytes_out": 0, "seconds_in": 0.0, "seconds_out": 0.0}
+
+def _decode_wav(source):
+    with wave.open(source, "rb") as w:
+        channels, width, rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+        frames = w.readframes(w.getnframes())
+    if width == 1:
+        data = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        data = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768
+    elif width == 4:
+        data = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"unsupported WAV sample width {width}")
+    return data.reshape(-1, channels), rate
+
+def _decode_with_av(source):
+    import av
+    chunks, rate, channels = [], None, None
+    with av.open(source) as container:
+        stream = container.streams.audio[0]
+        resampler = av.AudioResampler(format="flt")  # packed float32, native layout and rate
+        for frame in container.decode(stream):
+            for out in resampler.resample(frame):
+                channels = len(out.layout.channels)
+                rate = out.sample_rate
+                chunks.append(out.to_ndarray().reshape(-1, channels))
+    if not chunks:
+        raise ValueError("no audio frames")
+    return np.concatenate(chunks), rate
+
+def _on_disk(source) -> bool:
+    """True when the upload has an OS file behind it (a spooled upload that rolled over to disk)."""
+    if not getattr(source, "_rolled", True):
+        return False  # still in memory; fileno() would force a rollover
+    try:
+        source.fileno()
+        return True
+    except (AttributeError, OSError, ValueError):
+        return False
+
+def _decode_with_ffmpeg(source):
+    # Fixed stereo/48 kHz output so the shape is known; NumPy does the real downmix/resample.
+    # A spooled file is read by ffmpeg straight from its descriptor; only in-memory clips are copied.
+    feed = {"stdin": source} if _on_disk(source) else {"input": source.read()}
+    proc = subprocess.run(
+        [FFMPEG_PATH, "-v", "error", "-i", "pipe:0", "-f", "f32le", "-ac", "2", "-ar", "48000", "pipe:1"],
+        capture_output=True, timeout=30, check=True, **feed,
+    )
+    return np.frombuffer(proc.stdout, dtype="<f4").reshape(-1, 2), 48000
+
+def decode_audio_upload(source):
+    """Decode a seekable binary file object; return (float32 array shaped [frames, channels], sample_rate)."""
+    source.seek(0)
+    header = source.read(12)
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        try:
+            source.seek(0)
+            return _decode_wav(source)
+        except (wave.Error, ValueError):
+            pass  # e.g. float WAV; let a real decoder handle it
+    try:
+        source.seek(0)
+        return _decode_with_av(source)
+    except ImportError:
+        pass
+    if FFMPEG_PATH:
+        source.seek(0)
+        return _decode_with_ffmpeg(source)
+    raise ValueError("no decoder available for this container")
+
+def resample_linear(x, rate_in: int, rate_out: int):
+    """Windowed-sinc low-pass (when downsampling) followed by linear interpolation."""
+    if rate_in == rate_out or not len(x):
+        return x.astype(np.float32, copy=False)
+    if rate_out < rate_in:
+        cutoff = 0.45 * rate_out / rate_in  # fraction of the input sample rate
+        taps = np.arange(-32, 33)
+        kernel = np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+        x = np.convolve(x, kernel / kernel.sum(), mode="same")
+    n_out = int(round(len(x) * rate_out / rate_in))
+    t_out = np.arange(n_out) * (rate_in / rate_out)
+    return np.interp(t_out, np.arange(len(x)), x).astype(np.float32)
+
+def trim_silence(x, rate: int):
+    """Drop leading/trailing frames quieter than TRIM_THRESHOLD_DB (keeping a little padding)."""
+    frame = int(rate * 0.02)
+    if len(x) < frame:
+        return x
+    n = len(x) // frame
+    rms = np.sqrt(np.mean(x[: n * frame].reshape(n, frame) ** 2, axis=1) + 1e-12)
+    loud = np.flatnonzero(20 * np.log10(rms) > TRIM_THRESHOLD_DB)
+    if not len(loud):
+        return x[:0]
+    pad = int(TRIM_PADDING_S * rate)
+    return x[max(loud[0] * frame - pad, 0): min((loud[-1] + 1) * frame + pad, len(x))]
+
+def encode_wav_pcm16(x, rate: int) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes((np.clip(x, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+    return buf.getvalue()
+
+def normalize_upload(audio) -> dict | None:
+    """Normalize an uploaded clip (bytes or a spooled file, which is decoded in place) for STT.
+    Returns {"samples", "wav", "use_wav", ...sizes} or None when the clip can't be decoded."""
+    source = audio if hasattr(audio, "read") else io.BytesIO(bytes(audio))
+    source.seek(0, io.SEEK_END)
+    size_in = source.tell()
+    AUDIO_NORM_STATS["clips"] += 1
+    AUDIO_NORM_STATS["bytes_in"] += size_in
+    try:
+        data, rate = decode_audio_upload(source)
+    except Exception as e:
+        print(f"⚠️ Audio normalization skipped (decode failed: {e})")
+        AUDIO_NORM_STATS["passthrough"] += 1
+        AUDIO_NORM_STATS["bytes_out"] += size_in
+        return None
+    finally:
+        source.seek(0)
+    seconds_in = len(data) / rate
+    mono = data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+    samples = trim_silence(resample_linear(mono, rate, STT_SAMPLE_RATE), STT_SAMPLE_RATE)
+    seconds_out = len(samples) / STT_SAMPLE_RATE
+    wav = encode_wav_pcm16(samples, STT_SAMPLE_RATE) if len(samples) else b""
+    # A compressed upload (Opus) can be smaller than PCM WAV; only swap it out when
+    # that still pays off in bytes or trims at least 10% of the billed audio.
+    use_wav = len(wav) < size_in or seconds_out < 0.9 * seconds_in
+    AUDIO_NORM_STATS["seconds_in"] += seconds_in
+    AUDIO_NORM_STATS["seconds_out"] += seconds_out if use_wav else seconds_in
+    AUDIO_NORM_STATS["bytes_out"] += len(wav) if use_wav else size_in
+    AUDIO_NORM_STATS["normalized" if use_wav else "passthrough"] += 1
+    if not len(samples):
+        AUDIO_NORM_STATS["silent"] += 1
+    print(f"🎚️ Audio normalized: {size_in}B/{seconds_in:.2f}s @ {rate}Hz x{data.shape[1]} -> "
+          f"{len(wav)}B/{seconds_out:.2f}s @ {STT_SAMPLE_RATE}Hz mono ({'using' if use_wav else 'keeping original'})")
+    return {"samples": samples, "wav": wav, "use_wav": use_wav,
+            "bytes_in": size_in, "bytes_out": len(wav), "seconds_in": seconds_in, "seconds_out": seconds_out}
+
+METRICS_SECTIONS["audio_normalization"] = lambda: {"enabled": AUDIO_NORMALIZE_ENABLED, **{
+    k: round(v, 2) if isinstance(v, float) else v for k, v in AUDIO_NORM_STATS.items()
+}}
+
+# --- Speech-to-Text Backends ---
+# /llm/query and /tts/echo transcribe through an STTBackend. AssemblyAI uploads
+# the clip and polls; the optional local backend runs a quantized Whisper model
+# (faster-whisper, int8 on CPU) so short clips need no network round trip.
+# AVA_STT_BACKEND=auto routes clips up to AVA_LOCAL_STT_MAX_SECONDS to the
+# local model while its queue is short, and everything else to AssemblyAI.
+from abc import ABC, abstractmethod
+
+STT_BACKEND_MODE = os.getenv("AVA_STT_BACKEND", "auto").strip().lower()
+LOCAL_STT_MODEL = os.getenv("AVA_LOCAL_STT_MODEL", "base.en")
+LOCAL_STT_LANGUAGE = os.getenv("AVA_LOCAL_STT_LANGUAGE", "en")
+LOCAL_STT_MAX_SECONDS = float(os.getenv("AVA_LOCAL_STT_MAX_SECONDS", "15"))
+LOCAL_STT_MAX_QUEUE = int(os.getenv("AVA_LOCAL_STT_MAX_QUEUE", "8"))
+
+LOCAL_STT_AVAILABLE = importlib.util.find_spec("faster_whisper") is not None
+
+PROVIDER_EXECUTORS["local_stt"] = ProviderExecutor("local_stt", _executor_size("local_stt", 2))
+
+STT_STATS = {"assemblyai": 0, "local": 0, "local_fallbacks": 0}
+
+class STTBackend(ABC):
+    """Turns an uploaded recording into text. transcribe() blocks; call it on an executor."""
+    name = "base"
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def transcribe(self, audio) -> dict:
+        """Transcribe bytes or a binary file object.
+        Return {"text": str | None, "error": str | None, "backend": name}."""
+
+class AssemblyAIBackend(STTBackend):
+    name = "assemblyai"
+
+    def available(self) -> bool:
+        return bool(ASSEMBLYAI_API_KEY)
+
+    def transcribe(self, audio) -> dict:
+        if hasattr(audio, "seek"):
+            audio.seek(0)
+        transcript = aai.Transcriber().transcribe(audio)
+        return {"text": transcript.text, "error": transcript.error, "backend": self.name,
+                "audio_seconds": getattr(transcript, "audio_duration", None)}
+
+class LocalWhisperBackend(STTBackend):
+    """faster-whisper on CPU. Every clip is decoded on its own; concurrent clips
+    run side by side on the local_stt executor, one model worker per thread."""
+    name = "local"
+    SAMPLE_RATE = 16000
+
+    def __init__(self):
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    def available(self) -> bool:
+        return LOCAL_STT_AVAILABLE
+
+    def pending(self) -> int:
+        with self._pending_lock:
+            return self._pending
+
+    def _load_model(self):
+        with self._model_lock:
+            if self._model is None:
+                from faster_whisper import WhisperModel
+                started = time.perf_counter()
+                self._model = WhisperModel(LOCAL_STT_MODEL, device="cpu", compute_type="int8",
+                                           num_workers=PROVIDER_EXECUTORS["local_stt"].max_workers)
+                print(f"🧠 Local STT model '{LOCAL_STT_MODEL}' loaded in {time.perf_counter() - started:.1f}s")
+            return self._model
+
+    def decode(self, audio):
+        """Decode any container/codec (bytes or a binary file object) to 16 kHz mono float32 samples."""
+        import io
+        from faster_whisper import decode_audio
+        if isinstance(audio, (bytes, bytearray)):
+            audio = io.BytesIO(audio)
+        audio.seek(0)
+        return decode_audio(audio, sampling_rate=self.SAMPLE_RATE)
+
+    def transcribe(self, audio) -> dict:
+        return self.transcribe_samples(self.decode(audio))
+
+    def submit(self, samples) -> Future:
+        """Queue decoded samples on the local_stt executor; the future resolves to a transcribe() dict."""
+        with self._pending_lock:
+            self._pending += 1
+        future = PROVIDER_EXECUTORS["local_stt"].submit(self.transcribe_samples, samples)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, _future):
+        with self._pending_lock:
+            self._pending -= 1
+
+    def transcribe_samples(self, samples) -> dict:
+        model = self._load_model()
+        segments, _ = model.transcribe(samples, language=LOCAL_STT_LANGUAGE or None, beam_size=1,
+                                       condition_on_previous_text=False)
+        text = " ".join(seg.text.strip() for seg in segments).strip()
+        return {"text": text, "error": None, "backend": self.name, "audio_seconds": len(samples) / self.SAMPLE_RATE}
+
+STT_BACKENDS: dict[str, STTBackend] = {
+    "assemblyai": AssemblyAIBackend(),
+    "local": LocalWhisperBackend(),
+}
+
+def stt_available() -> bool:
+    return any(backend.available() for backend in STT_BACKENDS.values())
+
+def _choose_stt_backend(duration_s: float | None) -> str:
+    local = STT_BACKENDS["local"]
+    if STT_BACKEND_MODE == "local" and local.available():
+        return "local"
+    if STT_BACKEND_MODE == "auto" and local.available() and duration_s is not None:
+        if duration_s <= LOCAL_STT_MAX_SECONDS and local.pending() < LOCAL_STT_MAX_QUEUE:
+            return "local"
+    return "assemblyai"
+
+async def transcribe_audio(audio) -> dict:
+    """Transcribe an uploaded clip (bytes or spooled file) on the best backend for its length and current load."""
+    normalized = await run_blocking("audio", normalize_upload, audio) if AUDIO_NORMALIZE_ENABLED else None
+    if normalized and not len(normalized["samples"]):
+        # Nothing above the silence threshold: skip the STT call entirely
+        return {"text": "", "error": None, "backend": "none"}
+    if normalized and normalized["use_wav"]:
+        audio = normalized["wav"]
+
+    local = STT_BACKENDS["local"]
+    if STT_BACKEND_MODE != "assemblyai" and local.available():
+        try:
+            if normalized:
+                samples = normalized["samples"]
+            else:
+                samples = await run_blocking("local_stt", local.decode, audio)
+            if _choose_stt_backend(len(samples) / local.SAMPLE_RATE) == "local":
+                result = await asyncio.wrap_future(local.submit(samples))
+                STT_STATS["local"] += 1
+                return result
+        except Exception as e:
+            STT_STATS["local_fallbacks"] += 1
+            print(f"⚠️ Local STT failed, falling back to AssemblyAI: {e}")
+    STT_STATS["assemblyai"] += 1
+    result = await run_blocking("assemblyai", STT_BACKENDS["assemblyai"].transcribe, audio)
+    if normalized:
+        # Seconds actually sent, for usage metering
+        result["audio_seconds"] = normalized["seconds_out"] if normalized["use_wav"] else normalized["seconds_in"]
+    return result
+
+METRICS_SECTIONS["stt"] = lambda: {
+    "mode": STT_BACKEND_MODE,
+    "local_available": LOCAL_STT_AVAILABLE,
+    "local_pending": STT_BACKENDS["local"].pending(),
+    **STT_STATS,
+}
+
+# --- Streaming STT Session Pool ---
+# /ws voice sessions stream PCM to AssemblyAI's real-time API. Handshakes run
+# on an executor, never on the event loop, and a few connections are kept
+# open ahead of time (AVA_STT_POOL_SIZE, default 1) so a new voice session
+# usually starts on a live one. The pool is filled at warm-up and topped up
+# only when a session uses it; idle pooled connections are closed after
+# AVA_STT_POOL_TTL_S (default 60) and not replaced, so an unused pool costs
+# at most one TTL of idle streaming. Pool upkeep runs on its own stt_pool
+# executor, leaving the assemblyai workers to live sessions and uploads.
+# Audio received before a connection is bound waits in a bounded buffer
+# (AVA_STT_PREBUFFER_S seconds, default 5), so the first syllables are not lost.
+STT_POOL_SIZE = max(0, int(os.getenv("AVA_STT_POOL_SIZE", "1")))
+STT_POOL_TTL_S = max(5.0, float(os.getenv("AVA_STT_POOL_TTL_S", "60")))
+PROVIDER_EXECUTORS["stt_pool"] = ProviderExecutor("stt_pool", _executor_size("stt_pool", 2))
+STT_CONNECT_TIMEOUT_S = 10.0
+STT_STREAM_SAMPLE_RATE = 16000
+STT_PREBUFFER_BYTES = int(float(os.getenv("AVA_STT_PREBUFFER_S", "5")) * STT_STREAM_SAMPLE_RATE * 2)
+
+class StreamingSttConnection:
+    """One AssemblyAI streaming connection; its events go to whichever session has bound it."""
+
+    def __init__(self):
+        from assemblyai.streaming.v3 import StreamingClient, StreamingClientOptions, StreamingEvents
+        self._events = StreamingEvents
+        self.created = time.monotonic()
+        self.ready = threading.Event()
+        self.closed = False
+        self.begin_event = None
+        self.handlers: dict = {}
+        self.client = StreamingClient(
+            StreamingClientOptions(api_key=ASSEMBLYAI_API_KEY, api_host="streaming.assemblyai.com")
+        )
+        for event in (StreamingEvents.Begin, StreamingEvents.Turn, StreamingEvents.Error, StreamingEvents.Termination):
+            self.client.on(event, lambda client, payload, _event=event: self._dispatch(_event, client, payload))
+
+    def _dispatch(self, event, client, payload):
+        if event == self._events.Begin:
+            self.begin_event = payload
+            self.ready.set()
+        elif event in (self._events.Error, self._events.Termination):
+            self.closed = True
+            self.ready.set()
+        handler = self.handlers.get(event)
+        if handler:
+            handler(client, payload)
+
+    def connect(self):
+        """Blocking handshake; returns once AssemblyAI has sent Begin."""
+        from assemblyai.streaming.v3 import StreamingParameters
+        self.client.connect(StreamingParameters(
+            sample_rate=STT_STREAM_SAMPLE_RATE,  # required 16kHz
+            format_turns=True,                   # get punctuated, turn-formatted transcripts
+        ))
+        # connect() reports handshake failures through the Error event instead of raising
+        if not self.ready.wait(STT_CONNECT_TIMEOUT_S) or self.closed:
+            raise ConnectionError("AssemblyAI streaming session did not start")
+
+    def fresh(self) -> bool:
+        return not self.closed and time.monotonic() - self.created < STT_POOL_TTL_S
+
+    def bind(self, handlers: dict):
+        """Route events to a session's handlers, replaying the Begin it missed while pooled."""
+        self.handlers = handlers
+        begin = handlers.get(self._events.Begin)
+        if begin and self.begin_event is not None:
+            begin(self.client, self.begin_event)
+
+    def release(self, terminate: bool = False):
+        try:
+            self.client.disconnect(terminate=terminate)
+        except Exception as e:
+            print(f"⚠️ AssemblyAI disconnect error: {e}")
+
+class StreamingSttPool:
+    """Pre-connected AssemblyAI streaming connections, handed out one per /ws session."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: deque = deque()
+        self._lock = threading.Lock()
+        self._connecting = 0
+        self._refill_queued = False
+        self.stats = {"hits": 0, "misses": 0, "connects": 0, "connect_errors": 0, "expired": 0,
+                      "prebuffered_bytes": 0, "dropped_bytes": 0}
+        self._connect_ms: deque = deque(maxlen=200)
+        self._bind_wait_ms: deque = deque(maxlen=200)
+
+    def open_connection(self) -> StreamingSttConnection:
+        """Blocking: connect a new session (runs on the assemblyai executor)."""
+        started = time.perf_counter()
+        conn = StreamingSttConnection()
+        try:
+            conn.connect()
+        except Exception:
+            self.stats["connect_errors"] += 1
+            conn.release()
+            raise
+        self.stats["connects"] += 1
+        self._connect_ms.append(round((time.perf_counter() - started) * 1000, 1))
+        return conn
+
+    def take(self) -> StreamingSttConnection | None:
+        """A live pooled connection, or None when the caller has to connect its own; either way the pool is topped up."""
+        stale = []
+        conn = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.popleft()
+                if candidate.fresh():
+                    conn = candidate
+                    break
+                stale.append(candidate)
+        for old in stale:
+            self.stats["expired"] += 1
+            PROVIDER_EXECUTORS["stt_pool"].submit(old.release)
+        self.stats["hits" if conn else "misses"] += 1
+        self.schedule_refill()
+        return conn
+
+    def schedule_refill(self):
+        """Queue one top-up on the stt_pool executor unless one is already waiting."""
+        with self._lock:
+            if not self.size or self._refill_queued:
+                return
+            self._refill_queued = True
+        PROVIDER_EXECUTORS["stt_pool"].submit(self.refill)
+
+    def refill(self):
+        """Blocking: open connections until the pool is back to its size."""
+        with self._lock:
+            self._refill_queued = False
+        if not self.size or not ASSEMBLYAI_API_KEY or not streaming_available():
+            return
+        with self._lock:
+            missing = max(0, self.size - len(self._idle) - self._connecting)
+            self._connecting += missing
+        for _ in range(missing):
+            try:
+                conn = self.open_connection()
+                with self._lock:
+                    self._idle.append(conn)
+            except Exception as e:
+                print(f"⚠️ [STT pool] pre-connect failed: {e}")
+            finally:
+                with self._lock:
+                    self._connecting -= 1
+
+    def expire(self):
+        """Blocking: close idle connections past their TTL; they are not replaced until the pool is used."""
+        with self._lock:
+            stale = [c for c in self._idle if not c.fresh()]
+            for c in stale:
+                self._idle.remove(c)
+        for old in stale:
+            self.stats["expired"] += 1
+            old.release()
+
+    def drain(self, changed=None):
+        """Close every idle connection (e.g. after the AssemblyAI key changed)."""
+        if changed is not None and "ASSEMBLYAI_API_KEY" not in changed:
+            return
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            PROVIDER_EXECUTORS["stt_pool"].submit(conn.release)
+
+    def record_bind(self, wait_ms: float, buffered: int, dropped: int):
+        self._bind_wait_ms.append(round(wait_ms, 1))
+        self.stats["prebuffered_bytes"] += buffered
+        self.stats["dropped_bytes"] += dropped
+
+    def metrics(self) -> dict:
+        connect_ms = sorted(self._connect_ms)
+        wait_ms = sorted(self._bind_wait_ms)
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "connecting": self._connecting,
+            "ttl_s": STT_POOL_TTL_S,
+            **self.stats,
+            "connect_ms": {"p50": _percentile(connect_ms, 0.5), "p95": _percentile(connect_ms, 0.95)},
+            "bind_wait_ms": {"p50": _percentile(wait_ms, 0.5), "p95": _percentile(wait_ms, 0.95)},
+        }
+
+STT_POOL = StreamingSttPool(STT_POOL_SIZE)
+CREDENTIAL_LISTENERS["stt_pool"] = STT_POOL.drain
+METRICS_SECTIONS["stt_pool"] = STT_POOL.metrics
+
+class BufferedSttSession:
+    """A /ws session's STT stream: audio is accepted at once and buffered until a connection is bound.
+
+    start(), feed() and the bind all run on the event loop, so buffered audio
+    always reaches AssemblyAI before anything fed later.
+    """
+
+    def __init__(self, handlers: dict, on_failed=None):
+        self.handlers = handlers
+        self.on_failed = on_failed
+        self.conn: StreamingSttConnection | None = None
+        self.closed = False
+        self._buffer: deque = deque()
+        self._buffered = 0
+        self._dropped = 0
+        self._opened = time.perf_counter()
+
+    def start(self):
+        conn = STT_POOL.take()
+        if conn is not None:
+            self._bind(conn)
+            return
+        future = asyncio.ensure_future(run_blocking("assemblyai", STT_POOL.open_connection))
+        future.add_done_callback(self._connected)
+
+    def _connected(self, future):
+        if future.cancelled() or future.exception() is not None:
+            print(f"❌ Failed to connect to AssemblyAI streaming: {future.exception() if not future.cancelled() else 'cancelled'}")
+            if self.on_failed and not self.closed:
+                self.on_failed()
+            return
+        conn = future.result()
+        if self.closed:
+            PROVIDER_EXECUTORS["assemblyai"].submit(conn.release)
+            return
+        self._bind(conn)
+
+    def _bind(self, conn: StreamingSttConnection):
+        conn.bind(self.handlers)
+        buffered = self._buffered
+        while self._buffer:
+            conn.client.stream(self._buffer.popleft())
+        self._buffered = 0
+        self.conn = conn
+        STT_POOL.record_bind((time.perf_counter() - self._opened) * 1000, buffered, self._dropped)
+
+    def feed(self, data: bytes):
+        if self.conn is not None:
+            # The SDK's .stream only enqueues bytes for its writer thread; safe inline
+            self.conn.client.stream(data)
+            return
+        self._buffer.append(data)
+        self._buffered += len(data)
+        while self._buffered > STT_PREBUFFER_BYTES:
+            # Keep the newest audio; the oldest is least likely to matter once we catch up
+            old = self._buffer.popleft()
+            self._buffered -= len(old)
+            self._dropped += len(old)
+
+    async def close(self):
+        """Graceful terminate waits for the server's TerminationEvent; keep it off the loop."""
+        self.closed = True
+        if self.conn is not None:
+            await run_blocking("assemblyai", self.conn.release, True)
+
+async def _stt_pool_loop():
+    while True:
+        await asyncio.sleep(max(5.0, STT_POOL_TTL_S / 3))
+        try:
+            await run_blocking("stt_pool", STT_POOL.expire)
+        except Exception as e:
+            print(f"⚠️ [STT pool] maintenance error: {e}")
+
+@app.on_event("startup")
+async def _start_stt_pool():
+    if STT_POOL_SIZE:
+        asyncio.get_running_loop().create_task(_stt_pool_loop())
+
+@app.on_event("shutdown")
+async def _close_stt_pool():
+    STT_POOL.drain()
+
 # --- Endpoints ---
 # Config endpoints for API keys (non-persistent; cleared on server restart)
 from fastapi import Body
@@ -650,34 +4375,22 @@ from typing import Dict, Any
 
 @app.post("/config/api-keys")
 async def set_api_keys(payload: Dict[str, Any] = Body(...)):
-    """Save user-provided API keys in memory. Keys are not persisted across restarts."""
+    """Save user-provided API keys and swap them into every provider at once."""
+    global USER_API_KEYS
+    updates = {}
     for k, v in (payload or {}).items():
         if not isinstance(k, str):
             continue
         key = k.strip().upper()
         if key in ENV_DEFAULTS:
-            USER_API_KEYS[key] = str(v) if v is not None and str(v).strip() != "" else None
-    # Reconfigure SDKs that require immediate config
-    try:
-        gk = get_api_key("GEMINI")
-        if gk:
-            genai.configure(api_key=gk)
-    except Exception:
-        pass
-    try:
-        ak = get_api_key("ASSEMBLYAI")
-        if ak:
-            aai.settings.api_key = ak
-    except Exception:
-        pass
-    # Clear Spotify token cache if creds changed
-    try:
-        _spotify_token_cache["access_token"] = None
-        _spotify_token_cache["expires_at"] = 0
-    except Exception:
-        pass
-    _save_user_keys_to_disk()
-    return {"ok": True}
+            updates[key] = str(v) if v is not None and str(v).strip() != "" else None
+    # Replace the dict rather than mutating it so readers never see a half-applied update
+    USER_API_KEYS = {**USER_API_KEYS, **updates}
+    # Resolve the globals; listeners reconfigure SDKs, refetch the Spotify token
+    # in the background and reset breakers for the keys that changed
+    changed = apply_credentials()
+    await asyncio.to_thread(_save_user_keys_to_disk)
+    return {"ok": True, "changed": sorted(changed)}
 
 @app.get("/config/api-keys")
 async def get_api_keys():
@@ -693,19 +4406,53 @@ async def get_api_keys():
 # Root endpoint to serve the UI
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    key = _root_page_key()
+    page = ROOT_PAGE["entry"]
+    if page is None or page["key"] != key:
+        page = await asyncio.to_thread(_render_root_page, key)
+    else:
+        ROOT_PAGE_STATS["hits"] += 1
+
+    encoding = pick_encoding(page["variants"], request.headers.get("accept-encoding", ""))
+    headers = {
+        "ETag": encoded_etag(page["etag"], encoding),
+        "Last-Modified": page["last_modified"],
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if (etag_matches(headers["ETag"], if_none_match) if if_none_match is not None
+            else _not_modified_since(request.headers.get("if-modified-since"), page["mtime"])):
+        ROOT_PAGE_STATS["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        ROOT_PAGE_STATS[encoding] += 1
+        headers["Content-Encoding"] = encoding
+        return HTMLResponse(content=page["variants"][encoding], headers=headers)
+    ROOT_PAGE_STATS["identity"] += 1
+    return HTMLResponse(content=page["body"], headers=headers)
 
 # Health check endpoint for Render/monitoring
 @app.get("/health")
 async def health():
-    return {"ok": True}
+    return {"ok": True, "tools": {name: tool.health() for name, tool in TOOL_REGISTRY.items()}}
+
+@app.get("/metrics")
+async def metrics():
+    out = {}
+    for name, collect in METRICS_SECTIONS.items():
+        try:
+            out[name] = collect()
+        except Exception as e:
+            out[name] = {"error": str(e)}
+    return out
 
 # --- Chat Sessions API ---
 @app.get("/sessions")
 async def api_list_sessions(pinned: int | None = None, q: str | None = None):
     if not SQLALCHEMY_AVAILABLE:
         return JSONResponse(content={"error": "Persistence not enabled"}, status_code=501)
-    return JSONResponse(content={"sessions": list_sessions(pinned, q)})
+    return JSONResponse(content={"sessions": await db_run(list_sessions, pinned, q)})
 
 @app.post("/sessions")
 async def api_create_session(payload: Dict[str, Any] = Body(None)):
@@ -719,7 +4466,7 @@ async def api_create_session(payload: Dict[str, Any] = Body(None)):
             title = str(t) if t is not None and str(t).strip() else None
     except Exception:
         title = None
-    ensure_session(sid, title=title)
+    await db_run(ensure_session, sid, title=title)
     return JSONResponse(content={"id": sid})
 
 @app.patch("/sessions/{sid}")
@@ -729,7 +4476,7 @@ async def api_update_session(sid: str, payload: Dict[str, Any] = Body(...)):
     title = payload.get("title") if isinstance(payload, dict) else None
     pinned = payload.get("pinned") if isinstance(payload, dict) else None
     archived = payload.get("archived") if isinstance(payload, dict) else None
-    ok = update_session_meta(sid, title=title, pinned=pinned, archived=archived)
+    ok = await db_run(update_session_meta, sid, title=title, pinned=pinned, archived=archived)
     if not ok:
         return JSONResponse(content={"error": "Not found"}, status_code=404)
     return {"ok": True}
@@ -738,7 +4485,7 @@ async def api_update_session(sid: str, payload: Dict[str, Any] = Body(...)):
 async def api_delete_session(sid: str):
     if not SQLALCHEMY_AVAILABLE:
         return JSONResponse(content={"error": "Persistence not enabled"}, status_code=501)
-    ok = delete_session(sid)
+    ok = await db_run(delete_session, sid)
     if not ok:
         return JSONResponse(content={"error": "Not found"}, status_code=404)
     return {"ok": True}
@@ -747,12 +4494,12 @@ async def api_delete_session(sid: str):
 async def api_get_messages(sid: str):
     if not SQLALCHEMY_AVAILABLE:
         return JSONResponse(content={"error": "Persistence not enabled"}, status_code=501)
-    return JSONResponse(content={"messages": get_messages(sid)})
+    return JSONResponse(content={"messages": await db_run(get_messages, sid)})
 
 # REST endpoint for Spotify search (optional for debugging/UI use)
 @app.get("/api/spotify/search")
 async def api_spotify_search(q: str, limit: int = 5):
-    results = spotify_search(q, limit=limit)
+    results = await run_blocking("spotify", spotify_search, q, limit=limit)
     return JSONResponse(content={"results": results})
 
 @app.get("/debug", response_class=HTMLResponse)
@@ -788,15 +4535,17 @@ async def generate_audio(request: Request, payload: GenerateAudioRequest):
         "Content-Type": "application/json"
     }
     payload = {
-        "text": text,
+        "text": speech_text(text, "generate_audio"),
         "voiceId": "en-IN-alia",
         "format": "MP3"
     }
 
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        async with ADMISSION["murf"].slot_async(client_key(request)):
+            response = await run_blocking("murf", requests.post, url, json=payload, headers=headers)
         response.raise_for_status()
         murf_data = response.json()
+        record_murf_usage(None, None, payload["text"], murf_data)
         audio_url = murf_data.get("audioFile")
 
         if not audio_url:
@@ -808,6 +4557,8 @@ async def generate_audio(request: Request, payload: GenerateAudioRequest):
             })
 
         return murf_data
+    except AdmissionBusy as e:
+        return busy_response(e, audioFile=f"{request.base_url}static/fallback.mp3")
     except requests.exceptions.RequestException as e:
         fallback_url = f"{request.base_url}static/fallback.mp3"
         return JSONResponse(content={
@@ -823,7 +4574,12 @@ async def generate_audio(request: Request, payload: GenerateAudioRequest):
             "fallback": True
         })
 
-@app.post("/tts/echo/")
+def _log_upload(request: Request):
+    info = request.scope.get("state", {}).get("upload")
+    if info:
+        print(f"📥 Upload {info['path']}: {info['bytes']} bytes in {info['seconds']}s")
+
+@upload_router.post("/tts/echo/")
 async def tts_echo(request: Request, file: UploadFile = File(...)):
     """
     This endpoint transcribes the user's audio, then uses that text to
@@ -831,7 +4587,7 @@ async def tts_echo(request: Request, file: UploadFile = File(...)):
     """
     fallback_url = f"{request.base_url}static/fallback.mp3"
     
-    if not ASSEMBLYAI_API_KEY or not MURF_API_KEY:
+    if not stt_available() or not MURF_API_KEY:
         return JSONResponse(content={
             "audioFile": fallback_url,
             "transcription": "I'm having trouble connecting right now",
@@ -840,25 +4596,27 @@ async def tts_echo(request: Request, file: UploadFile = File(...)):
         })
 
     try:
-        # Reads the audio data from the uploaded file
-        audio_data = await file.read()
+        # Hand the spooled upload to STT as a file object instead of reading it all into memory
+        audio_data = file.file
+        _log_upload(request)
         
-        # Transcribe the audio using AssemblyAI
-        print("🎙️  Transcribing audio with AssemblyAI...")
+        # Transcribe the audio (local model for short clips when available, else AssemblyAI)
+        print("🎙️  Transcribing audio...")
         try:
-            transcriber = aai.Transcriber()
-            transcript = transcriber.transcribe(audio_data)
+            transcript = await transcribe_audio(audio_data)
 
-            if transcript.error:
-                print(f"❌ AssemblyAI Error: {transcript.error}")
+            if transcript["error"]:
+                print(f"❌ STT Error ({transcript['backend']}): {transcript['error']}")
                 return JSONResponse(content={
                     "audioFile": fallback_url,
                     "transcription": "I'm having trouble connecting right now",
-                    "error": f"AssemblyAI Error: {transcript.error}",
+                    "error": f"Speech recognition error ({transcript['backend']}): {transcript['error']}",
                     "fallback": True
                 })
 
-            transcribed_text = transcript.text
+            transcribed_text = transcript["text"]
+            echo_turn = USAGE.new_turn()
+            USAGE.record(None, echo_turn, stt_seconds=transcript.get("audio_seconds") or 0)
             if not transcribed_text:
                 return JSONResponse(content={
                     "audioFile": fallback_url,
@@ -883,12 +4641,14 @@ async def tts_echo(request: Request, file: UploadFile = File(...)):
         try:
             murf_url = "https://api.murf.ai/v1/speech/generate"
             headers = {"api-key": MURF_API_KEY, "Content-Type": "application/json"}
-            payload = {"text": transcribed_text, "voiceId": "en-IN-priya", "format": "MP3"}
+            payload = {"text": speech_text(transcribed_text, "echo"), "voiceId": "en-IN-priya", "format": "MP3"}
             
-            response = requests.post(murf_url, json=payload, headers=headers)
+            async with ADMISSION["murf"].slot_async(client_key(request)):
+                response = await run_blocking("murf", requests.post, murf_url, json=payload, headers=headers)
             response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
 
             murf_data = response.json()
+            record_murf_usage(None, echo_turn, payload["text"], murf_data)
             audio_url = murf_data.get("audioFile")
 
             if not audio_url:
@@ -910,6 +4670,8 @@ async def tts_echo(request: Request, file: UploadFile = File(...)):
                 "remainingCharacterCount": murf_data.get("remainingCharacterCount")
             })
 
+        except AdmissionBusy as e:
+            return busy_response(e, audioFile=fallback_url, transcription=transcribed_text)
         except requests.exceptions.RequestException as e:
             # Handle Murf API errors
             print(f"❌ Murf API Request Error: {e}")
@@ -931,7 +4693,7 @@ async def tts_echo(request: Request, file: UploadFile = File(...)):
         })
 
 # Simple LLM query endpoint for text-only interaction
-@app.post("/llm/query")
+@upload_router.post("/llm/query")
 async def llm_query(request: Request, file: UploadFile = File(...), session_id: str = Form(...)):
     """
     Receives audio, transcribes it, sends text to Gemini LLM with history,
@@ -940,7 +4702,7 @@ async def llm_query(request: Request, file: UploadFile = File(...), session_id:
 
     fallback_url = f"{request.base_url}static/fallback.mp3"
     
-    if not (ASSEMBLYAI_API_KEY and GEMINI_API_KEY and MURF_API_KEY):
+    if not (stt_available() and GEMINI_API_KEY and MURF_API_KEY):
         return JSONResponse(content={
             "userTranscription": "I'm having trouble connecting right now",
             "llmResponse": "I'm having trouble connecting right now",
@@ -950,22 +4712,24 @@ async def llm_query(request: Request, file: UploadFile = File(...), session_id:
         })
 
     try:
-        # 1. Read uploaded audio
-        audio_data = await file.read()
+        # 1. Uploaded audio (already spooled, memory-bounded)
+        audio_data = file.file
+        _log_upload(request)
 
-        # 2. Transcribe with AssemblyAI
+        # 2. Transcribe (local model for short clips when available, else AssemblyAI)
         try:
-            transcriber = aai.Transcriber()
-            transcript = transcriber.transcribe(audio_data)
-            if transcript.error:
+            transcript = await transcribe_audio(audio_data)
+            if transcript["error"]:
                 return JSONResponse(content={
                     "userTranscription": "I'm having trouble connecting right now",
                     "llmResponse": "I'm having trouble connecting right now",
                     "audioFile": fallback_url,
-                    "error": f"AssemblyAI Error: {transcript.error}",
+                    "error": f"Speech recognition error ({transcript['backend']}): {transcript['error']}",
                     "fallback": True
                 })
-            user_text = transcript.text
+            user_text = transcript["text"]
+            turn_id = USAGE.new_turn()
+            USAGE.record(session_id, turn_id, stt_seconds=transcript.get("audio_seconds") or 0)
             if not user_text:
                 return JSONResponse(content={
                     "userTranscription": "I'm having trouble connecting right now",
@@ -985,38 +4749,44 @@ async def llm_query(request: Request, file: UploadFile = File(...), session_id:
 
         print(f"🎙️ User said: {user_text}")
 
-        # 3. Send to Gemini with history (or perform web search if requested)
+        # 3. Deterministic intents (time, stop, web search, ...) skip Gemini entirely
         ai_text = None
+        intent = None
         try:
-            # Light intent detection for web search
-            if TAVILY_API_KEY:
-                lt = user_text.lower().strip()
-                m = re.search(r"(?:search for|look up|google|web search|find info on)\s+(.+)", lt)
-                query = None
-                if m:
-                    query = m.group(1)
-                elif any(kw in lt for kw in ["latest", "today", "news about", "update on"]):
-                    query = user_text
-                if query:
-                    search_result = tavily_search(query)
-                    if search_result:
-                        ai_text = search_result
+            reply = await answer_intent_async(user_text, session_id, turn_id)
+            if reply:
+                ai_text = reply["text"]
+                intent = reply["intent"]
         except Exception:
-            # ignore search errors and fall back to Gemini
+            # ignore router errors and fall back to Gemini
             ai_text = None
 
+        if ai_text is None and USAGE_QUOTAS["llm_tokens"] and await asyncio.to_thread(quota_exceeded, session_id, "llm_tokens"):
+            ai_text, intent = USAGE_QUOTA_MESSAGE, "quota"
+
+        llm_ticket = None
         if ai_text is None:
+            try:
+                llm_ticket = await ADMISSION["llm"].acquire(client_key(request))
+            except AdmissionBusy as e:
+                return busy_response(e, userTranscription=user_text, llmResponse="I'm busy right now; please try again in a moment.",
+                                     audioFile=fallback_url)
             try:
                 # Get history (DB if available; fallback to in-memory)
                 if SQLALCHEMY_AVAILABLE:
-                    ensure_session(session_id)
-                    history = get_history_for_gemini(session_id)
+                    # A warm cache entry implies the session row exists; skip the DB round trip
+                    history = HISTORY_CACHE.get(session_id)
+                    if history is None:
+                        def _load_history(db):
+                            ensure_session(db, session_id)
+                            return get_history_for_gemini(db, session_id)
+                        history = await db_run(_load_history)
                 else:
                     history = chat_sessions.get(session_id, [])
                 
                 model = genai.GenerativeModel(
                     'gemini-2.5-flash',
-                    tools=[tavily_search]
+                    tools=[tavily_search, weather]
                 )
                 # Prepend AVA system instruction once per session (not stored in user-visible history)
                 sys_preface = [{"role": "user", "parts": [AVA_SYSTEM_PROMPT]}]
@@ -1024,22 +4794,27 @@ async def llm_query(request: Request, file: UploadFile = File(...), session_id:
                 chat = model.start_chat(history=sys_preface + history)
                 
                 # Send the new message
-                llm_response = chat.send_message(user_text)
+                llm_response = await run_blocking("gemini", chat.send_message, user_text)
+                USAGE.record(session_id, turn_id, **llm_usage(llm_response))
                 
-                # Handle tool calls
-                while llm_response.candidates[0].content.parts and getattr(llm_response.candidates[0].content.parts[0], 'function_call', None):
-                    fc = llm_response.candidates[0].content.parts[0].function_call
-                    tool_response = tavily_search(query=fc.args.get('query', ''))
-                    llm_response = chat.send_message(
-                        part=genai.types.FunctionResponse(name=fc.name, response=tool_response)
-                    )
-
-                ai_text = llm_response.text
+                # Handle tool calls: all calls of a round run concurrently, bounded rounds
+                for _ in range(MAX_TOOL_ROUNDS):
+                    calls = get_function_calls(llm_response)
+                    if not calls:
+                        break
+                    USAGE.record(session_id, turn_id, tool_calls=len(calls))
+                    outcomes = await execute_tool_calls_async(calls, session_id)
+                    llm_response = await run_blocking("gemini", chat.send_message, function_response_parts(outcomes))
+                    USAGE.record(session_id, turn_id, **llm_usage(llm_response))
+
+                ai_text = response_text(llm_response)
 
                 # Persist messages
                 if SQLALCHEMY_AVAILABLE:
-                    add_message(session_id, "user", user_text)
-                    add_message(session_id, "assistant", ai_text or "")
+                    def _persist_turn(db):
+                        add_message(db, session_id, "user", user_text)
+                        add_message(db, session_id, "assistant", ai_text or "")
+                    await db_run(_persist_turn)
                 else:
                     chat_sessions[session_id] = chat.history
                 
@@ -1059,17 +4834,31 @@ async def llm_query(request: Request, file: UploadFile = File(...), session_id:
                     "error": f"AI processing error: {str(e)}",
                     "fallback": True
                 })
+            finally:
+                ADMISSION["llm"].release(llm_ticket)
 
         print(f"🤖 Gemini says: {ai_text}")
 
-        # 4. Send to Murf
+        # 4. Send to Murf (text-only once the session has spent its TTS quota)
+        if USAGE_QUOTAS["tts_chars"] and await asyncio.to_thread(quota_exceeded, session_id, "tts_chars"):
+            return JSONResponse(content={
+                "userTranscription": user_text,
+                "llmResponse": ai_text,
+                "intent": intent,
+                "audioFile": fallback_url,
+                "error": "Voice quota reached for this session.",
+                "fallback": True
+            })
         try:
             murf_url = "https://api.murf.ai/v1/speech/generate"
             headers = {"api-key": MURF_API_KEY, "Content-Type": "application/json"}
-            payload = {"text": ai_text, "voiceId": "en-IN-priya", "format": "MP3"}
-            murf_resp = requests.post(murf_url, json=payload, headers=headers)
+            # Display text stays as-is in llmResponse; Murf gets the spoken form
+            payload = {"text": speech_text(ai_text, "llm_query"), "voiceId": "en-IN-priya", "format": "MP3"}
+            async with ADMISSION["murf"].slot_async(client_key(request)):
+                murf_resp = await run_blocking("murf", requests.post, murf_url, json=payload, headers=headers)
             murf_resp.raise_for_status()
             murf_data = murf_resp.json()
+            record_murf_usage(session_id, turn_id, payload["text"], murf_data)
             audio_url = murf_data.get("audioFile")
 
             if not audio_url:
@@ -1084,12 +4873,16 @@ async def llm_query(request: Request, file: UploadFile = File(...), session_id:
             return JSONResponse(content={
                 "userTranscription": user_text,
                 "llmResponse": ai_text,
+                "intent": intent,
                 "audioFile": audio_url,
                 "audioLengthInSeconds": murf_data.get("audioLengthInSeconds"),
                 "consumedCharacterCount": murf_data.get("consumedCharacterCount"),
                 "remainingCharacterCount": murf_data.get("remainingCharacterCount")
             })
 
+        except AdmissionBusy as e:
+            # The answer is ready; only its audio is shed
+            return busy_response(e, userTranscription=user_text, llmResponse=ai_text, intent=intent, audioFile=fallback_url)
         except requests.exceptions.RequestException as e:
             return JSONResponse(content={
                 "userTranscription": user_text,
@@ -1108,6 +4901,8 @@ async def llm_query(request: Request, file: UploadFile = File(...), session_id:
             "fallback": True
         })
 
+app.include_router(upload_router)
+
 # New endpoint to clear chat history for a session
 @app.post("/chat/clear")
 async def clear_chat_history(payload: ClearChatRequest):
@@ -1122,46 +4917,54 @@ async def clear_chat_history(payload: ClearChatRequest):
         print(f"🤔 Attempted to clear non-existent session: {session_id}")
         return JSONResponse(content={"message": "No history found for this session."}, status_code=404)
 
+# Tools Gemini may call from the text chat; shared by the JSON and streaming
+# endpoints so a question gets the same tools whichever one answers it
+TEXT_CHAT_TOOLS = [tavily_search, weather]
+
 # Text-only LLM query endpoint for the AI Chat Section
 @app.post("/llm/text-query")
-async def llm_text_query(payload: TextQueryRequest):
+async def llm_text_query(request: Request, payload: TextQueryRequest):
     """Handles text-to-text LLM queries with session history."""
     user_text = payload.text
     session_id = payload.session_id
 
     print(f"💬 User asked (session: {session_id[:8]}...): {user_text}")
 
+    turn_id = USAGE.new_turn()
+    reply = await answer_intent_async(user_text, session_id, turn_id)
+    if reply:
+        return JSONResponse(content={"llmResponse": reply.pop("text"), **reply})
+    if USAGE_QUOTAS["llm_tokens"] and await asyncio.to_thread(quota_exceeded, session_id, "llm_tokens"):
+        return JSONResponse(content={"llmResponse": USAGE_QUOTA_MESSAGE, "intent": "quota"})
+
+    try:
+        llm_ticket = await ADMISSION["llm"].acquire(client_key(request))
+    except AdmissionBusy as e:
+        return busy_response(e)
     try:
         history = chat_sessions.get(session_id, [])
         model = genai.GenerativeModel(
             'gemini-2.5-flash',
-            tools=[tavily_search]
+            tools=TEXT_CHAT_TOOLS
         )
         sys_preface = [{"role": "user", "parts": [AVA_SYSTEM_PROMPT]}]
         chat = model.start_chat(history=sys_preface + history)
-        llm_response = chat.send_message(user_text)
+        llm_response = await run_blocking("gemini", chat.send_message, user_text)
+        USAGE.record(session_id, turn_id, **llm_usage(llm_response))
 
         print(f"Initial response: {llm_response}")
 
-        if llm_response.candidates and llm_response.candidates[0].content and llm_response.candidates[0].content.parts and llm_response.candidates[0].content.parts[0].function_call:
-            fc = llm_response.candidates[0].content.parts[0].function_call
-            print(f"Function call: {fc}")
-            tool_response = None
-            if fc.name == 'tavily_search' and 'query' in fc.args:
-                tool_response = tavily_search(query=fc.args['query'])
-            elif fc.name == 'spotify_search' and 'query' in fc.args:
-                # Prefer Spotify; if no preview, try iTunes fallback
-                sp = spotify_search(fc.args['query'], limit=3, session_id=session_id, market="US")
-                if not any((r or {}).get('preview_url') for r in (sp or [])):
-                    it = itunes_search(fc.args['query'], limit=3)
-                    tool_response = it or sp
-                else:
-                    tool_response = sp
-            llm_response = chat.send_message(
-                part=genai.types.FunctionResponse(name=fc.name, response=tool_response)
-            )
+        for _ in range(MAX_TOOL_ROUNDS):
+            calls = get_function_calls(llm_response)
+            if not calls:
+                break
+            print(f"Function calls: {[fc.name for fc in calls]}")
+            USAGE.record(session_id, turn_id, tool_calls=len(calls))
+            outcomes = await execute_tool_calls_async(calls, session_id)
+            llm_response = await run_blocking("gemini", chat.send_message, function_response_parts(outcomes))
+            USAGE.record(session_id, turn_id, **llm_usage(llm_response))
 
-        ai_text = llm_response.text
+        ai_text = response_text(llm_response)
         
         chat_sessions[session_id] = chat.history
 
@@ -1174,6 +4977,130 @@ async def llm_text_query(payload: TextQueryRequest):
     except Exception as e:
         print(f"❌ Gemini API Error in text query: {e}")
         raise HTTPException(status_code=500, detail=f"AI processing error: {str(e)}")
+    finally:
+        ADMISSION["llm"].release(llm_ticket)
+
+# --- Streaming text chat (SSE) ---
+# Same inputs as /llm/text-query, but tokens and tool progress are pushed as
+# Server-Sent Events while Gemini is still generating. Old clients keep using
+# the JSON endpoint above.
+from fastapi.responses import StreamingResponse
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/llm/text-query/stream")
+async def llm_text_query_stream(request: Request, payload: TextQueryRequest):
+    """Streams a text chat answer as SSE events: token, tool_call, tool_result, done, error."""
+    user_text = payload.text
+    session_id = payload.session_id
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    print(f"💬 User asked (stream, session: {session_id[:8]}...): {user_text}")
+
+    turn_id = USAGE.new_turn()
+    reply = await answer_intent_async(user_text, session_id, turn_id)
+    if not reply and USAGE_QUOTAS["llm_tokens"] and await asyncio.to_thread(quota_exceeded, session_id, "llm_tokens"):
+        reply = {"text": USAGE_QUOTA_MESSAGE, "intent": "quota"}
+    if reply:
+        # Same event shape as a one-token Gemini answer
+        text = reply.pop("text")
+        return StreamingResponse(
+            iter([_sse("token", {"text": text}), _sse("done", {"llmResponse": text, **reply})]),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    try:
+        llm_ticket = await ADMISSION["llm_stream"].acquire(client_key(request))
+    except AdmissionBusy as e:
+        return busy_response(e)
+
+    # Set once the client is gone; the producer stops at its next chunk or round
+    cancelled = threading.Event()
+
+    def emit(event: str | None, data: dict | None = None):
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    def _produce():
+        try:
+            history = chat_sessions.get(session_id, [])
+            model = genai.GenerativeModel(
+                'gemini-2.5-flash',
+                tools=TEXT_CHAT_TOOLS
+            )
+            sys_preface = [{"role": "user", "parts": [AVA_SYSTEM_PROMPT]}]
+            chat = model.start_chat(history=sys_preface + history)
+            llm_response = chat.send_message(user_text, stream=True)
+
+            full_text = ""
+            for round_idx in range(MAX_TOOL_ROUNDS + 1):
+                calls = []
+                round_usage = {}
+                for chunk in llm_response:
+                    if cancelled.is_set():
+                        break
+                    # Every chunk carries running totals; the last one has the round's count
+                    round_usage = llm_usage(chunk) if getattr(chunk, "usage_metadata", None) else round_usage
+                    if not (chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts):
+                        continue
+                    for part in chunk.candidates[0].content.parts:
+                        if getattr(part, 'function_call', None):
+                            calls.append(part.function_call)
+                        elif getattr(part, 'text', None):
+                            full_text += part.text
+                            emit("token", {"text": part.text})
+                USAGE.record(session_id, turn_id, **round_usage)
+                if cancelled.is_set():
+                    print(f"🔌 Client left; stopped streamed answer for session {session_id[:8]}...")
+                    return
+                if not calls or round_idx == MAX_TOOL_ROUNDS:
+                    break
+                USAGE.record(session_id, turn_id, tool_calls=len(calls))
+                for fc in calls:
+                    emit("tool_call", {"name": fc.name, "args": dict(fc.args or {})})
+                outcomes = execute_tool_calls(calls, session_id)
+                for o in outcomes:
+                    event = {"name": o["name"], "ok": o["ok"], "elapsed_ms": o["elapsed_ms"]}
+                    if isinstance(o["result"], list):
+                        event["results"] = o["result"]
+                    emit("tool_result", event)
+                if cancelled.is_set():
+                    return
+                llm_response = chat.send_message(function_response_parts(outcomes), stream=True)
+
+            chat_sessions[session_id] = chat.history
+            if not full_text:
+                emit("error", {"detail": "Gemini returned no text."})
+            else:
+                print(f"🤖 Gemini says (stream): {full_text}")
+                emit("done", {"llmResponse": full_text})
+        except Exception as e:
+            print(f"❌ Gemini API Error in streamed text query: {e}")
+            emit("error", {"detail": f"AI processing error: {str(e)}"})
+        finally:
+            ADMISSION["llm_stream"].release(llm_ticket)
+            emit(None)
+
+    PROVIDER_EXECUTORS["gemini_stream"].submit(_produce)
+
+    async def _event_source():
+        try:
+            while True:
+                event, data = await events.get()
+                if event is None or await request.is_disconnected():
+                    break
+                yield _sse(event, data)
+        finally:
+            # Free the slot now rather than when Gemini and the tools finish (release is idempotent)
+            cancelled.set()
+            ADMISSION["llm_stream"].release(llm_ticket)
+
+    return StreamingResponse(
+        _event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
  # updated    
 @app.websocket("/ws")
@@ -1192,13 +5119,29 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception:
         session_id = str(uuid.uuid4())
 
+    # Admission: over the session limits the client gets a "busy" message and code 1013 (try again later)
+    client_id = client_key(websocket)
+    try:
+        ws_ticket = await ADMISSION["ws"].acquire(client_id)
+    except AdmissionBusy as e:
+        try:
+            await websocket.send_text(json.dumps(e.payload()))
+            await websocket.close(code=1013)
+        except RuntimeError:
+            pass
+        return
+
     # Track WS lifecycle for safe sends from callbacks
     ws_closed = False
+    # Sampled sessions record inbound audio and pipeline events (AVA_FLIGHT_RECORDER)
+    recorder = start_flight_recorder(session_id)
 
     async def safe_ws_send(payload: dict):
         # Avoid sending after client closed the socket
         if ws_closed or websocket.client_state != WebSocketState.CONNECTED:
             return
+        if recorder.active:
+            recorder.event("ws.out", **flight_summary(payload))
         try:
             await websocket.send_text(json.dumps(payload))
         except RuntimeError:
@@ -1207,7 +5150,25 @@ async def websocket_endpoint(websocket: WebSocket):
         except Exception:
             pass
 
-    if not WEBSOCKETS_ENABLED or not ASSEMBLYAI_API_KEY:
+    # Filler clips already delivered on this socket; later sends carry only the clip id
+    sent_filler_ids: set[str] = set()
+
+    def send_filler(kind: str, turn: dict):
+        """Stream a pre-rendered filler clip unless real TTS audio for this turn has started."""
+        if not FILLER_AUDIO_ENABLED or turn.get("audio_started"):
+            return
+        clip = pick_filler(kind)
+        if not clip:
+            return
+        payload = {"type": "filler_audio", "kind": kind, "clip_id": clip["id"], "text": clip["text"]}
+        if clip["id"] not in sent_filler_ids:
+            payload["audio_b64"] = clip["audio_b64"]
+            sent_filler_ids.add(clip["id"])
+        print(f"🗣️  Sending {kind} filler: {clip['text']}", flush=True)
+        asyncio.run_coroutine_threadsafe(safe_ws_send(payload), loop)
+
+    # Imports the streaming SDK off the loop if the warm-up has not done so yet
+    if not ASSEMBLYAI_API_KEY or not await run_blocking("assemblyai", streaming_available):
         print("⚠️ Real-time transcription disabled (missing SDK or API key). Sending fallback and closing WebSocket.")
         try:
             loop.create_task(safe_ws_send({
@@ -1216,15 +5177,28 @@ async def websocket_endpoint(websocket: WebSocket):
             }))
         except Exception:
             pass
+        ADMISSION["ws"].release(ws_ticket)
         await websocket.close()
         return
 
+    from assemblyai.streaming.v3 import (
+        BeginEvent,
+        StreamingError,
+        StreamingEvents,
+        StreamingSessionParameters,
+        TerminationEvent,
+        TurnEvent
+    )
+
     # Callbacks for AssemblyAI events
     def on_begin(client, event: BeginEvent):
+        recorder.event("stt.begin", id=event.id)
         print(f"🔵 Session started: {event.id}")
         print("🎙️ Streaming started (awaiting audio frames)...")
 
     def on_turn(client, event: TurnEvent):
+        recorder.event("stt.turn", transcript=event.transcript, end_of_turn=bool(event.end_of_turn),
+                       formatted=bool(getattr(event, 'turn_is_formatted', False)))
         # Log transcript to server console for debugging/visibility
         if event.transcript:
             print(f"📝 TurnEvent end_of_turn={event.end_of_turn}, formatted={getattr(event, 'turn_is_formatted', None)}: {event.transcript}")
@@ -1245,73 +5219,35 @@ async def websocket_endpoint(websocket: WebSocket):
 
         # If we have a final, formatted turn, stream LLM response with history
         if getattr(event, 'end_of_turn', False) and getattr(event, 'turn_is_formatted', False) and event.transcript:
-            # Quick selection handler: e.g., "play 1", "choose 2", "play first/second/third"
+            # Deterministic intents ("stop", "what time is it", "play the second one", ...)
+            # are answered here without a Gemini call
+            turn_id = USAGE.new_turn()
             try:
-                txt = (event.transcript or "").strip().lower()
-                # number words
-                words = {"first": 1, "1": 1, "one": 1, "second": 2, "2": 2, "two": 2, "third": 3, "3": 3, "three": 3}
-                sel = None
-                m = re.search(r"\b(?:play|choose|select)\s+(first|second|third|one|two|three|[1-3])\b", txt)
-                if m:
-                    key = m.group(1)
-                    sel = words.get(key)
-                if sel and spotify_last_results.get(session_id):
-                    idx = sel - 1
-                    results = spotify_last_results.get(session_id) or []
-                    if 0 <= idx < len(results):
-                        chosen = results[idx]
-                        # If selected has no preview, try to find any playable preview in recent results
-                        playable = chosen
-                        if not (chosen or {}).get('preview_url'):
-                            for r in results:
-                                if r.get('preview_url'):
-                                    playable = r
-                                    break
-                        # If still no preview, try a second query with a stronger market hint
-                        if not (playable or {}).get('preview_url'):
-                            try:
-                                second = spotify_search(f"{chosen.get('name')} {chosen.get('artists')}", limit=3, session_id=session_id, market="US")
-                                for r in second:
-                                    if r.get('preview_url'):
-                                        playable = r
-                                        break
-                            except Exception:
-                                pass
-                        # If still no preview, try iTunes fallback before giving up
-                        if not (playable or {}).get('preview_url'):
-                            try:
-                                third = itunes_search(f"{chosen.get('name')} {chosen.get('artists')}", limit=3)
-                                for r in third:
-                                    if r.get('preview_url'):
-                                        playable = r
-                                        break
-                            except Exception:
-                                pass
-                        # Assistant text
-                        if (chosen or {}).get('preview_url'):
-                            msg = f"Playing: {chosen.get('name')} — {chosen.get('artists')}"
-                        elif (playable or {}).get('preview_url'):
-                            msg = f"No preview for selection. Playing available preview: {playable.get('name')} — {playable.get('artists')}"
-                        else:
-                            msg = f"No preview available. You can open it in Spotify: {chosen.get('name')} — {chosen.get('artists')}"
-                        try:
-                            loop.create_task(safe_ws_send({"type": "assistant", "text": msg}))
-                        except Exception:
-                            pass
-                        # Send result(s) to client; if we found a playable one, send just that; otherwise send chosen only
-                        payload_result = playable if (playable or {}).get('preview_url') else chosen
-                        try:
-                            loop.create_task(safe_ws_send({
-                                "type": "spotify_results",
-                                "results": [payload_result]
-                            }))
-                        except Exception:
-                            pass
-                        return  # handled this turn; skip LLM
+                reply = answer_intent(event.transcript, session_id, turn_id)
             except Exception:
-                pass
-
-            def _stream_llm_response(final_text: str, _session_id: str):
+                reply = None
+            if reply:
+                recorder.event("intent", intent=reply["intent"])
+                try:
+                    if reply.get("action"):
+                        loop.create_task(safe_ws_send({"type": "intent", "intent": reply["intent"], "action": reply["action"]}))
+                    loop.create_task(safe_ws_send({"type": "assistant", "text": reply["text"]}))
+                    if reply.get("results"):
+                        loop.create_task(safe_ws_send({"type": "spotify_results", "results": reply["results"]}))
+                except Exception:
+                    pass
+                return  # handled this turn; skip LLM
+
+            def _stream_llm_response(final_text: str, _session_id: str, turn_id: str):
+                recorder.event("llm.request", text=final_text)
+                # Sessions over their LLM quota get a canned answer; over the TTS quota, text only
+                if USAGE_QUOTAS["llm_tokens"] and quota_exceeded(_session_id, "llm_tokens"):
+                    loop.create_task(safe_ws_send({"type": "assistant", "text": USAGE_QUOTA_MESSAGE}))
+                    return
+                speak = bool(MURF_API_KEY) and not (USAGE_QUOTAS["tts_chars"] and quota_exceeded(_session_id, "tts_chars"))
+                # Set once the first real Murf chunk is forwarded; fillers stop after that
+                turn = {"audio_started": False}
+                send_filler("ack", turn)
                 try:
                     # 1) Load prior history (if any) for this session
                     history = chat_sessions.get(_session_id, [])
@@ -1320,7 +5256,7 @@ async def websocket_endpoint(websocket: WebSocket):
                     try:
                         model = genai.GenerativeModel(
                             'gemini-2.5-flash',
-                            tools=[tavily_search, spotify_search]
+                            tools=[tavily_search, spotify_search, weather]
                         )
                         # Prepend AVA identity prompt for streaming path as well
                         messages = [{"role": "user", "parts": [AVA_SYSTEM_PROMPT]}] + history + [{"role": "user", "parts": [final_text]}]
@@ -1336,8 +5272,18 @@ async def websocket_endpoint(websocket: WebSocket):
                             pass
                         return
 
+                    # Over the Murf limit the answer still arrives, as text only
+                    murf_ticket = None
+                    if speak:
+                        try:
+                            murf_ticket = ADMISSION["murf_stream"].acquire_blocking(client_id)
+                        except AdmissionBusy as e:
+                            speak = False
+                            recorder.event("busy", **e.payload())
+                            asyncio.run_coroutine_threadsafe(safe_ws_send(e.payload()), loop)
+
                     # Start Murf WebSocket TTS streamer to receive base64 audio and print it
-                    if MURF_API_KEY:
+                    if speak:
                         import asyncio as _asyncio
                         import json as _json
                         import websockets as _websockets
@@ -1354,11 +5300,11 @@ async def websocket_endpoint(websocket: WebSocket):
                             print("🔒 Acquiring Murf session lock", flush=True)
                             session_lock.acquire()
                             try:
-                                qs = f"?api-key={MURF_API_KEY}&sample_rate=44100&channel_type=MONO&format=WAV&context_id={murf_context_id}"
+                                qs = f"?api-key={MURF_API_KEY}&sample_rate={MURF_STREAM_SAMPLE_RATE}&channel_type=MONO&format=WAV&context_id={murf_context_id}"
                                 async with _websockets.connect(murf_ws_url + qs) as ws:
                                     voice_config_msg = {
                                         "voice_config": {
-                                            "voiceId": "en-IN-priya",
+                                            "voiceId": MURF_STREAM_VOICE,
                                             "style": "Conversational",
                                             "rate": 0,
                                             "pitch": 0,
@@ -1366,6 +5312,7 @@ async def websocket_endpoint(websocket: WebSocket):
                                         }
                                     }
                                     await ws.send(_json.dumps(voice_config_msg))
+                                    recorder.event("murf.open", context_id=murf_context_id)
                                     print("🔌 Murf WS: connected and voice config sent", flush=True)
 
                                     async def _receiver():
@@ -1389,8 +5336,10 @@ async def websocket_endpoint(websocket: WebSocket):
                                                 b64 = data.get("audio") or ""
                                                 preview = b64[:60] + ("..." if len(b64) > 60 else "")
                                                 end_of_turn = data.get("end_of_turn")
+                                                recorder.event("murf.chunk", index=chunk_idx, bytes=len(b64) * 3 // 4, end_of_turn=end_of_turn)
                                                 print(f"[murf][chunk {chunk_idx}] base64({len(b64)}): {preview} (end_of_turn={end_of_turn})", flush=True)
                                                 print(f"▶ forwarding audio_chunk #{chunk_idx} to client", flush=True)
+                                                turn["audio_started"] = True
                                                 try:
                                                     loop.create_task(safe_ws_send({
                                                         "type": "audio_chunk",
@@ -1405,14 +5354,27 @@ async def websocket_endpoint(websocket: WebSocket):
                                                 # Log any non-audio messages (acks/errors/status)
                                                 print(f"[murf] message: {data}", flush=True)
                                             if data.get("final"):
+                                                recorder.event("murf.final", chunks=chunk_idx - 1)
+                                                # Lets the browser's jitter buffer play out the tail without waiting
+                                                try:
+                                                    loop.create_task(safe_ws_send({"type": "audio_done"}))
+                                                except Exception:
+                                                    pass
                                                 print("[murf] ✅ final chunk received; closing Murf receive loop", flush=True)
                                                 print("✅ Murf audio stream finalized; client should have all chunks.", flush=True)
                                                 break
 
                                     async def _sender():
+                                        # Gemini tokens -> spoken text, cut only at safe boundaries
+                                        normalizer = SpeechNormalizer("stream")
                                         while True:
                                             item = await _asyncio.to_thread(tts_queue.get)
                                             if item is None:
+                                                tail = normalizer.flush()
+                                                if tail:
+                                                    recorder.event("murf.text", text=tail)
+                                                    await ws.send(_json.dumps({"text": tail}))
+                                                USAGE.record(_session_id, turn_id, tts_chars=normalizer.chars_out)
                                                 await ws.send(_json.dumps({"end": True}))
                                                 print("[murf] ▶️ sent end signal to Murf", flush=True)
                                                 try:
@@ -1421,7 +5383,10 @@ async def websocket_endpoint(websocket: WebSocket):
                                                 except Exception as e:
                                                     print(f"[murf] ⚠️ failed to send input_done: {e}", flush=True)
                                                 break
-                                            await ws.send(_json.dumps({"text": item}))
+                                            spoken = normalizer.feed(item)
+                                            if spoken:
+                                                recorder.event("murf.text", text=spoken)
+                                                await ws.send(_json.dumps({"text": spoken}))
 
                                     try:
                                         await _asyncio.gather(_sender(), _receiver())
@@ -1451,10 +5416,13 @@ async def websocket_endpoint(websocket: WebSocket):
                                     pass
 
                         def _run_murf():
-                            _asyncio.run(_murf_worker())
+                            try:
+                                _asyncio.run(_murf_worker())
+                            finally:
+                                ADMISSION["murf_stream"].release(murf_ticket)
 
-                        _threading.Thread(target=_run_murf, daemon=True).start()
-                    else:
+                        PROVIDER_EXECUTORS["murf_stream"].submit(_run_murf)
+                    elif not MURF_API_KEY:
                         print("⚠️  WARNING: MURF_API_KEY not set; skipping Murf WebSocket TTS streaming.")
                         try:
                             loop.create_task(safe_ws_send({
@@ -1467,90 +5435,60 @@ async def websocket_endpoint(websocket: WebSocket):
                     full_text = ""
                     print("🤖 LLM Response (streaming)", flush=True)
                     llm_chunk_idx = 1
+                    contents = list(messages)
                     try:
-                        for r in responses:
-                            if r.candidates and r.candidates[0].content and r.candidates[0].content.parts:
-                                part = r.candidates[0].content.parts[0]
-                                if hasattr(part, 'text') and part.text:
-                                    chunk = part.text
-                                    full_text += chunk
-                                    chunk_preview = chunk[:60] + ("..." if len(chunk) > 60 else "")
-                                    print(f"[llm][chunk {llm_chunk_idx}] text({len(chunk)}): {chunk_preview}", flush=True)
-                                    llm_chunk_idx += 1
+                        for round_idx in range(MAX_TOOL_ROUNDS + 1):
+                            calls = []
+                            round_text = ""
+                            round_usage = {}
+                            for r in responses:
+                                round_usage = llm_usage(r) if getattr(r, "usage_metadata", None) else round_usage
+                                if not (r.candidates and r.candidates[0].content and r.candidates[0].content.parts):
+                                    continue
+                                for part in r.candidates[0].content.parts:
+                                    if getattr(part, 'function_call', None):
+                                        calls.append(part.function_call)
+                                    elif getattr(part, 'text', None):
+                                        chunk = part.text
+                                        recorder.event("llm.chunk", round=round_idx, text=chunk)
+                                        full_text += chunk
+                                        round_text += chunk
+                                        chunk_preview = chunk[:60] + ("..." if len(chunk) > 60 else "")
+                                        print(f"[llm][chunk {llm_chunk_idx}] text({len(chunk)}): {chunk_preview}", flush=True)
+                                        llm_chunk_idx += 1
+                                        if speak:
+                                            print(f"[murf] queued text chunk len={len(chunk)}", flush=True)
+                                            tts_queue.put(chunk)
+                            USAGE.record(_session_id, turn_id, **round_usage)
+                            if not calls or round_idx == MAX_TOOL_ROUNDS:
+                                break
+
+                            # Run every requested tool at once, then answer all of them in one follow-up turn
+                            send_filler("lookup", turn)
+                            USAGE.record(_session_id, turn_id, tool_calls=len(calls))
+                            for fc in calls:
+                                recorder.event("llm.tool_call", round=round_idx, name=fc.name, args=dict(fc.args or {}))
+                            outcomes = execute_tool_calls(calls, _session_id)
+                            for o in outcomes:
+                                recorder.event("tool.result", name=o["name"], ok=o["ok"], elapsed_ms=o["elapsed_ms"])
+                            for o in outcomes:
+                                if o["name"] == 'spotify_search' and isinstance(o["result"], list) and o["result"]:
+                                    # Send structured results for frontend to optionally auto-play preview
                                     try:
-                                        print(f"[murf] queued text chunk len={len(chunk)}", flush=True)
-                                        tts_queue.put(chunk)
+                                        loop.create_task(safe_ws_send({
+                                            "type": "spotify_results",
+                                            "results": o["result"]
+                                        }))
                                     except Exception:
                                         pass
-                                elif hasattr(part, 'function_call') and part.function_call:
-                                    fc = part.function_call
-                                    if fc.name == 'tavily_search' and fc.args and 'query' in fc.args:
-                                        query = fc.args['query']
-                                        print(f"🔎 Calling tool: tavily_search with query: '{query}'")
-                                        search_result = tavily_search(query)
-                                        print(f"✅ Tool result: {search_result}")
-                                        # Append to full_text and send to UI as assistant message
-                                        full_text += (search_result or "")
-                                        try:
-                                            loop.create_task(safe_ws_send({
-                                                "type": "assistant",
-                                                "text": search_result
-                                            }))
-                                        except Exception:
-                                            pass
-                                        try:
-                                            tts_queue.put(search_result)
-                                        except Exception:
-                                            pass
-                                    elif fc.name == 'spotify_search' and fc.args and 'query' in fc.args:
-                                        query = fc.args['query']
-                                        print(f"🎵 Calling tool: spotify_search with query: '{query}'")
-                                        results = spotify_search(query, limit=3, session_id=_session_id, market="US")
-                                        if not any((r or {}).get('preview_url') for r in (results or [])):
-                                            alt = itunes_search(query, limit=3)
-                                            if alt:
-                                                results = alt
-                                        # Build a concise textual summary for TTS and chat
-                                        if results:
-                                            # Build once and send once; avoid duplicate messages in UI
-                                            lines = ["Here are some Spotify results:"]
-                                            for i, r in enumerate(results[:3], start=1):
-                                                lines.append(f"{i}. {r['name']} — {r['artists']} (album: {r['album']})")
-                                            summary = "\n".join(lines)
-                                            # Do not append/send summary twice
-                                            try:
-                                                loop.create_task(safe_ws_send({
-                                                    "type": "assistant",
-                                                    "text": summary
-                                                }))
-                                            except Exception:
-                                                pass
-                                            try:
-                                                tts_queue.put(summary)
-                                            except Exception:
-                                                pass
-                                            # Send structured results for frontend to optionally auto-play preview
-                                            try:
-                                                loop.create_task(safe_ws_send({
-                                                    "type": "spotify_results",
-                                                    "results": results
-                                                }))
-                                            except Exception:
-                                                pass
-                                        else:
-                                            msg = "I couldn't find any matching tracks on Spotify."
-                                            full_text += "\n" + msg
-                                            try:
-                                                loop.create_task(safe_ws_send({
-                                                    "type": "assistant",
-                                                    "text": msg
-                                                }))
-                                            except Exception:
-                                                pass
-                                            try:
-                                                tts_queue.put(msg)
-                                            except Exception:
-                                                pass
+                            model_parts = ([genai.protos.Part(text=round_text)] if round_text else []) + [
+                                genai.protos.Part(function_call=fc) for fc in calls
+                            ]
+                            contents = contents + [
+                                genai.protos.Content(role="model", parts=model_parts),
+                                genai.protos.Content(role="user", parts=function_response_parts(outcomes)),
+                            ]
+                            responses = model.generate_content(contents, stream=True)
                     except Exception as e:
                         print(f"❌ Gemini streaming iteration error: {e}")
                         try:
@@ -1561,15 +5499,13 @@ async def websocket_endpoint(websocket: WebSocket):
                         except Exception:
                             pass
                         return
+                    recorder.event("llm.done", chars=len(full_text))
                     print("--- END OF GEMINI STREAM ---", flush=True)
                     print(f"🧩 LLM full response: {full_text}", flush=True)
 
                     # Signal end of text to Murf
-                    try:
-                        if MURF_API_KEY:
-                            tts_queue.put(None)
-                    except Exception:
-                        pass
+                    if speak:
+                        tts_queue.put(None)
 
                     # 3) Update session history
                     chat_sessions[_session_id] = messages + [{"role": "model", "parts": [full_text]}]
@@ -1585,8 +5521,23 @@ async def websocket_endpoint(websocket: WebSocket):
                 except Exception as e:
                     print(f"❌ LLM streaming error: {e}")
 
-            import threading
-            threading.Thread(target=_stream_llm_response, args=(event.transcript, session_id), daemon=True).start()
+            def _stream_admitted(final_text: str, ticket: AdmissionTicket):
+                try:
+                    _stream_llm_response(final_text, session_id, turn_id)
+                finally:
+                    ADMISSION["llm_stream"].release(ticket)
+
+            async def _admit_llm(final_text: str):
+                # Wait for an LLM slot on the loop rather than parking a Gemini worker
+                try:
+                    ticket = await ADMISSION["llm_stream"].acquire(client_id)
+                except AdmissionBusy as e:
+                    recorder.event("busy", **e.payload())
+                    await safe_ws_send(e.payload())
+                    return
+                PROVIDER_EXECUTORS["gemini_stream"].submit(_stream_admitted, final_text, ticket)
+
+            asyncio.run_coroutine_threadsafe(_admit_llm(event.transcript), loop)
 
         # Enable formatting once turn ends (optional)
         if event.end_of_turn and not event.turn_is_formatted:
@@ -1594,32 +5545,26 @@ async def websocket_endpoint(websocket: WebSocket):
             client.set_params(StreamingSessionParameters(format_turns=True))
 
     def on_error(client, error: StreamingError):
+        recorder.event("stt.error", error=str(error))
         print(f"❌ Error: {error}")
 
     def on_terminated(client, event: TerminationEvent):
+        recorder.event("stt.terminated", audio_duration_seconds=event.audio_duration_seconds)
         print(f"🔴 Session terminated after {event.audio_duration_seconds}s audio", flush=True)
-
-    # Create streaming client
-    client = StreamingClient(
-        StreamingClientOptions(api_key=ASSEMBLYAI_API_KEY, api_host="streaming.assemblyai.com")
+        USAGE.record(session_id, stt_seconds=event.audio_duration_seconds or 0)
+
+    # Take a pre-connected AssemblyAI session, or connect one in the background;
+    # audio received meanwhile is buffered, so the user can speak right away
+    stt = BufferedSttSession(
+        {
+            StreamingEvents.Begin: on_begin,
+            StreamingEvents.Turn: on_turn,
+            StreamingEvents.Error: on_error,
+            StreamingEvents.Termination: on_terminated,
+        },
+        on_failed=lambda: loop.create_task(websocket.close()),
     )
-    client.on(StreamingEvents.Begin, on_begin)
-    client.on(StreamingEvents.Turn, on_turn)
-    client.on(StreamingEvents.Error, on_error)
-    client.on(StreamingEvents.Termination, on_terminated)
-
-    # Connect to AssemblyAI realtime transcription
-    try:
-        client.connect(
-            StreamingParameters(
-                sample_rate=16000,     # required 16kHz
-                format_turns=True      # get punctuated, turn-formatted transcripts
-            )
-        )
-    except Exception as e:
-        print(f"❌ Failed to connect to AssemblyAI streaming: {e}")
-        await websocket.close()
-        return
+    stt.start()
 
     try:
         print("📡 WebSocket loop: receiving audio...", flush=True)
@@ -1629,16 +5574,30 @@ async def websocket_endpoint(websocket: WebSocket):
         while True:
             # Receive PCM16 audio bytes from browser with idle timeout
             try:
-                data = await asyncio.wait_for(websocket.receive_bytes(), timeout=idle_timeout_sec)
+                message = await asyncio.wait_for(websocket.receive(), timeout=idle_timeout_sec)
             except asyncio.TimeoutError:
                 print(f"⏱️ No audio for {idle_timeout_sec}s; terminating session", flush=True)
                 break
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            data = message.get("bytes")
+            if data is None:
+                # Text frames carry client control messages (playback reports)
+                try:
+                    control = json.loads(message.get("text") or "")
+                    # Nested, so client keys can never collide with event()'s own arguments
+                    recorder.event("ws.in", control=control)
+                    if control.get("type") == "playback_stats":
+                        record_playback_report(control)
+                except (ValueError, AttributeError, TypeError):
+                    pass
+                continue
             packets += 1
             total_samples += len(data) // 2  # Int16 samples
             if packets % 20 == 0:
                 print(f"📦 Sent {packets} packets, ~{total_samples/16000:.2f}s audio", flush=True)
-            # AssemblyAI SDK .stream is sync for raw bytes; do not await
-            client.stream(data)
+            recorder.audio(data)
+            stt.feed(data)
 
     except WebSocketDisconnect:
         print("ℹ️ WebSocket disconnected by client.")
@@ -1652,18 +5611,68 @@ async def websocket_endpoint(websocket: WebSocket):
         except Exception:
             pass
         print(f"✅ WebSocket loop ended. Total packets: {packets}, audio: ~{total_samples/16000:.2f}s", flush=True)
-        client.disconnect(terminate=True)
+        ADMISSION["ws"].release(ws_ticket)
+        await stt.close()
+        recorder.close()
         try:
             await websocket.close()
         except RuntimeError:
             pass
 
 # Serve service worker at /sw.js
-from fastapi.responses import FileResponse
-
+# The hashed app shell and manifest version are prepended so the worker's bytes
+# change (and it reinstalls) whenever any fingerprinted asset changes.
 @app.get("/sw.js")
 async def service_worker():
-    return FileResponse("sw.js", media_type="application/javascript")
+    manifest = asset_manifest()
+    precache = [manifest["by_path"][rel]["url"] for rel in SW_PRECACHE_ASSETS if rel in manifest["by_path"]]
+    prelude = (
+        f"self.AVA_ASSET_VERSION = {json.dumps(manifest['version'])};\n"
+        f"self.AVA_PRECACHE = {json.dumps(precache)};\n"
+    )
+    body = prelude + (BASE_DIR / "sw.js").read_text(encoding="utf-8")
+    return Response(content=body, media_type="application/javascript", headers={"Cache-Control": "no-cache"})
+
+# --- Warm-up & Startup Report ---
+# Registered last, so it runs after every other startup hook: it records
+# time-to-listen, then imports the provider SDKs and initializes the DB on a
+# background thread while the server starts accepting connections. With
+# AVA_WARMUP=0 everything loads on first use instead.
+WARMUP_ENABLED = os.getenv("AVA_WARMUP", "1").strip().lower() not in ("0", "false", "no")
+
+def _warm_up():
+    started = time.perf_counter()
+    if SQLALCHEMY_AVAILABLE:
+        ensure_db()
+    for proxy in (aai, aai_streaming, genai) + ((np,) if NUMPY_AVAILABLE else ()):
+        try:
+            proxy.load()
+        except ImportError as e:
+            if proxy is aai_streaming:
+                print("⚠️  WARNING: `assemblyai.streaming.v3` module not found. Real-time transcription will be disabled.")
+            else:
+                print(f"⚠️  WARNING: could not import {proxy.name}: {e}")
+        except Exception as e:
+            print(f"⚠️  Warm-up of {proxy.name} failed: {e}")
+    if STT_POOL_SIZE:
+        # Pre-connect the first streaming STT session(s) before any /ws client arrives
+        STT_POOL.schedule_refill()
+    STARTUP_PROFILE["warmup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    imports = ", ".join(f"{name} {ms:.0f}ms" for name, ms in STARTUP_PROFILE["imports"].items())
+    print(f"🔥 Warm-up done in {STARTUP_PROFILE['warmup_ms']:.0f}ms ({imports or 'nothing to import'})")
+
+@app.on_event("startup")
+async def _report_startup():
+    STARTUP_PROFILE["time_to_listen_ms"] = round((time.perf_counter() - _MODULE_LOAD_STARTED) * 1000, 1)
+    phases = ", ".join(f"{name} {ms:.0f}ms" for name, ms in STARTUP_PROFILE["phases"].items())
+    print(f"⏱️  Startup: module load {STARTUP_PROFILE['module_load_ms']:.0f}ms, "
+          f"ready to listen after {STARTUP_PROFILE['time_to_listen_ms']:.0f}ms ({phases})")
+    if WARMUP_ENABLED:
+        threading.Thread(target=_warm_up, name="ava-warmup", daemon=True).start()
+
+METRICS_SECTIONS["startup"] = lambda: STARTUP_PROFILE
+
+STARTUP_PROFILE["module_load_ms"] = round((time.perf_counter() - _MODULE_LOAD_STARTED) * 1000, 1)
 
 # --- Server Startup ---
 if __name__ == "__main__":
@@ -1674,6 +5683,7 @@ if __name__ == "__main__":
     print("   • GET  /                    - Main interface")
     print("   • POST /llm/query          - Voice conversation")
     print("   • POST /llm/text-query     - Text chat")
+    print("   • POST /llm/text-query/stream - Text chat (SSE)")
     print("   • POST /tts/echo/          - Echo bot")
     print("   • POST /generate-audio/    - Text to speech")
     print("   • POST /chat/clear         - Clear chat history")
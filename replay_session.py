@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Replay a /ws flight recording (AVA_FLIGHT_RECORDER) against AVA.
+
+The recorded microphone PCM is streamed to /ws with its original timing,
+divided by --speed, and every message the server sends back is timed. For
+each final user turn the tool prints how long it took to get the first
+filler, the first TTS audio chunk and the assistant text, next to the same
+figures from the recording.
+
+  python replay_session.py uploads/recordings/<file>.avarec.gz --dump
+  python replay_session.py <file> --url ws://localhost:8000/ws --speed 2
+  python replay_session.py <file> --stub --speed 4 --out after.json
+
+--stub starts AVA in-process with AssemblyAI, Gemini and Murf replaced by
+the recorded events (same transcripts, text chunks and audio chunk sizes,
+with the recorded provider delays divided by --speed). That profiles AVA's
+own pipeline offline. Compare runs made at the same speed.
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import socket
+import statistics
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+# Must match the writer in main.py (--- Session Flight Recorder ---)
+FLIGHT_MAGIC = b"AVAREC1\n"
+FLIGHT_RECORD = struct.Struct("<dBI")
+FLIGHT_META, FLIGHT_AUDIO, FLIGHT_EVENT = 0, 1, 2
+
+
+def read_recording(path):
+    """Return (metadata, audio [(t, bytes)], events [dict with "t"])."""
+    meta, audio, events = {}, [], []
+    with gzip.open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(FLIGHT_MAGIC):
+        raise ValueError(f"{path} is not a flight recording")
+    pos = len(FLIGHT_MAGIC)
+    while pos + FLIGHT_RECORD.size <= len(data):
+        t, kind, length = FLIGHT_RECORD.unpack_from(data, pos)
+        pos += FLIGHT_RECORD.size
+        payload = data[pos:pos + length]
+        pos += length
+        if kind == FLIGHT_META:
+            meta = json.loads(payload)
+        elif kind == FLIGHT_AUDIO:
+            audio.append((t, payload))
+        elif kind == FLIGHT_EVENT:
+            events.append({"t": t, **json.loads(payload)})
+    return meta, audio, sorted(events, key=lambda e: e["t"])
+
+
+def is_final_turn(msg):
+    return msg.get("type") == "transcript" and msg.get("end_of_turn") and msg.get("formatted")
+
+
+def turn_latencies(timeline):
+    """Per final transcript: ms until the first filler, audio chunk and assistant text that follow it."""
+    turns = []
+    for t, msg in timeline:
+        if is_final_turn(msg):
+            turns.append({"text": msg.get("text", ""), "at": t, "filler_ms": None, "audio_ms": None, "assistant_ms": None})
+            continue
+        if not turns:
+            continue
+        current = turns[-1]
+        field = {"filler_audio": "filler_ms", "audio_chunk": "audio_ms", "assistant": "assistant_ms"}.get(msg.get("type"))
+        if field and current[field] is None:
+            current[field] = round((t - current["at"]) * 1000, 1)
+    return turns
+
+
+def dump(meta, audio, events):
+    seconds = sum(len(chunk) for _, chunk in audio) / 2 / meta.get("sample_rate", 16000)
+    print(f"🛩️  Session {meta.get('session_id')} recorded {meta.get('started_at')}: {seconds:.1f}s audio, {len(events)} events")
+    for e in events:
+        fields = {k: v for k, v in e.items() if k not in ("t", "event", "audio_s")}
+        text = json.dumps(fields, ensure_ascii=False)
+        print(f"{e['t']:9.3f}s  audio@{e['audio_s']:7.2f}s  {e['event']:<16} {text[:120]}")
+
+
+# --- Stubbed providers -----------------------------------------------------
+
+def _script(events, start_kind, item_kinds, end_kind):
+    """Split events into per-call scripts: [[(delay_s, event), ...], ...]."""
+    scripts, current, origin = [], None, 0.0
+    for e in events:
+        if e["event"] == start_kind:
+            current, origin = [], e["t"]
+            scripts.append(current)
+        elif current is not None and e["event"] in item_kinds + (end_kind,):
+            current.append((e["t"] - origin, e))
+            if e["event"] == end_kind:
+                current = None
+    return deque(scripts)
+
+
+def install_stubs(events, speed):
+    """Start AVA with AssemblyAI, Gemini and Murf replaced by recorded events; returns the app."""
+    os.environ["ASSEMBLYAI_API_KEY"] = os.environ["GEMINI_API_KEY"] = os.environ["MURF_API_KEY"] = "replay"
+    os.environ.update(AVA_FILLER_AUDIO="0", AVA_WARMUP="0", AVA_STT_POOL_SIZE="0", AVA_FLIGHT_RECORDER="0")
+    import websockets
+    import main
+    from assemblyai.streaming.v3 import StreamingEvents
+    from concurrent.futures import ThreadPoolExecutor
+
+    stt_turns = deque(e for e in events if e["event"] == "stt.turn")
+    llm_scripts = _script(events, "llm.request", ("llm.chunk",), "llm.done")
+    murf_scripts = _script(events, "murf.open", ("murf.text", "murf.chunk"), "murf.final")
+
+    class RecordedSttConnection:
+        """Emits the recorded turns once as much audio has been streamed as when they were recorded."""
+
+        def __init__(self):
+            self.client = self
+            self.handlers = {}
+            self.audio_bytes = 0
+            self._callbacks = ThreadPoolExecutor(1)  # SDK callbacks run off the event loop
+
+        def connect(self):
+            pass
+
+        def fresh(self):
+            return True
+
+        def bind(self, handlers):
+            self.handlers = handlers
+            self._emit(StreamingEvents.Begin, SimpleNamespace(id="replay"))
+
+        def _emit(self, event, payload):
+            handler = self.handlers.get(event)
+            if handler:
+                self._callbacks.submit(handler, self, payload)
+
+        def stream(self, data):
+            self.audio_bytes += len(data)
+            position = self.audio_bytes / 32000
+            while stt_turns and stt_turns[0]["audio_s"] <= position:
+                e = stt_turns.popleft()
+                self._emit(StreamingEvents.Turn, SimpleNamespace(
+                    transcript=e["transcript"], end_of_turn=e["end_of_turn"], turn_is_formatted=e["formatted"]))
+
+        def set_params(self, params):
+            pass
+
+        def release(self, terminate=False):
+            if terminate:
+                self._emit(StreamingEvents.Termination, SimpleNamespace(audio_duration_seconds=self.audio_bytes / 32000))
+            self._callbacks.shutdown(wait=True)
+
+    class RecordedGeminiModel:
+        """Streams one recorded answer per call, every tool round folded in, at the recorded pace."""
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, contents, stream=True):
+            script = llm_scripts.popleft() if llm_scripts else []
+            started = time.perf_counter()
+            for delay, e in script:
+                if e["event"] != "llm.chunk":
+                    continue
+                time.sleep(max(0.0, started + delay / speed - time.perf_counter()))
+                part = SimpleNamespace(text=e["text"], function_call=None)
+                yield SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+    class RecordedMurfSocket:
+        """Answers the first text with the recorded audio chunk sizes (silence) at the recorded pace."""
+
+        def __init__(self):
+            import asyncio
+            self.script = murf_scripts.popleft() if murf_scripts else []
+            self.first_text = asyncio.Event()
+            self.origin = None
+            self.pending = deque(e for e in self.script if e[1]["event"] in ("murf.chunk", "murf.final"))
+            texts = [d for d, e in self.script if e["event"] == "murf.text"]
+            self.text_delay = texts[0] if texts else 0.0
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def send(self, message):
+            # The first text (or an empty turn's end marker) starts the recorded clock
+            if not self.first_text.is_set() and {"text", "end"} & set(json.loads(message)):
+                self.origin = time.perf_counter()
+                self.first_text.set()
+
+        async def recv(self):
+            import asyncio
+            await self.first_text.wait()
+            if not self.pending:
+                return json.dumps({"final": True})
+            delay, e = self.pending.popleft()
+            await asyncio.sleep(max(0.0, self.origin + (delay - self.text_delay) / speed - time.perf_counter()))
+            if e["event"] == "murf.final":
+                return json.dumps({"final": True})
+            audio = base64.b64encode(bytes(e["bytes"])).decode()
+            return json.dumps({"audio": audio, "end_of_turn": e.get("end_of_turn")})
+
+        async def close(self):
+            pass
+
+    main.StreamingSttConnection = RecordedSttConnection
+    main.genai = SimpleNamespace(GenerativeModel=RecordedGeminiModel, loaded=False)
+    websockets.connect = lambda *args, **kwargs: RecordedMurfSocket()
+    return main.app
+
+
+def serve_in_background(app):
+    """Run the app under uvicorn on a free local port; returns (server, thread, /ws URL)."""
+    import uvicorn
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"ws://127.0.0.1:{port}/ws"
+
+
+# --- Replay ------------------------------------------------------------------
+
+def replay(url, audio, speed, tail_s):
+    """Stream the recorded audio to url and return [(seconds since start, message)] for everything received."""
+    from websockets.sync.client import connect
+    from websockets.exceptions import ConnectionClosed
+
+    timeline = []
+    done = threading.Event()
+    with connect(url, max_size=None) as ws:
+        started = time.perf_counter()
+
+        def receive():
+            while not done.is_set():
+                try:
+                    raw = ws.recv(timeout=0.25)
+                except TimeoutError:
+                    continue
+                except ConnectionClosed:
+                    return
+                if isinstance(raw, str):
+                    timeline.append((time.perf_counter() - started, json.loads(raw)))
+
+        receiver = threading.Thread(target=receive, daemon=True)
+        receiver.start()
+        for t, chunk in audio:
+            time.sleep(max(0.0, started + t / speed - time.perf_counter()))
+            ws.send(chunk)
+        # Let the last turn's answer arrive before hanging up
+        time.sleep(tail_s)
+        done.set()
+        receiver.join(timeout=1)
+    return timeline
+
+
+def summarize(label, turns):
+    print(f"\n{label}")
+    for i, turn in enumerate(turns, 1):
+        cells = "  ".join(f"{name} {turn[f'{name}_ms'] if turn[f'{name}_ms'] is not None else '-':>7}"
+                          for name in ("filler", "audio", "assistant"))
+        print(f"  {i:>2}. {cells}   {turn['text'][:50]}")
+    for name in ("filler", "audio", "assistant"):
+        values = [t[f"{name}_ms"] for t in turns if t[f"{name}_ms"] is not None]
+        if values:
+            p95 = sorted(values)[min(len(values) - 1, round(0.95 * (len(values) - 1)))]
+            print(f"  {name:<9} p50 {statistics.median(values):8.1f} ms   p95 {p95:8.1f} ms   n={len(values)}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Replay an AVA /ws flight recording")
+    parser.add_argument("recording")
+    parser.add_argument("--url", default="ws://localhost:8000/ws", help="AVA /ws endpoint (ignored with --stub)")
+    parser.add_argument("--stub", action="store_true", help="run AVA in-process with recorded providers")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed factor (default 1x)")
+    parser.add_argument("--tail", type=float, default=None, help="seconds to wait for answers after the audio ends")
+    parser.add_argument("--dump", action="store_true", help="print the recorded events and exit")
+    parser.add_argument("--out", help="write the replay timeline and latencies as JSON")
+    args = parser.parse_args()
+
+    meta, audio, events = read_recording(args.recording)
+    if args.dump:
+        dump(meta, audio, events)
+        return 0
+    if not audio:
+        print("❌ Recording holds no audio")
+        return 1
+
+    url, server = args.url, None
+    if args.stub:
+        server, thread, url = serve_in_background(install_stubs(events, args.speed))
+    # By default wait as long as the recorded session kept going after its last audio frame
+    tail = args.tail if args.tail is not None else max(2.0, (events[-1]["t"] - audio[-1][0]) / args.speed + 1) if events else 2.0
+    session = f"replay-{meta.get('session_id', 'session')[:12]}-{int(time.time())}"
+    sep = "&" if "?" in url else "?"
+    print(f"🔁 Replaying {len(audio)} packets at {args.speed:g}x to {url} ({'stubbed' if args.stub else 'live'} providers)")
+
+    timeline = replay(f"{url}{sep}session={session}", audio, args.speed, tail)
+    if server is not None:
+        # Let the session's close path (STT release, recorder flush) finish before exit
+        server.should_exit = True
+        thread.join(timeout=10)
+    recorded = turn_latencies([(e["t"], e) for e in events if e["event"] == "ws.out"])
+    replayed = turn_latencies(timeline)
+    summarize("📼 Recorded", recorded)
+    summarize(f"🔁 Replay ({args.speed:g}x)", replayed)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"recording": args.recording, "speed": args.speed, "stub": args.stub,
+                       "recorded": recorded, "replayed": replayed,
+                       "timeline": [{"t": round(t, 4), **msg} for t, msg in timeline]}, f, indent=2)
+        print(f"\n💾 Saved {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
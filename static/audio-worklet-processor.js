@@ -1,12 +1,94 @@
-// Minimal AudioWorklet processor to forward mono Float32 frames to the main thread
+// AudioWorklet capture processor: resamples mono input to 16 kHz PCM16 on the
+// audio thread and hands the main thread ready-to-send 50 ms packets.
+//
+// Two output modes (chosen by the main thread through processorOptions):
+//  - transfer (default): packets are posted as transferable ArrayBuffers. The
+//    main thread posts each buffer back after ws.send(), so in steady state the
+//    worklet reuses a small pool instead of allocating per packet.
+//  - shared: when the page is cross-origin isolated, samples are written into
+//    a SharedArrayBuffer ring (Int16 samples + Int32 [write, read] indices) and
+//    the main thread drains whole packets from it; no messages per packet.
 class PCMProcessor extends AudioWorkletProcessor {
+  constructor(options) {
+    super();
+    const opts = (options && options.processorOptions) || {};
+    this.targetRate = opts.targetRate || 16000;
+    this.packetSamples = opts.packetSamples || 800; // 50 ms @ 16 kHz
+    // Input frames per output sample; averaged (box filter) when downsampling
+    this.ratio = sampleRate / this.targetRate;
+    this.phase = 0;
+    this.sum = 0;
+    this.count = 0;
+
+    this.pool = [];
+    this.packet = null;
+    this.fill = 0;
+    this.overruns = 0;
+
+    if (opts.ring && opts.indices) {
+      this.ring = new Int16Array(opts.ring);
+      this.indices = new Int32Array(opts.indices);
+      this.mask = this.ring.length - 1; // capacity is a power of two
+    }
+
+    this.port.onmessage = (ev) => {
+      const msg = ev.data;
+      if (msg && msg.type === 'recycle' && msg.buffer && msg.buffer.byteLength === this.packetSamples * 2) {
+        this.pool.push(msg.buffer);
+      }
+    };
+  }
+
+  nextPacket() {
+    const buffer = this.pool.pop() || new ArrayBuffer(this.packetSamples * 2);
+    this.packet = new Int16Array(buffer);
+    this.fill = 0;
+  }
+
+  write(sample) {
+    const s = sample < -1 ? -1 : sample > 1 ? 1 : sample;
+    const value = s < 0 ? s * 0x8000 : s * 0x7FFF;
+    if (this.ring) {
+      const write = Atomics.load(this.indices, 0);
+      const read = Atomics.load(this.indices, 1);
+      if (write - read >= this.ring.length) {
+        this.overruns++; // main thread fell behind; drop rather than overwrite unread audio
+        return;
+      }
+      this.ring[write & this.mask] = value;
+      Atomics.store(this.indices, 0, write + 1);
+      return;
+    }
+    if (!this.packet) this.nextPacket();
+    this.packet[this.fill++] = value;
+    if (this.fill === this.packetSamples) {
+      const buffer = this.packet.buffer;
+      this.packet = null;
+      this.port.postMessage({ type: 'pcm', buffer, overruns: this.overruns }, [buffer]);
+    }
+  }
+
   process(inputs) {
     const input = inputs && inputs[0];
-    if (input && input[0] && input[0].length) {
-      // Copy the buffer to avoid sharing the audio thread's memory
-      const copy = new Float32Array(input[0].length);
-      copy.set(input[0]);
-      this.port.postMessage(copy);
+    const channel = input && input[0];
+    if (!channel || !channel.length) return true;
+    if (this.ratio === 1) {
+      for (let i = 0; i < channel.length; i++) this.write(channel[i]);
+      return true;
+    }
+    // Streaming resampler: state carries across render quanta, so packet
+    // boundaries never introduce rounding drift
+    for (let i = 0; i < channel.length; i++) {
+      const x = channel[i];
+      this.sum += x;
+      this.count++;
+      this.phase += 1;
+      while (this.phase >= this.ratio) {
+        this.write(this.count ? this.sum / this.count : x);
+        this.phase -= this.ratio;
+        this.sum = 0;
+        this.count = 0;
+      }
     }
     return true; // keep processor alive
   }
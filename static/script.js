@@ -35,6 +35,7 @@ const App = {
         API_ENDPOINTS: {
             LLM_QUERY: '/llm/query',
             TEXT_QUERY: '/llm/text-query',
+            TEXT_QUERY_STREAM: '/llm/text-query/stream',
             GENERATE_AUDIO: '/generate-audio/',
             SESSIONS: '/sessions',
         }
@@ -366,12 +367,18 @@ function stopPlayback() {
     } catch {}
 
     // Stop streaming TTS playback
+    try { stopFillerAudio(); } catch {}
     try { App.state.ttsPendingChunks = []; } catch {}
     try { App.state.ttsIsPlaying = false; } catch {}
     try { App.state.receivedAudioB64 = []; } catch {}
     try { App.state.ttsQueuedUrl = null; } catch {}
-    // Best-effort: close or suspend the streaming AudioContext
-    try { if (App.state.ttsAudioContext) { App.state.ttsAudioContext.close(); App.state.ttsAudioContext = null; } } catch {}
+    if (App.state.ttsPlayer && App.state.ttsPlayer.node) {
+        // The worklet drops its queue at once; the context stays up for the next turn
+        flushTtsPlayback();
+    } else {
+        // Legacy path: closing the context cancels every scheduled buffer source
+        try { if (App.state.ttsAudioContext) { App.state.ttsAudioContext.close(); App.state.ttsAudioContext = null; } } catch {}
+    }
 
     // Optional: reflect status text succinctly
     try { const s = document.getElementById('statusText'); if (s) s.textContent = 'Playback stopped'; } catch {}
@@ -379,6 +386,62 @@ function stopPlayback() {
     // Keep UI intact; no other changes
 }
 
+// Play a pre-rendered filler clip ("Got it.", "Let me look that up.") while the real reply is prepared.
+// Clips are cached by id; the server only sends audio the first time a clip is used on a socket.
+async function playFillerAudio(msg) {
+    try {
+        if (App.state.ttsIsPlaying || App.state.previewIsPlaying || App.state.fillerSource) return;
+        if (!App.state.fillerCache) App.state.fillerCache = {};
+        const ctx = getTtsAudioContext();
+        if (ctx.state === 'suspended') ctx.resume().catch(() => {});
+        let buffer = App.state.fillerCache[msg.clip_id];
+        if (!buffer && typeof msg.audio_b64 === 'string') {
+            const bin = atob(msg.audio_b64);
+            const bytes = new Uint8Array(bin.length);
+            for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+            buffer = await ctx.decodeAudioData(bytes.buffer);
+            App.state.fillerCache[msg.clip_id] = buffer;
+        }
+        // Real TTS may have started while decoding
+        if (!buffer || App.state.ttsIsPlaying || App.state.fillerSource) return;
+        const gain = ctx.createGain();
+        gain.connect(ctx.destination);
+        const src = ctx.createBufferSource();
+        src.buffer = buffer;
+        src.connect(gain);
+        src.onended = () => {
+            if (App.state.fillerSource === src) {
+                App.state.fillerSource = null;
+                App.state.fillerGain = null;
+            }
+        };
+        App.state.fillerSource = src;
+        App.state.fillerGain = gain;
+        src.start();
+        console.log(`🗣️ Filler (${msg.kind}): ${msg.text}`);
+    } catch (e) {
+        console.warn('⚠️ Failed to play filler audio:', e);
+    }
+}
+
+// Fade out any filler clip quickly (no click) so real TTS takes over
+function stopFillerAudio() {
+    const src = App.state.fillerSource;
+    const gain = App.state.fillerGain;
+    App.state.fillerSource = null;
+    App.state.fillerGain = null;
+    if (!src) return;
+    try {
+        const ctx = src.context;
+        const t = ctx.currentTime;
+        if (gain) {
+            gain.gain.setValueAtTime(gain.gain.value, t);
+            gain.gain.linearRampToValueAtTime(0, t + 0.03);
+        }
+        src.stop(t + 0.035);
+    } catch {}
+}
+
 // Resume TTS if a URL is queued after preview ends
 function resumeTTSIfQueued() {
     try {
@@ -387,14 +450,164 @@ function resumeTTSIfQueued() {
             App.state.ttsAudioContext.resume().catch(()=>{});
         }
         if (Array.isArray(App.state.ttsPendingChunks) && App.state.ttsPendingChunks.length && !App.state.ttsIsPlaying) {
-            // Re-run the same chunk playback loop logic
+            // Legacy path: restart the buffer-source scheduler
             App.state.ttsIsPlaying = true;
-            const evt = new Event('resume-tts');
-            document.dispatchEvent(evt);
+            playPendingChunksLegacy();
         }
     } catch {}
 }
 
+// --- Streaming TTS playback ---
+// Murf PCM16 chunks are played by an AudioWorklet (static/tts-playback-processor.js)
+// that concatenates them in a ring buffer behind an adaptive jitter buffer.
+// Browsers without AudioWorklet schedule one AudioBufferSourceNode per chunk.
+const TTS_SAMPLE_RATE = 44100;
+
+function getTtsAudioContext() {
+    if (!App.state.ttsAudioContext) {
+        const Ctx = window.AudioContext || window.webkitAudioContext;
+        try {
+            // Matching Murf's rate spares the browser a resampling stage
+            App.state.ttsAudioContext = new Ctx({ sampleRate: TTS_SAMPLE_RATE });
+        } catch (_) {
+            try { App.state.ttsAudioContext = new Ctx(); } catch (e) { console.error('❌ Failed to create AudioContext:', e); }
+        }
+    }
+    return App.state.ttsAudioContext;
+}
+
+// Resolves to the playback AudioWorkletNode of the current context, or null to use the legacy path
+function ensureTtsPlayer() {
+    const ctx = getTtsAudioContext();
+    if (App.state.ttsPlayer && App.state.ttsPlayer.ctx === ctx) return App.state.ttsPlayer.ready;
+    const player = { ctx, node: null, ready: null };
+    player.ready = (async () => {
+        if (!ctx || !ctx.audioWorklet || typeof AudioWorkletNode === 'undefined') return null;
+        try {
+            const url = (window.AVA_ASSETS || {})['/static/tts-playback-processor.js'] || '/static/tts-playback-processor.js';
+            await ctx.audioWorklet.addModule(url);
+            const node = new AudioWorkletNode(ctx, 'tts-playback', {
+                numberOfInputs: 0,
+                outputChannelCount: [1],
+                processorOptions: {
+                    sourceRate: TTS_SAMPLE_RATE,
+                    // Initial jitter target; adapts to observed arrival gaps from there
+                    startMs: /Mobi|Android/i.test(navigator.userAgent) ? 150 : 80,
+                },
+            });
+            node.port.onmessage = (ev) => onTtsPlayerMessage(ev.data || {});
+            node.connect(ctx.destination);
+            player.node = node;
+            return node;
+        } catch (e) {
+            console.warn('⚠️ Playback worklet unavailable; using buffer sources:', e);
+            return null;
+        }
+    })();
+    App.state.ttsPlayer = player;
+    return player.ready;
+}
+
+function onTtsPlayerMessage(msg) {
+    const turn = App.state.ttsTurn || {};
+    if (msg.type === 'started') {
+        if (turn.firstChunkAt && turn.firstSoundMs === null) {
+            turn.firstSoundMs = Math.round(performance.now() - turn.firstChunkAt);
+        }
+    } else if (msg.type === 'underrun') {
+        console.warn(`⚠️ TTS underrun #${msg.underruns}; jitter target now ${msg.target_ms} ms`);
+    } else if (msg.type === 'drained' || msg.type === 'flushed') {
+        App.state.ttsIsPlaying = false;
+        reportPlayback({ ...msg.stats, first_sound_ms: turn.firstSoundMs, flushed: msg.type === 'flushed' });
+        App.state.ttsTurn = null;
+    }
+}
+
+// Per-turn playback quality goes back to the server (listed under `playback` in /metrics)
+function reportPlayback(stats) {
+    if (!stats || !stats.chunks) return;
+    try {
+        if (App.state.ws && App.state.ws.readyState === WebSocket.OPEN) {
+            App.state.ws.send(JSON.stringify({ type: 'playback_stats', ...stats }));
+        }
+    } catch {}
+}
+
+// Drop queued TTS audio immediately (stop button, "stop" intent)
+function flushTtsPlayback() {
+    const player = App.state.ttsPlayer;
+    if (player && player.node) {
+        try { player.node.port.postMessage({ type: 'flush' }); } catch {}
+    }
+}
+
+function decodeBase64(b64) {
+    if (typeof Uint8Array.fromBase64 === 'function') return Uint8Array.fromBase64(b64);
+    const bin = atob(b64);
+    const out = new Uint8Array(bin.length);
+    for (let i = 0; i < bin.length; i++) out[i] = bin.charCodeAt(i);
+    return out;
+}
+
+// PCM16 bytes of a WAV chunk. Murf sends a 44-byte RIFF header on the first chunk (sometimes on every chunk).
+function wavPayload(bytes, skipHeader) {
+    const riff = bytes.length >= 12
+        && bytes[0] === 0x52 && bytes[1] === 0x49 && bytes[2] === 0x46 && bytes[3] === 0x46      // RIFF
+        && bytes[8] === 0x57 && bytes[9] === 0x41 && bytes[10] === 0x56 && bytes[11] === 0x45;  // WAVE
+    const offset = (skipHeader || riff) ? Math.min(44, bytes.length) : 0;
+    return bytes.subarray(offset, offset + ((bytes.length - offset) & ~1));
+}
+
+// Legacy scheduler: one AudioBufferSourceNode per chunk, queued back to back
+function scheduleTtsChunkLegacy(pcm, first) {
+    const ctx = App.state.ttsAudioContext;
+    if (!ctx) return;
+    if (first) {
+        App.state.ttsPlayheadTime = ctx.currentTime;
+        App.state.ttsPendingChunks = [];
+        App.state.ttsIsPlaying = false;
+    }
+    const view = new DataView(pcm.buffer, pcm.byteOffset, pcm.length);
+    const f32 = new Float32Array(pcm.length >> 1);
+    for (let i = 0; i < f32.length; i++) f32[i] = view.getInt16(i * 2, true) / 32768;
+    if (!Array.isArray(App.state.ttsPendingChunks)) App.state.ttsPendingChunks = [];
+    App.state.ttsPendingChunks.push(f32);
+    // If a preview is playing, delay TTS playback until it completes
+    if (!App.state.ttsIsPlaying && !App.state.previewIsPlaying) {
+        App.state.ttsIsPlaying = true;
+        playPendingChunksLegacy();
+    }
+}
+
+function playPendingChunksLegacy() {
+    const ctx = App.state.ttsAudioContext;
+    const pending = App.state.ttsPendingChunks;
+    if (!ctx || !pending || !pending.length) {
+        App.state.ttsIsPlaying = false;
+        return;
+    }
+    const chunk = pending.shift();
+    const buffer = ctx.createBuffer(1, chunk.length, TTS_SAMPLE_RATE);
+    buffer.copyToChannel(chunk, 0);
+    const src = ctx.createBufferSource();
+    src.buffer = buffer;
+    src.connect(ctx.destination);
+    const now = ctx.currentTime;
+    if (!App.state.ttsPlayheadTime || App.state.ttsPlayheadTime < now) {
+        // Small safety delay; increase on mobile to reduce underruns
+        const safety = /Mobi|Android/i.test(navigator.userAgent) ? 0.15 : 0.08;
+        App.state.ttsPlayheadTime = now + safety;
+    }
+    try { src.start(App.state.ttsPlayheadTime); } catch (e) { console.error('❌ Failed to start audio source:', e); }
+    App.state.ttsPlayheadTime += buffer.duration;
+    if (pending.length > 0) {
+        // Schedule next chunk slightly later to give decode time on slower devices
+        setTimeout(() => playPendingChunksLegacy(), 10);
+    } else {
+        App.state.ttsIsPlaying = false;
+    }
+}
+
 // Tab Navigation System
 // ... (This part is good, but you can apply the same element caching logic)
 function initializeTabNavigation() {
@@ -976,133 +1189,62 @@ async function startRecording(existingStream = null) {
                             try { showNotification('No Spotify preview or link available for the results.', 'error'); } catch {}
                         }
                     }
+                } else if (msg && msg.type === 'filler_audio') {
+                    playFillerAudio(msg);
+                } else if (msg && msg.type === 'intent') {
+                    // Server-routed deterministic intent ("stop", "clear chat")
+                    if (msg.action === 'stop') {
+                        stopPlayback();
+                    } else if (msg.action === 'clear_chat') {
+                        try { showNotification('Conversation cleared', 'success'); } catch {}
+                    }
+                } else if (msg && msg.type === 'busy') {
+                    // Server shed this stage under load; a shed session ("ws") is closed right after
+                    const wait = msg.retry_after || 1;
+                    if (msg.stage === 'ws') {
+                        showNotification(`AVA is busy right now. Please try again in ${wait}s.`, 'warning');
+                        stopRecording();
+                    } else if (msg.stage === 'murf_stream') {
+                        showNotification('Voice is busy right now; answering in text.', 'warning', 3000);
+                    } else {
+                        showNotification(`AVA is busy right now. Please ask again in ${wait}s.`, 'warning');
+                    }
+                } else if (msg && msg.type === 'audio_done') {
+                    // Murf finished this turn: let the jitter buffer play out instead of waiting for more
+                    ensureTtsPlayer().then((node) => { if (node) node.port.postMessage({ type: 'end' }); });
                 } else if (msg && msg.type === 'audio_chunk') {
+                    // Real TTS audio replaces any filler clip
+                    stopFillerAudio();
                     // Collect base64 audio chunks from server and play streamingly
                     if (typeof msg.audio_b64 === 'string') {
-                        console.log(`🎵 Streaming audio chunk #${msg.chunk_index} received (${msg.audio_b64.length} chars)`);
-                        
-                        // Lazy init streaming playback state
-                        if (!App.state.ttsAudioContext) {
-                            try { 
-                                App.state.ttsAudioContext = new (window.AudioContext || window.webkitAudioContext)(); 
-                                console.log('🎧 AudioContext initialized for streaming playback');
-                            } catch (e) { 
-                                console.error('❌ Failed to create AudioContext:', e);
-                            }
-                        }
-                        if (App.state.ttsAudioContext && App.state.ttsAudioContext.state === 'suspended') {
-                            try { 
-                                App.state.ttsAudioContext.resume(); 
-                                console.log('▶️ AudioContext resumed');
-                            } catch (e) { 
-                                console.error('❌ Failed to resume AudioContext:', e);
-                            }
-                        }
-
-                        // Reset per-turn state at first chunk (Murf indexes from 1)
-                        if (typeof msg.chunk_index === 'number' && msg.chunk_index <= 1) {
-                            console.log('🔄 Starting new audio stream - resetting playback state');
+                        const first = typeof msg.chunk_index === 'number' && msg.chunk_index <= 1;
+                        if (first) {
+                            // Reset per-turn state at first chunk (Murf indexes from 1)
                             App.state.ttsWavHeaderPending = true;
-                            App.state.ttsPlayheadTime = App.state.ttsAudioContext ? App.state.ttsAudioContext.currentTime : 0;
-                            App.state.ttsIsPlaying = false;
-                            App.state.ttsPendingChunks = [];
                             App.state.receivedAudioB64 = [];
+                            App.state.ttsTurn = { firstChunkAt: performance.now(), firstSoundMs: null };
                         }
-
-                        // Decode base64 WAV chunks. Some providers prepend a 44-byte RIFF header per chunk.
-                        function b64ToPCM32(b64, skipHeader) {
-                            const binary = atob(b64);
-                            // Detect RIFF header in this chunk (robust if header appears on every chunk)
-                            const hasRiff = binary.length >= 12 && binary.substr(0, 4) === 'RIFF' && binary.substr(8, 4) === 'WAVE';
-                            const headerLen = hasRiff ? 44 : 0;
-                            const offset = (skipHeader || hasRiff) ? headerLen : 0;
-                            const len = binary.length - offset;
-                            if (len <= 0) {
-                                console.warn('⚠️ Empty audio chunk after header skip');
-                                return null;
-                            }
-                            console.log(`🔧 Decoding ${len} bytes (${offset ? 'skipped header' : 'no header'})`);
-                            const arr = new Uint8Array(len);
-                            for (let i = 0; i < len; i++) arr[i] = binary.charCodeAt(i + offset);
-                            const view = new DataView(arr.buffer);
-                            const samples = len / 2;
-                            const f32 = new Float32Array(samples);
-                            for (let i = 0; i < samples; i++) {
-                                const s = view.getInt16(i * 2, true);
-                                f32[i] = s / 32768;
-                            }
-                            console.log(`✅ Decoded ${samples} audio samples`);
-                            return f32;
-                        }
-
-                        // Schedule chunk playback
-                        function playPendingChunks() {
-                            if (!App.state.ttsAudioContext || !App.state.ttsPendingChunks || !App.state.ttsPendingChunks.length) {
-                                console.log('🔇 No more chunks to play - stopping playback');
-                                App.state.ttsIsPlaying = false;
-                                return;
-                            }
-                            const chunk = App.state.ttsPendingChunks.shift();
-                            if (!chunk || !chunk.length) {
-                                console.warn('⚠️ Empty chunk in queue - skipping');
-                                App.state.ttsIsPlaying = false;
-                                return;
-                            }
-                            console.log(`🔊 Playing chunk with ${chunk.length} samples`);
-                            const ctx = App.state.ttsAudioContext;
-                            const buffer = ctx.createBuffer(1, chunk.length, 44100);
-                            buffer.copyToChannel(chunk, 0);
-                            const src = ctx.createBufferSource();
-                            src.buffer = buffer;
-                            src.connect(ctx.destination);
-                            const now = ctx.currentTime;
-                            if (!App.state.ttsPlayheadTime || App.state.ttsPlayheadTime < now) {
-                                // Small safety delay; increase on mobile to reduce underruns
-                                const safety = /Mobi|Android/i.test(navigator.userAgent) ? 0.15 : 0.08;
-                                App.state.ttsPlayheadTime = now + safety;
-                                console.log(`⏰ Adjusted playhead time to ${App.state.ttsPlayheadTime.toFixed(3)}s (safety=${safety}s)`);
-                            }
-                            try { 
-                                src.start(App.state.ttsPlayheadTime); 
-                                console.log(`▶️ Started playback at ${App.state.ttsPlayheadTime.toFixed(3)}s`);
-                            } catch (e) { 
-                                console.error('❌ Failed to start audio source:', e);
-                            }
-                            App.state.ttsPlayheadTime += buffer.duration;
-                            console.log(`⏭️ Next playhead time: ${App.state.ttsPlayheadTime.toFixed(3)}s (duration: ${buffer.duration.toFixed(3)}s)`);
-                            if (App.state.ttsPendingChunks.length > 0) {
-                                // Schedule next chunk slightly later to give decode time on slower devices
-                                setTimeout(() => playPendingChunks(), 10);
-                            } else {
-                                console.log('✅ All chunks played - stream complete');
-                                App.state.ttsIsPlaying = false;
-                            }
-                        }
-
                         const skipHeader = !!App.state.ttsWavHeaderPending;
-                        const f32 = b64ToPCM32(msg.audio_b64, skipHeader);
-                        if (skipHeader) {
-                            App.state.ttsWavHeaderPending = false;
-                            console.log('📋 WAV header processed and skipped');
+                        App.state.ttsWavHeaderPending = false;
+                        const pcm = wavPayload(decodeBase64(msg.audio_b64), skipHeader);
+                        const at = performance.now();
+                        const ctx = getTtsAudioContext();
+                        if (ctx && ctx.state === 'suspended' && !App.state.previewIsPlaying) {
+                            ctx.resume().catch(() => {});
                         }
-                        if (f32 && f32.length) {
-                            if (!Array.isArray(App.state.ttsPendingChunks)) App.state.ttsPendingChunks = [];
-                            App.state.ttsPendingChunks.push(f32);
-                            console.log(`📥 Added chunk to queue (${App.state.ttsPendingChunks.length} chunks pending)`);
-                            if (!App.state.ttsIsPlaying) {
-                                // If a preview is playing, delay TTS playback until it completes
-                                if (App.state.previewIsPlaying) {
-                                    console.log('⏸️ Preview in progress - delaying TTS playback');
-                                    App.state.ttsIsPlaying = false;
-                                } else {
-                                    console.log('🎬 Starting streaming playback');
-                                    App.state.ttsIsPlaying = true;
-                                    playPendingChunks();
+                        // Promise callbacks run in order, so chunks stay ordered while the worklet loads
+                        ensureTtsPlayer().then((node) => {
+                            if (node) {
+                                App.state.ttsIsPlaying = true;
+                                if (pcm.length) {
+                                    const buffer = pcm.buffer;
+                                    node.port.postMessage({ type: 'pcm', buffer, offset: pcm.byteOffset, length: pcm.length, at, first }, [buffer]);
                                 }
+                                if (msg.end_of_turn) node.port.postMessage({ type: 'end' });
+                            } else if (pcm.length) {
+                                scheduleTtsChunkLegacy(pcm, first);
                             }
-                        } else {
-                            console.warn('⚠️ Failed to decode audio chunk - skipping');
-                        }
+                        });
 
                         // Keep copy of raw chunks to synthesize a final WAV for the player
                         App.state.receivedAudioB64.push(msg.audio_b64);
@@ -1227,33 +1369,50 @@ async function startRecording(existingStream = null) {
 
         App.state.sourceNode = App.state.audioContext.createMediaStreamSource(stream);
 
-        // Prefer AudioWorkletNode (no deprecation warnings). Fallback to ScriptProcessorNode.
+        // Packets of 50 ms (800 samples @16k) go to the server as binary frames
+        const packetSamples = App.state.pcmMinSamples || 800;
+
+        // Prefer AudioWorkletNode: it resamples and packs PCM16 on the audio thread,
+        // so the main thread only forwards finished packets. Fallback to ScriptProcessorNode.
         try {
             if (App.state.audioContext.audioWorklet) {
-                await App.state.audioContext.audioWorklet.addModule('/static/audio-worklet-processor.js');
-                App.state.workletNode = new AudioWorkletNode(App.state.audioContext, 'pcm-processor');
-                App.state.workletNode.port.onmessage = (ev) => {
-                    const float32 = ev.data; // Float32Array mono
-                    const sourceRate = App.state.audioContext && App.state.audioContext.sampleRate;
-                    if (!sourceRate || !App.state.ws || App.state.ws.readyState !== WebSocket.OPEN) return;
-                    const int16 = downsampleTo16kPCM(float32, sourceRate);
-                    if (int16 && int16.length) {
-                        // Accumulate and send in >=50ms chunks (800 samples @16k)
-                        if (!Array.isArray(App.state.pcmBuffer)) App.state.pcmBuffer = [];
-                        for (let i = 0; i < int16.length; i++) App.state.pcmBuffer.push(int16[i]);
-                        const minSamples = App.state.pcmMinSamples || 800;
-                        while (App.state.pcmBuffer.length >= minSamples) {
-                            const chunk = App.state.pcmBuffer.splice(0, minSamples);
-                            try { App.state.ws.send(new Int16Array(chunk).buffer); } catch {}
+                const workletUrl = (window.AVA_ASSETS || {})['/static/audio-worklet-processor.js'] || '/static/audio-worklet-processor.js';
+                await App.state.audioContext.audioWorklet.addModule(workletUrl);
+                const processorOptions = { targetRate: 16000, packetSamples };
+                // Cross-origin isolated pages share a ring buffer with the worklet instead of posting packets
+                const shared = !!window.crossOriginIsolated && typeof SharedArrayBuffer !== 'undefined';
+                if (shared) {
+                    App.state.pcmRing = {
+                        samples: new Int16Array(new SharedArrayBuffer(32768 * 2)), // ~2 s, power of two
+                        indices: new Int32Array(new SharedArrayBuffer(8)),         // [write, read]
+                        packet: new Int16Array(packetSamples),
+                    };
+                    processorOptions.ring = App.state.pcmRing.samples.buffer;
+                    processorOptions.indices = App.state.pcmRing.indices.buffer;
+                }
+                App.state.workletNode = new AudioWorkletNode(App.state.audioContext, 'pcm-processor', { processorOptions });
+                if (shared) {
+                    App.state.pcmDrainTimer = setInterval(drainPcmRing, 25);
+                } else {
+                    const port = App.state.workletNode.port;
+                    port.onmessage = (ev) => {
+                        const msg = ev.data;
+                        if (!msg || msg.type !== 'pcm') return;
+                        if (App.state.ws && App.state.ws.readyState === WebSocket.OPEN) {
+                            try { App.state.ws.send(msg.buffer); } catch {}
                         }
-                    }
-                };
+                        // send() copies the bytes, so the buffer goes back to the worklet's pool
+                        try { port.postMessage({ type: 'recycle', buffer: msg.buffer }, [msg.buffer]); } catch {}
+                    };
+                }
                 App.state.sourceNode.connect(App.state.workletNode);
             } else {
                 throw new Error('AudioWorklet not supported');
             }
         } catch (_) {
-            // Fallback: ScriptProcessorNode
+            // Fallback: ScriptProcessorNode (resampling stays on the main thread)
+            const packet = new Int16Array(packetSamples);
+            let fill = 0;
             App.state.processorNode = App.state.audioContext.createScriptProcessor(4096, 1, 1);
             App.state.processorNode.onaudioprocess = (e) => {
                 if (!e || !e.inputBuffer) return;
@@ -1261,14 +1420,11 @@ async function startRecording(existingStream = null) {
                 if (!sourceRate || !App.state.ws || App.state.ws.readyState !== WebSocket.OPEN) return;
                 const input = e.inputBuffer.getChannelData(0);
                 const int16 = downsampleTo16kPCM(input, sourceRate);
-                if (int16 && int16.length) {
-                    // Accumulate and send in >=50ms chunks (800 samples @16k)
-                    if (!Array.isArray(App.state.pcmBuffer)) App.state.pcmBuffer = [];
-                    for (let i = 0; i < int16.length; i++) App.state.pcmBuffer.push(int16[i]);
-                    const minSamples = App.state.pcmMinSamples || 800;
-                    while (App.state.pcmBuffer.length >= minSamples) {
-                        const chunk = App.state.pcmBuffer.splice(0, minSamples);
-                        try { App.state.ws.send(new Int16Array(chunk).buffer); } catch {}
+                for (let i = 0; i < int16.length; i++) {
+                    packet[fill++] = int16[i];
+                    if (fill === packetSamples) {
+                        try { App.state.ws.send(packet); } catch {}
+                        fill = 0;
                     }
                 }
             };
@@ -1276,6 +1432,24 @@ async function startRecording(existingStream = null) {
             try { App.state.processorNode.connect(App.state.audioContext.destination); } catch {}
         }
 
+        // Helper: forward every whole packet written to the shared ring since the last pass
+        function drainPcmRing() {
+            const ring = App.state.pcmRing;
+            if (!ring) return;
+            const mask = ring.samples.length - 1;
+            const n = ring.packet.length;
+            const write = Atomics.load(ring.indices, 0);
+            let read = Atomics.load(ring.indices, 1);
+            while (write - read >= n) {
+                for (let i = 0; i < n; i++) ring.packet[i] = ring.samples[(read + i) & mask];
+                read += n;
+                Atomics.store(ring.indices, 1, read);
+                if (App.state.ws && App.state.ws.readyState === WebSocket.OPEN) {
+                    try { App.state.ws.send(ring.packet); } catch {}
+                }
+            }
+        }
+
         // Helper: downsample Float32 mono to 16kHz Int16 PCM
         function downsampleTo16kPCM(buffer, sampleRate) {
             const targetRate = 16000;
@@ -1333,7 +1507,11 @@ function stopRecording() {
 
         // Teardown audio nodes safely
         try {
-            App.state.pcmBuffer = [];
+            if (App.state.pcmDrainTimer) {
+                clearInterval(App.state.pcmDrainTimer);
+                App.state.pcmDrainTimer = null;
+            }
+            App.state.pcmRing = null;
             if (App.state.workletNode) {
                 try { App.state.workletNode.port.onmessage = null; } catch {}
                 try { App.state.workletNode.disconnect(); } catch {}
@@ -1933,6 +2111,7 @@ async function askAI() {
         return;
     }
     
+    let typingIndicator = null;
     try {
         const btn = document.getElementById('askLLMBtn');
         if (btn) {
@@ -1946,33 +2125,44 @@ async function askAI() {
         addToTextChatHistory('user', question);
         
         // Add typing indicator
-        const typingIndicator = addTypingIndicator();
+        typingIndicator = addTypingIndicator();
         
-        // Call the text-only LLM endpoint
-        const response = await fetch('/llm/text-query', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                text: question,
-                session_id: App.state.sessionId
-            })
-        });
-        
-        const data = await response.json();
-        
-        if (!response.ok) {
-            throw new Error(data.detail || 'Failed to get AI response');
-        }
-        
-        // Remove typing indicator and add AI response
-        if (typingIndicator) {
-            typingIndicator.remove();
+        // Prefer the streaming endpoint; fall back to the JSON one if nothing was rendered
+        let streamed = null;
+        try {
+            streamed = await streamTextQuery(question, typingIndicator);
+        } catch (streamError) {
+            if (streamError && (streamError.rendered || streamError.busy)) throw streamError;
+            console.warn('⚠️ Streaming text query unavailable, falling back:', streamError);
         }
         
-        if (data.llmResponse) {
-            addToTextChatHistory('assistant', data.llmResponse);
+        if (!streamed) {
+            // Call the text-only LLM endpoint
+            const response = await fetch(App.config.API_ENDPOINTS.TEXT_QUERY, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    text: question,
+                    session_id: App.state.sessionId
+                })
+            });
+            
+            const data = await response.json();
+            
+            if (!response.ok) {
+                throw new Error(data.detail || data.error || 'Failed to get AI response');
+            }
+            
+            // Remove typing indicator and add AI response
+            if (typingIndicator) {
+                typingIndicator.remove();
+            }
+            
+            if (data.llmResponse) {
+                addToTextChatHistory('assistant', data.llmResponse);
+            }
         }
         
         // Clear input
@@ -2003,6 +2193,100 @@ async function askAI() {
     }
 }
 
+// Reads SSE events from /llm/text-query/stream and renders tokens as they arrive.
+// Returns the final text, or null when the stream could not be opened.
+async function streamTextQuery(question, typingIndicator) {
+    if (!window.ReadableStream || !window.TextDecoder) return null;
+    const response = await fetch(App.config.API_ENDPOINTS.TEXT_QUERY_STREAM, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify({
+            text: question,
+            session_id: App.state.sessionId
+        })
+    });
+    if (response.status === 503) {
+        // Shed under load: report it instead of retrying on the JSON endpoint
+        const data = await response.json().catch(() => ({}));
+        const err = new Error(data.error || 'AVA is busy right now');
+        err.busy = true;
+        throw err;
+    }
+    if (!response.ok || !response.body) return null;
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const toolLabels = {
+        tavily_search: 'Searching the web...',
+        spotify_search: 'Looking up music...',
+    };
+    let buffer = '';
+    let textEl = null;
+    let fullText = '';
+    let finalText = null;
+    
+    const fail = (detail) => {
+        const err = new Error(detail || 'Failed to get AI response');
+        err.rendered = !!textEl;
+        return err;
+    };
+    
+    const handleEvent = (event, data) => {
+        if (event === 'token') {
+            if (!textEl) {
+                if (typingIndicator) typingIndicator.remove();
+                textEl = addToTextChatHistory('assistant', data.text);
+            } else {
+                textEl.textContent += data.text;
+                const container = document.getElementById('text-chat-history-container');
+                if (container) container.scrollTop = container.scrollHeight;
+            }
+            fullText += data.text;
+        } else if (event === 'tool_call') {
+            const dots = typingIndicator && typingIndicator.querySelector('.message-text');
+            if (dots && !textEl) dots.textContent = toolLabels[data.name] || 'Working on it...';
+            console.log(`🛠️ Text Chat tool call: ${data.name}`, data.args);
+        } else if (event === 'tool_result') {
+            console.log(`✅ Text Chat tool result: ${data.name} ok=${data.ok}`);
+        } else if (event === 'done') {
+            finalText = data.llmResponse || fullText;
+        } else if (event === 'error') {
+            throw fail(data.detail);
+        }
+    };
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+            let event = 'message';
+            let dataLines = [];
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+            });
+            if (!dataLines.length) continue;
+            handleEvent(event, JSON.parse(dataLines.join('\n')));
+        }
+    }
+    
+    if (finalText === null) throw fail('Stream ended before the answer was complete');
+    if (textEl && textEl.textContent !== finalText) textEl.textContent = finalText;
+    if (!textEl) {
+        if (typingIndicator) typingIndicator.remove();
+        addToTextChatHistory('assistant', finalText);
+    }
+    console.log(`💬 Text Chat - assistant (streamed): ${finalText}`);
+    return finalText;
+}
+
 function addToTextChatHistory(role, message) {
     const chatHistory = document.getElementById('text-chat-history');
     if (!chatHistory || !message) return;
@@ -2045,6 +2329,7 @@ function addToTextChatHistory(role, message) {
     }
     
     console.log(`💬 Text Chat - ${role}: ${message}`);
+    return text;
 }
 
 function addTypingIndicator() {
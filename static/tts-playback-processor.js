@@ -0,0 +1,152 @@
+// AudioWorklet playback processor for streamed TTS (Murf PCM16 chunks).
+//
+// The page transfers each chunk's PCM bytes here; samples are appended to one
+// ring buffer and played back-to-back, so chunk boundaries are gapless. A
+// jitter buffer holds playback until enough audio is queued: the target is
+// sized from the mean and spread of chunk inter-arrival gaps, and raised after
+// every underrun. Messages in: pcm, end, flush. Messages out: started,
+// underrun, drained, flushed.
+const DECLICK_FRAMES = 64;
+
+class TTSPlaybackProcessor extends AudioWorkletProcessor {
+  constructor(options) {
+    super();
+    const opts = (options && options.processorOptions) || {};
+    this.sourceRate = opts.sourceRate || sampleRate;
+    this.step = this.sourceRate / sampleRate; // linear interpolation when rates differ
+    this.ring = new Float32Array(1 << 20); // ~23 s @ 44.1 kHz
+    this.mask = this.ring.length - 1;
+    this.write = 0;
+    this.readPos = 0;
+
+    this.minMs = opts.minMs || 40;
+    this.maxMs = opts.maxMs || 600;
+    this.floorMs = opts.startMs || 80;
+    this.gapMean = 0;
+    this.gapVar = 0;
+    this.gapSamples = 0;
+    this.lastAt = null;
+
+    this.state = 'idle'; // idle | buffering | playing
+    this.ended = false;
+    this.gain = 0;
+    this.last = 0;
+    this.resetTurn();
+
+    this.port.onmessage = (ev) => this.onMessage(ev.data || {});
+  }
+
+  resetTurn() {
+    this.turn = { chunks: 0, underruns: 0, overflowSamples: 0, started: false };
+  }
+
+  targetMs() {
+    const spread = this.gapSamples > 1 ? this.gapMean + 2 * Math.sqrt(this.gapVar) : 0;
+    return Math.min(this.maxMs, Math.max(this.minMs, this.floorMs, spread));
+  }
+
+  available() {
+    return this.write - Math.floor(this.readPos);
+  }
+
+  stats() {
+    return {
+      chunks: this.turn.chunks,
+      underruns: this.turn.underruns,
+      overflow_samples: this.turn.overflowSamples,
+      target_ms: Math.round(this.targetMs()),
+      jitter_ms: Math.round(Math.sqrt(this.gapVar)),
+    };
+  }
+
+  onMessage(msg) {
+    if (msg.type === 'pcm') {
+      if (msg.first) {
+        // New turn: audio already queued keeps playing, arrival gaps restart
+        this.resetTurn();
+        this.lastAt = null;
+        this.ended = false;
+        // Let the floor raised by past underruns relax again
+        this.floorMs = Math.max(this.minMs, this.floorMs * 0.9);
+      }
+      if (typeof msg.at === 'number') {
+        if (this.lastAt !== null) {
+          const gap = msg.at - this.lastAt;
+          const d = gap - this.gapMean;
+          this.gapMean += d / 8;
+          this.gapVar += (d * d - this.gapVar) / 8;
+          this.gapSamples++;
+        }
+        this.lastAt = msg.at;
+      }
+      this.append(new Int16Array(msg.buffer, msg.offset || 0, msg.length >> 1));
+      this.turn.chunks++;
+      if (this.state === 'idle') this.state = 'buffering';
+    } else if (msg.type === 'end') {
+      this.ended = true;
+      if (this.state === 'idle' && this.available() > 0) this.state = 'buffering';
+    } else if (msg.type === 'flush') {
+      this.readPos = this.write;
+      this.state = 'idle';
+      this.ended = false;
+      this.port.postMessage({ type: 'flushed', stats: this.stats() });
+      this.resetTurn();
+    }
+  }
+
+  append(samples) {
+    const room = this.ring.length - this.available();
+    const n = Math.min(samples.length, room);
+    for (let i = 0; i < n; i++) this.ring[(this.write + i) & this.mask] = samples[i] / 32768;
+    this.write += n;
+    this.turn.overflowSamples += samples.length - n;
+  }
+
+  process(inputs, outputs) {
+    const out = outputs[0] && outputs[0][0];
+    if (!out) return true;
+    if (this.state === 'buffering') {
+      const bufferedMs = (this.available() / this.sourceRate) * 1000;
+      if (bufferedMs >= this.targetMs() || (this.ended && this.available() > 0)) {
+        this.state = 'playing';
+        if (!this.turn.started) {
+          this.turn.started = true;
+          this.port.postMessage({ type: 'started', target_ms: Math.round(this.targetMs()) });
+        }
+      }
+    }
+    const need = this.step === 1 ? 1 : 2;
+    for (let i = 0; i < out.length; i++) {
+      if (this.state === 'playing') {
+        const i0 = Math.floor(this.readPos);
+        if (this.write - i0 >= need) {
+          const frac = this.readPos - i0;
+          const a = this.ring[i0 & this.mask];
+          this.last = frac ? a + (this.ring[(i0 + 1) & this.mask] - a) * frac : a;
+          this.readPos += this.step;
+          this.gain = Math.min(1, this.gain + 1 / DECLICK_FRAMES);
+          out[i] = this.last * this.gain;
+          continue;
+        }
+        this.readPos = this.write;
+        if (this.ended) {
+          this.state = 'idle';
+          this.port.postMessage({ type: 'drained', stats: this.stats() });
+          this.resetTurn();
+        } else {
+          // Ran dry mid-turn: rebuffer, and hold more audio from now on
+          this.state = 'buffering';
+          this.turn.underruns++;
+          this.floorMs = Math.min(this.maxMs, this.targetMs() * 1.5);
+          this.port.postMessage({ type: 'underrun', underruns: this.turn.underruns, target_ms: Math.round(this.targetMs()) });
+        }
+      }
+      // Ramp the last sample to silence instead of cutting it (no click)
+      this.gain = Math.max(0, this.gain - 1 / DECLICK_FRAMES);
+      out[i] = this.last * this.gain;
+    }
+    return true; // keep processor alive
+  }
+}
+
+registerProcessor('tts-playback', TTSPlaybackProcessor);
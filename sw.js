@@ -1,9 +1,17 @@
 // sw.js - PWA service worker for AVA
-// Network-first for HTML and JS to prevent stale reloads, with safe precache of static assets
+// Fingerprinted assets (/static/name.<hash>.ext) are immutable: precached on
+// install and served cache-first. HTML and unhashed JS/CSS stay network-first.
+// The server prepends AVA_ASSET_VERSION and AVA_PRECACHE when serving /sw.js.
 
-const CACHE_NAME = 'ava-cache-v3';
+const ASSET_VERSION = self.AVA_ASSET_VERSION || 'dev';
+const CACHE_NAME = 'ava-cache-v4';
+const ASSET_CACHE = `ava-assets-${ASSET_VERSION}`;
+const HASHED_ASSET_RE = /^\/static\/.+\.[0-9a-f]{10}(\.[^/.]+)?$/;
 
-// Keep only non-code, static assets in precache
+// Hashed app shell (code) goes to the versioned asset cache
+const APP_SHELL = self.AVA_PRECACHE || [];
+
+// Non-code static assets
 const FILES_TO_CACHE = [
   '/static/manifest.json',
   '/static/icons/icon-192.png',
@@ -15,7 +23,10 @@ const FILES_TO_CACHE = [
 
 self.addEventListener('install', (event) => {
   event.waitUntil(
-    caches.open(CACHE_NAME).then((cache) => cache.addAll(FILES_TO_CACHE))
+    Promise.all([
+      caches.open(CACHE_NAME).then((cache) => cache.addAll(FILES_TO_CACHE)),
+      caches.open(ASSET_CACHE).then((cache) => cache.addAll(APP_SHELL))
+    ])
   );
   // Activate immediately after installation
   self.skipWaiting();
@@ -24,7 +35,7 @@ self.addEventListener('install', (event) => {
 self.addEventListener('activate', (event) => {
   event.waitUntil(
     caches.keys().then((keys) =>
-      Promise.all(keys.map((k) => (k !== CACHE_NAME ? caches.delete(k) : null)))
+      Promise.all(keys.map((k) => (k !== CACHE_NAME && k !== ASSET_CACHE ? caches.delete(k) : null)))
     )
   );
   // Take control of all open pages
@@ -45,6 +56,18 @@ async function networkFirst(request) {
   }
 }
 
+// Helper: cache-first strategy for immutable, fingerprinted assets
+async function cacheFirst(request) {
+  const cached = await caches.match(request);
+  if (cached) return cached;
+  const response = await fetch(request);
+  if (response.ok) {
+    const cache = await caches.open(ASSET_CACHE);
+    cache.put(request, response.clone());
+  }
+  return response;
+}
+
 // Helper: stale-while-revalidate strategy
 async function staleWhileRevalidate(request) {
   const cached = await caches.match(request);
@@ -60,6 +83,13 @@ async function staleWhileRevalidate(request) {
 
 self.addEventListener('fetch', (event) => {
   const { request } = event;
+  const url = new URL(request.url);
+
+  // Cache-first for fingerprinted assets; their content never changes
+  if (url.origin === self.location.origin && HASHED_ASSET_RE.test(url.pathname)) {
+    event.respondWith(cacheFirst(request));
+    return;
+  }
 
   // Network-first for top-level navigations (HTML)
   if (request.mode === 'navigate') {
@@ -0,0 +1,195 @@
+"""
+Tests for admission control: AdmissionStage fairness and shedding, and /ws keying.
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from assemblyai.streaming.v3 import StreamingEvents
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import main
+from main import AdmissionBusy, AdmissionStage
+
+
+def make_stage(limit=1, per_client=0, queue_size=10, max_wait_s=5.0, typical_s=0.01, name="test"):
+    return AdmissionStage(name, limit, per_client, queue_size, max_wait_s, typical_s)
+
+
+def test_clients_are_admitted_round_robin():
+    stage = make_stage(limit=1)
+    first = stage.acquire_blocking("A")
+    order = []
+
+    def worker(client, index):
+        ticket = stage.acquire_blocking(client)
+        order.append(f"{client}{index}")
+        time.sleep(0.01)
+        stage.release(ticket)
+
+    threads = []
+    for client, index in [("A", 1), ("A", 2), ("A", 3), ("B", 1)]:
+        thread = threading.Thread(target=worker, args=(client, index))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.01)  # enqueue in a known order
+    stage.release(first)
+    for thread in threads:
+        thread.join()
+    # B's single request is not stuck behind A's burst
+    assert order == ["A1", "B1", "A2", "A3"]
+
+
+def test_per_client_limit_does_not_block_other_clients():
+    stage = make_stage(limit=4, per_client=1, max_wait_s=1.0)
+    held = stage.acquire_blocking("A")
+
+    async def scenario():
+        waiting = asyncio.ensure_future(stage.acquire("A"))
+        await asyncio.sleep(0.02)
+        other = await stage.acquire("B")
+        assert not waiting.done()
+        stage.release(held)
+        ticket = await waiting
+        assert ticket.state == "granted"
+        stage.release(ticket)
+        stage.release(other)
+
+    asyncio.run(scenario())
+    assert stage.stats()["active"] == 0
+
+
+def test_sheds_when_estimated_wait_exceeds_deadline():
+    stage = make_stage(limit=1, max_wait_s=0.5, typical_s=10.0)
+    stage.acquire_blocking("A")
+    with pytest.raises(AdmissionBusy) as excinfo:
+        stage.acquire_blocking("B")
+    assert excinfo.value.reason == "deadline"
+    assert excinfo.value.retry_after == 10
+    assert excinfo.value.payload()["type"] == "busy"
+    assert stage.stats()["shed"]["deadline"] == 1
+
+
+def test_sheds_when_queue_is_full():
+    stage = make_stage(limit=1, queue_size=0)
+    stage.acquire_blocking("A")
+    with pytest.raises(AdmissionBusy) as excinfo:
+        stage.acquire_blocking("B")
+    assert excinfo.value.reason == "queue_full"
+
+
+def test_wait_past_deadline_is_shed_as_expired():
+    stage = make_stage(limit=1, max_wait_s=0.1, typical_s=0.01)
+    stage.acquire_blocking("A")
+    with pytest.raises(AdmissionBusy) as excinfo:
+        stage.acquire_blocking("B")
+    assert excinfo.value.reason == "expired"
+    stats = stage.stats()
+    assert stats["shed"]["expired"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_cancelled_wait_leaves_queue_without_counting_a_shed():
+    stage = make_stage(limit=1, max_wait_s=1.0)
+    held = stage.acquire_blocking("A")
+
+    async def scenario():
+        waiting = asyncio.ensure_future(stage.acquire("B"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(scenario())
+    stage.release(held)
+    stats = stage.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["shed"]["total"] == 0
+    assert stats["active"] == 0
+
+
+def test_zero_limits_mean_unlimited():
+    stage = make_stage(limit=0, per_client=0, queue_size=0)
+    tickets = [stage.acquire_blocking("A") for _ in range(20)]
+    assert stage.stats()["active"] == 20
+    for ticket in tickets:
+        stage.release(ticket)
+        stage.release(ticket)  # double release is ignored
+    assert stage.stats()["active"] == 0
+
+
+# --- /ws: every socket from one address shares that address's limits ---
+
+class FakeSttSession:
+    """Stands in for BufferedSttSession so a socket stays open without AssemblyAI."""
+    instances = []
+
+    def __init__(self, handlers, on_failed=None):
+        self.handlers = handlers
+        FakeSttSession.instances.append(self)
+
+    def start(self):
+        pass
+
+    def feed(self, data):
+        pass
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def ws_client(monkeypatch):
+    FakeSttSession.instances = []
+    monkeypatch.setattr(main, "ASSEMBLYAI_API_KEY", "test-key")
+    monkeypatch.setattr(main, "streaming_available", lambda: True)
+    monkeypatch.setattr(main, "BufferedSttSession", FakeSttSession)
+    return TestClient(main.app)
+
+
+def receive_until(ws, message_type, limit=10):
+    for _ in range(limit):
+        message = ws.receive_json()
+        if message.get("type") == message_type:
+            return message
+    raise AssertionError(f"no {message_type} message")
+
+
+def test_two_sockets_from_one_address_share_the_session_limit(ws_client, monkeypatch):
+    stage = make_stage(limit=10, per_client=1, max_wait_s=0.2, typical_s=60.0, name="ws")
+    monkeypatch.setitem(main.ADMISSION, "ws", stage)
+    with ws_client.websocket_connect("/ws?session=first"):
+        with ws_client.websocket_connect("/ws?session=second") as second:
+            busy = second.receive_json()
+            assert busy["type"] == "busy" and busy["stage"] == "ws"
+            with pytest.raises(WebSocketDisconnect) as excinfo:
+                second.receive_json()
+            assert excinfo.value.code == 1013
+    deadline = time.monotonic() + 2
+    while stage.stats()["active"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stage.stats()["active"] == 0
+
+
+def test_llm_admission_on_ws_is_keyed_by_client_address(ws_client, monkeypatch):
+    llm = make_stage(limit=10, per_client=1, max_wait_s=0.2, typical_s=60.0, name="llm_stream")
+    monkeypatch.setitem(main.ADMISSION, "ws", make_stage(limit=10, per_client=0))
+    monkeypatch.setitem(main.ADMISSION, "llm_stream", llm)
+    # Another session from the same address already holds this client's only LLM slot
+    held = llm.acquire_blocking("testclient")
+    with ws_client.websocket_connect("/ws?session=turns") as ws:
+        ws.send_text('{"type": "hello"}')  # the endpoint is in its receive loop once this is read
+        deadline = time.monotonic() + 2
+        while not FakeSttSession.instances and time.monotonic() < deadline:
+            time.sleep(0.01)
+        on_turn = FakeSttSession.instances[0].handlers[StreamingEvents.Turn]
+        event = SimpleNamespace(transcript="Tell me a story about dragons.", end_of_turn=True, turn_is_formatted=True)
+        # The SDK calls back from its own thread with its client object as first argument
+        threading.Thread(target=on_turn, args=(object(), event)).start()
+        busy = receive_until(ws, "busy")
+        assert busy["stage"] == "llm_stream"
+    llm.release(held)
@@ -107,6 +107,47 @@ def test_ai_chat():
         print(f"❌ Error: {e}")
         return False
     
+    # Test 5: Streaming (SSE) variant
+    print("\n5️⃣ Testing streaming AI chat...")
+    try:
+        started = time.time()
+        first_token_at = None
+        events = []
+        with requests.post(
+            f"{base_url}/llm/text-query/stream",
+            json={
+                "text": "Name three colors, briefly.",
+                "session_id": session_id
+            },
+            headers={"Content-Type": "application/json", "Accept": "text/event-stream"},
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                print(f"❌ Failed with status {response.status_code}: {response.text}")
+                return False
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[5:].strip())
+                    events.append((event, data))
+                    if event == "token" and first_token_at is None:
+                        first_token_at = time.time()
+
+        done = [d for e, d in events if e == "done"]
+        if done and done[0].get("llmResponse"):
+            ttft = (first_token_at - started) if first_token_at else None
+            print(f"✅ Success! Streamed {sum(1 for e, _ in events if e == 'token')} tokens"
+                  + (f", first token after {ttft:.2f}s" if ttft is not None else ""))
+        else:
+            print(f"❌ Stream ended without a done event: {events[-1:] or 'no events'}")
+            return False
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return False
+    
     print("\n🎉 All AI Chat tests passed!")
     print("=" * 50)
     print("✨ Your AI Chat section is fully functional!")
@@ -115,6 +156,7 @@ def test_ai_chat():
     print("   ✅ Session-based chat history")
     print("   ✅ Chat history clearing")
     print("   ✅ Conversation continuity")
+    print("   ✅ Streaming responses (SSE)")
     print("   ✅ Error handling")
     
     return True
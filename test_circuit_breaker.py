@@ -0,0 +1,139 @@
+"""
+Tests for the tool registry: CircuitBreaker state transitions and ProviderTool retries.
+"""
+
+import pytest
+import requests
+
+import main
+from main import CircuitBreaker, CircuitOpenError, ProviderTool
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(main.time, "monotonic", clock)
+    return clock
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure("boom")
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure("boom")
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure("boom")
+    breaker.record_success()
+    breaker.record_failure("boom")
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_exactly_one_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure("boom")
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure("boom")
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_for_another_reset_period(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure("boom")
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure("still down")
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.last_error == "still down"
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} error", response=self)
+
+
+def fake_provider(monkeypatch, statuses):
+    """Serve one status per call, in order."""
+    calls = []
+
+    def request(method, url, timeout, **kwargs):
+        calls.append(timeout)
+        return FakeResponse(statuses[len(calls) - 1])
+
+    monkeypatch.setattr(main.requests, "request", request)
+    monkeypatch.setattr(main.time, "sleep", lambda s: None)
+    return calls
+
+
+def test_idempotent_tool_retries_transient_errors(monkeypatch):
+    calls = fake_provider(monkeypatch, [503, 429, 200])
+    tool = ProviderTool("test", max_timeout=5.0, idempotent=True, retries=2)
+    assert tool.request("GET", "https://example.com").status_code == 200
+    assert len(calls) == 3
+    health = tool.health()
+    assert (health["calls"], health["failures"], health["state"]) == (3, 2, "closed")
+
+
+def test_non_idempotent_tool_is_not_retried(monkeypatch):
+    calls = fake_provider(monkeypatch, [503, 200])
+    tool = ProviderTool("test", max_timeout=5.0)
+    with pytest.raises(requests.exceptions.HTTPError):
+        tool.request("POST", "https://example.com")
+    assert len(calls) == 1
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    calls = fake_provider(monkeypatch, [404, 200])
+    tool = ProviderTool("test", max_timeout=5.0, idempotent=True)
+    with pytest.raises(requests.exceptions.HTTPError):
+        tool.request("GET", "https://example.com")
+    assert len(calls) == 1
+
+
+def test_open_breaker_rejects_without_calling_the_provider(monkeypatch):
+    calls = fake_provider(monkeypatch, [500] * 10)
+    tool = ProviderTool("test", max_timeout=5.0)
+    tool.breaker.failure_threshold = 2
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.HTTPError):
+            tool.request("POST", "https://example.com")
+    with pytest.raises(CircuitOpenError):
+        tool.request("POST", "https://example.com")
+    assert len(calls) == 2
+    assert tool.health()["rejected"] == 1
@@ -0,0 +1,109 @@
+"""
+Tests for HistoryCache: byte-bounded LRU eviction and the stale-load guard.
+"""
+
+import pytest
+
+import main
+from main import HistoryCache
+
+
+def message(text, role="user"):
+    return {"role": role, "parts": [text]}
+
+
+def size_of(*texts):
+    return sum(len(t) for t in texts) + main.HISTORY_ENTRY_OVERHEAD * len(texts)
+
+
+def test_miss_loads_then_hits():
+    cache = HistoryCache(max_bytes=10_000)
+    loads = []
+    loader = lambda: loads.append(1) or [message("hi")]
+    assert cache.get_or_load("s1", loader) == [message("hi")]
+    assert cache.get_or_load("s1", loader) == [message("hi")]
+    assert len(loads) == 1
+    snapshot = cache.snapshot()
+    assert (snapshot["hits"], snapshot["misses"], snapshot["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_returned_history_is_a_copy():
+    cache = HistoryCache(max_bytes=10_000)
+    cache.get_or_load("s1", lambda: [message("hi")]).append(message("mutated"))
+    assert cache.get("s1") == [message("hi")]
+
+
+def test_least_recently_used_session_is_evicted_past_the_byte_budget():
+    entry = size_of("x" * 100)
+    cache = HistoryCache(max_bytes=entry * 2)
+    cache.get_or_load("a", lambda: [message("x" * 100)])
+    cache.get_or_load("b", lambda: [message("x" * 100)])
+    cache.get("a")  # "b" is now least recently used
+    cache.get_or_load("c", lambda: [message("x" * 100)])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    snapshot = cache.snapshot()
+    assert snapshot["evictions"] == 1
+    assert snapshot["bytes"] == entry * 2
+
+
+def test_append_grows_the_entry_and_can_evict_others():
+    cache = HistoryCache(max_bytes=size_of("x" * 100, "y" * 100))
+    cache.get_or_load("a", lambda: [message("x" * 100)])
+    cache.get_or_load("b", lambda: [message("x" * 50)])
+    cache.append("b", message("y" * 100, role="model"))
+    assert cache.get("a") is None
+    assert cache.get("b") == [message("x" * 50), message("y" * 100, role="model")]
+    assert cache.snapshot()["bytes"] == size_of("x" * 50, "y" * 100)
+
+
+def test_append_to_an_uncached_session_is_ignored():
+    cache = HistoryCache(max_bytes=10_000)
+    cache.append("s1", message("hi"))
+    assert cache.get("s1") is None
+    assert cache.snapshot()["appends"] == 0
+
+
+def test_history_larger_than_the_budget_is_not_cached():
+    cache = HistoryCache(max_bytes=50)
+    assert cache.get_or_load("s1", lambda: [message("x" * 100)]) == [message("x" * 100)]
+    assert cache.get("s1") is None
+    assert cache.snapshot()["bytes"] == 0
+
+
+def test_invalidate_during_load_keeps_the_stale_result_out():
+    cache = HistoryCache(max_bytes=10_000)
+
+    def loader():
+        # A write lands after the DB read but before the load is stored
+        cache.invalidate("s1")
+        return [message("stale")]
+
+    assert cache.get_or_load("s1", loader) == [message("stale")]
+    assert cache.get("s1") is None
+    assert cache.get_or_load("s1", lambda: [message("fresh")]) == [message("fresh")]
+    assert cache.get("s1") == [message("fresh")]
+
+
+def test_write_to_another_session_does_not_block_a_load():
+    cache = HistoryCache(max_bytes=10_000)
+
+    def loader():
+        cache.append("other", message("hi"))
+        return [message("mine")]
+
+    cache.get_or_load("s1", loader)
+    assert cache.get("s1") == [message("mine")]
+
+
+def test_failed_load_caches_nothing():
+    cache = HistoryCache(max_bytes=10_000)
+
+    def loader():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("s1", loader)
+    assert cache.get("s1") is None
+    assert cache.get_or_load("s1", lambda: [message("ok")]) == [message("ok")]
+    assert cache.get("s1") == [message("ok")]
@@ -0,0 +1,66 @@
+"""
+Tests for the intent router: which utterances skip Gemini, and which must not.
+"""
+
+import pytest
+
+from main import route_intent
+
+
+def intent_of(text):
+    match = route_intent(text)
+    return match and match["intent"]
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("Stop.", "stop"),
+    ("Hey Ava, be quiet please", "stop"),
+    ("Never mind", "stop"),
+    ("Clear the chat history", "clear_chat"),
+    ("Start over", "clear_chat"),
+    ("What time is it?", "time"),
+    ("Okay Ava, tell me the time", "time"),
+    ("What's today's date?", "date"),
+    ("What day is it", "date"),
+    ("Play the second one", "play_selection"),
+    ("Please pick number 3", "play_selection"),
+    ("What's the weather in Paris?", "weather"),
+    ("Weather", "weather"),
+    ("Search the web for python 3.13 release notes", "web_search"),
+    ("Look up the Eiffel Tower", "web_search"),
+    ("Google best pizza in Naples please", "web_search"),
+])
+def test_routed_intents(text, intent):
+    assert intent_of(text) == intent
+
+
+@pytest.mark.parametrize("text", [
+    "I'd like to play one of those games later",
+    "How do I look up a word in a dictionary",
+    "Can you explain how to search for files with grep?",
+    "Don't stop believing is a great song",
+    "What time zone is Tokyo in?",
+    "Tell me about the weather patterns of the Sahara in summer and why they form",
+    "Write a poem about starting over",
+    "Choose one: cats or dogs?",
+    "What is the weather in Paris tomorrow?",
+    "Weather in New York this weekend",
+    "What's the weather like tonight",
+    "How's the weather in Berlin on Saturday?",
+    "Weather for next week in Rome",
+    "What's the temperature in Oslo later",
+])
+def test_conversational_utterances_go_to_the_llm(text):
+    assert route_intent(text) is None
+
+
+def test_arguments_are_extracted():
+    assert route_intent("play the third song")["args"] == {"index": 3}
+    assert route_intent("what's the weather like in New York today")["args"] == {"location": "new york"}
+    assert route_intent("Search for Python 3.13 now")["args"] == {"query": "python 3.13"}
+
+
+def test_news_questions_search_with_the_full_text():
+    match = route_intent("What's the latest on the Mars mission?")
+    assert match["intent"] == "web_search"
+    assert match["args"]["query"] == "What's the latest on the Mars mission?"
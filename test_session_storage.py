@@ -0,0 +1,187 @@
+"""
+Tests for the paths that delete or overwrite stored sessions: NDJSON export/import,
+archive compaction and restore, purge, and VACUUM. Each test runs on a fresh SQLite file.
+"""
+
+import gzip
+import json
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+DB_GLOBALS = ("engine", "SessionLocal", "Base", "SessionModel", "MessageModel", "SessionArchiveModel",
+              "UsageModel", "func", "async_engine", "AsyncSessionLocal")
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    for name in DB_GLOBALS:
+        monkeypatch.setattr(main, name, getattr(main, name))
+    monkeypatch.setattr(main, "DB_PATH", tmp_path / "ava_test.db")
+    monkeypatch.setattr(main, "DB_READY", threading.Event())
+    monkeypatch.setattr(main, "DB_ASYNC_ENABLED", False)
+    monkeypatch.setattr(main, "_recently_restored", {})
+    assert main.ensure_db()
+    session = main.SessionLocal()
+    yield session
+    session.close()
+    main.engine.dispose()
+
+
+T0 = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def seed(db, session_id, contents, *, updated_at=T0, archived=False, pinned=False):
+    db.add(main.SessionModel(id=session_id, title=f"Chat {session_id}", archived=archived, pinned=pinned,
+                             created_at=updated_at, updated_at=updated_at))
+    for i, content in enumerate(contents):
+        db.add(main.MessageModel(id=f"{session_id}-{i}", session_id=session_id, role="user" if i % 2 == 0 else "assistant",
+                                 content=content, created_at=updated_at + timedelta(seconds=i)))
+    db.commit()
+
+
+def messages(db, session_id):
+    rows = (db.query(main.MessageModel)
+            .filter_by(session_id=session_id)
+            .order_by(main.MessageModel.created_at, main.MessageModel.id))
+    return [(m.id, m.role, m.content) for m in rows]
+
+
+def counts(db):
+    return (db.query(main.SessionModel).count(), db.query(main.MessageModel).count(),
+            db.query(main.SessionArchiveModel).count())
+
+
+def wipe(db):
+    for model in (main.SessionArchiveModel, main.MessageModel, main.SessionModel):
+        db.query(model).delete()
+    db.commit()
+
+
+def export(client, **params):
+    resp = client.get("/sessions/export", params=params)
+    assert resp.status_code == 200
+    return resp.content
+
+
+def test_export_then_import_round_trips_sessions_and_messages(db):
+    seed(db, "a", ["hello", "hi there", "how are you? ✨"])
+    seed(db, "b", ["second chat"], pinned=True)
+    client = TestClient(main.app)
+    body = export(client)
+    before = {sid: messages(db, sid) for sid in ("a", "b")}
+
+    wipe(db)
+    summary = client.post("/sessions/import", content=body).json()
+    assert (summary["sessions"], summary["messages"], summary["errors"]) == (2, 4, 0)
+    db.expire_all()
+    assert counts(db) == (2, 4, 0)
+    assert {sid: messages(db, sid) for sid in ("a", "b")} == before
+    assert db.get(main.SessionModel, "b").pinned
+
+
+def test_gzip_export_imports_the_same_rows(db):
+    seed(db, "a", ["one", "two"])
+    client = TestClient(main.app)
+    body = export(client, gzip=1)
+    assert gzip.decompress(body).count(b"\n") == 3
+
+    wipe(db)
+    summary = client.post("/sessions/import", content=body).json()
+    assert (summary["sessions"], summary["messages"]) == (1, 2)
+    db.expire_all()
+    assert [c for _, _, c in messages(db, "a")] == ["one", "two"]
+
+
+def test_import_skips_existing_rows_unless_replace_is_set(db):
+    seed(db, "a", ["original"])
+    client = TestClient(main.app)
+    body = export(client)
+    db.get(main.MessageModel, "a-0").content = "edited"
+    db.commit()
+
+    summary = client.post("/sessions/import", content=body).json()
+    assert (summary["sessions"], summary["messages"]) == (0, 0)
+    db.expire_all()
+    assert messages(db, "a") == [("a-0", "user", "edited")]
+
+    summary = client.post("/sessions/import", params={"replace": 1}, content=body).json()
+    assert (summary["sessions"], summary["messages"]) == (1, 1)
+    db.expire_all()
+    assert messages(db, "a") == [("a-0", "user", "original")]
+    assert counts(db) == (1, 1, 0)
+
+
+def test_bad_lines_are_counted_and_the_rest_imported(db):
+    lines = [
+        json.dumps({"type": "session", "id": "x"}),
+        "not json",
+        json.dumps({"type": "message", "session_id": "x", "id": "m1", "role": "user", "content": "kept"}),
+        json.dumps({"type": "message", "content": "no session"}),
+    ]
+    summary = TestClient(main.app).post("/sessions/import", content="\n".join(lines)).json()
+    assert (summary["sessions"], summary["messages"], summary["errors"]) == (1, 1, 2)
+    assert messages(db, "x") == [("m1", "user", "kept")]
+
+
+def test_compact_restore_and_purge(db, monkeypatch):
+    now = T0 + timedelta(days=400)
+    seed(db, "old", ["first", "second", "third"])
+    seed(db, "flagged", ["archived by the user"], archived=True, updated_at=now - timedelta(days=2))
+    seed(db, "fresh", ["still hot"], updated_at=now)
+    original = messages(db, "old")
+
+    result = main.compact_sessions(db, now)
+    assert (result["sessions"], result["messages"]) == (2, 4)
+    assert counts(db) == (3, 1, 2)
+    assert messages(db, "fresh") == [("fresh-0", "user", "still hot")]
+    archive = db.get(main.SessionArchiveModel, "old")
+    assert archive.message_count == 3 and archive.last_message == "third"
+
+    # Compacted messages still export, from the archive blob
+    exported = [json.loads(line) for line in export(TestClient(main.app)).splitlines()]
+    assert [r["content"] for r in exported if r["type"] == "message" and r["session_id"] == "old"] == ["first", "second", "third"]
+
+    assert main.restore_session_messages(db, "old") == 3
+    assert messages(db, "old") == original
+    assert db.get(main.SessionArchiveModel, "old") is None
+    # A restored session is not re-compacted on the next pass
+    assert main.compact_sessions(db, now)["sessions"] == 0
+
+    db.get(main.SessionModel, "flagged").pinned = True
+    db.commit()
+    monkeypatch.setattr(main, "PURGE_AFTER_DAYS", 30)
+    assert main.purge_sessions(db, now) == 1
+    db.expire_all()
+    assert db.get(main.SessionModel, "old") is None
+    assert messages(db, "old") == []
+    # Pinned sessions survive, archive included; recent ones are untouched
+    assert db.get(main.SessionArchiveModel, "flagged").message_count == 1
+    assert counts(db) == (2, 1, 1)
+
+
+def test_purge_disabled_keeps_everything(db, monkeypatch):
+    seed(db, "old", ["kept forever"])
+    monkeypatch.setattr(main, "PURGE_AFTER_DAYS", 0)
+    assert main.purge_sessions(db, T0 + timedelta(days=10_000)) == 0
+    assert counts(db) == (1, 1, 0)
+
+
+def test_vacuum_frees_pages_and_keeps_data(db):
+    seed(db, "big", ["x" * 4000 for _ in range(200)])
+    seed(db, "small", ["keep me"])
+    db.query(main.MessageModel).filter_by(session_id="big").delete()
+    db.commit()
+    db.close()
+
+    first = main.vacuum_and_analyze()
+    assert first["mode"] in ("full", "incremental")
+    assert first["freed_pages"] > 0 or first["mode"] == "full"
+    assert main.vacuum_and_analyze()["mode"] == "incremental"
+    with main.SessionLocal() as fresh:
+        assert messages(fresh, "small") == [("small-0", "user", "keep me")]
+        assert fresh.query(main.MessageModel).count() == 1
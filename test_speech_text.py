@@ -0,0 +1,74 @@
+"""
+Tests for TTS text normalization: speech_text() and streamed SpeechNormalizer chunking.
+"""
+
+import pytest
+
+import main
+from main import SpeechNormalizer, speech_text
+
+
+@pytest.mark.parametrize("text, spoken", [
+    ("It's 14°C and windy.", "It's 14 degrees Celsius and windy."),
+    ("Rain chance is 40%.", "Rain chance is 40 percent."),
+    ("Expect 10–20 cm of snow.", "Expect 10 to 20 cm of snow."),
+    ("Read pages 5-7 tonight.", "Read pages 5 to 7 tonight."),
+    ("Paris — the capital — is lovely.", "Paris, the capital, is lovely."),
+    ("Fruit, e.g. apples & pears.", "Fruit, for example apples and pears."),
+    ("**Bold** and `code` stay readable.", "Bold and code stay readable."),
+    ("See [the docs](https://example.com/docs) for more.", "See the docs for more."),
+    ("Visit https://example.com now.", "Visit now."),
+    ("Tickets cost $25.", "Tickets cost 25 dollars."),
+])
+def test_speech_text_rewrites(text, spoken):
+    assert speech_text(text) == spoken
+
+
+def test_speech_text_drops_code_blocks_and_sources():
+    text = "Here is how.\n```python\nprint('hi')\n```\nDone.\n\nSources:\n- Example: https://example.com"
+    assert speech_text(text) == "Here is how. Done."
+
+
+def test_speech_text_never_returns_empty_for_a_bare_link():
+    assert speech_text("https://example.com") == "Here's the link."
+
+
+def stream(chunks):
+    normalizer = SpeechNormalizer("test")
+    outputs = [normalizer.feed(chunk) for chunk in chunks]
+    return outputs, normalizer.flush()
+
+
+def test_stream_cuts_at_sentence_boundaries():
+    outputs, tail = stream(["The capital of France ", "is Paris. It is ", "lovely in spring."])
+    assert outputs == ["", "The capital of France is Paris. ", ""]
+    assert tail == "It is lovely in spring."
+
+
+def test_stream_never_splits_a_link():
+    outputs, tail = stream(["Read [the guide](https://exa", "mple.com/a. b) today. ", "Bye."])
+    assert outputs[0] == ""
+    assert "exa" not in "".join(outputs) + tail
+    assert outputs[1] == "Read the guide today. "
+
+
+def test_stream_flushes_text_held_by_an_unclosed_parenthesis():
+    sentence = "This sentence keeps going (an aside that never closes. "
+    chunks = [sentence] * 12
+    outputs, _ = stream(chunks)
+    spoken_at = next(i for i, out in enumerate(outputs) if out)
+    # Released once the hold cap is reached, not at the end of the stream
+    assert len(sentence) * (spoken_at + 1) >= main.SPEECH_STREAM_MAX_OPEN_HOLD
+    assert spoken_at < len(chunks) - 1
+
+
+def test_stream_drops_everything_after_sources():
+    outputs, tail = stream(["Paris is the capital.\n", "Sources:\n", "- Wiki: https://w.org\n"])
+    assert "".join(outputs) + tail == "Paris is the capital. "
+
+
+def test_stream_skips_code_fences_across_chunks():
+    outputs, tail = stream(["Run this.\n```", "\nrm -rf build\n", "```\nThen rebuild.\n"])
+    spoken = "".join(outputs) + tail
+    assert "rm" not in spoken
+    assert "Run this." in spoken and "Then rebuild." in spoken